@@ -1,3 +1,5 @@
+// API_URL and API_HEADERS come from config.js, loaded first by each page
+
 // =====================================================
 // AUTHENTICATION FUNCTIONALITY
 // =====================================================
@@ -135,14 +137,11 @@ async function handleLogin(e) {
         formData.append('username', email);
         formData.append('password', password);
         
-        // Check if backend is available - use ngrok URL for public access
-        const API_URL = 'https://unsinuous-mercedes-pseudopolitic.ngrok-free.dev';
-        
         try {
             const response = await fetch(`${API_URL}/login`, {
                 method: 'POST',
                 body: formData,
-                headers: { 'ngrok-skip-browser-warning': 'true' },
+                headers: API_HEADERS,
                 signal: AbortSignal.timeout(3000) // 3 second timeout
             });
             
@@ -289,9 +288,6 @@ async function handleSignup(e) {
         const username = email.split('@')[0].toLowerCase();
         const fullName = `${firstName.trim()} ${lastName.trim()}`;
         
-        // Check if backend is available - use ngrok URL for public access
-        const API_URL = 'https://unsinuous-mercedes-pseudopolitic.ngrok-free.dev';
-        
         try {
             // API call to register endpoint
             const formData = new FormData();
@@ -303,7 +299,7 @@ async function handleSignup(e) {
             const response = await fetch(`${API_URL}/register`, {
                 method: 'POST',
                 body: formData,
-                headers: { 'ngrok-skip-browser-warning': 'true' },
+                headers: API_HEADERS,
                 signal: AbortSignal.timeout(3000)
             });
             
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Frontend asset build: minify, bundle scripts, extract shared CSS, fingerprint, rewrite HTML
+Run: python build_assets.py [--out dist] [--json]
+Then serve the result with: python serve.py 5500 --dist
+
+Every page's stylesheet and script is minified and written under
+dist/assets/ as name.<hash>.ext (so serve.py can cache it for a year), with
+.gz/.br siblings. Adjacent scripts loaded the same way (config.js and the
+page's script) become one bundle. CSS rules that several page stylesheets
+repeat verbatim go into one shared stylesheet when moving them ahead of the
+page rules cannot change the cascade, and only for stylesheets whose
+page-only remainder is then small enough to inline, so no page gains a
+request. The build fails if a page ends up with more requests than before.
+"""
+import argparse
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PAGES = ["index.html", "img2img.html", "img2text.html", "login.html", "signup.html"]
+
+HASH_LENGTH = 10
+INLINE_CSS_LIMIT = 2048
+
+# Local stylesheet/script references (no scheme, so CDN links are left alone)
+ASSET_REF_RE = re.compile(r'(<(?:link|script)\b[^>]*?\b(?:href|src)=")([^":?#]+\.(?:css|js))(")', re.I)
+# A local external script with no inline body; groups 1 and 3 are its other attributes
+SCRIPT_TAG_RE = re.compile(r'<script\b([^>]*?)\bsrc="([^":?#]+\.js)"([^>]*)>\s*</script>', re.I)
+
+
+# =====================================================
+# MINIFIERS
+# =====================================================
+
+def minify_css(css):
+    """Strip comments and insignificant whitespace from CSS"""
+    out = []
+    i, n = 0, len(css)
+    # Stack of open blocks: True for declaration blocks, False for at-rule blocks
+    blocks = []
+    header_start = 0  # index into out where the current selector/at-rule prelude begins
+    while i < n:
+        c = css[i]
+        if c == "/" and css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        if c in "\"'":
+            end = i + 1
+            while end < n and css[end] != c:
+                end += 2 if css[end] == "\\" else 1
+            out.append(css[i:end + 1])
+            i = end + 1
+            continue
+        if c.isspace():
+            while i < n and css[i].isspace():
+                i += 1
+            prev = out[-1][-1:] if out else ""
+            nxt = css[i:i + 1]
+            in_decls = bool(blocks) and blocks[-1]
+            if prev and nxt and prev not in "{};," and nxt not in "{};,!" and not (in_decls and (prev == ":" or nxt == ":")):
+                out.append(" ")
+            continue
+        if c == "{":
+            header = "".join(out[header_start:]).strip()
+            blocks.append(not header.startswith("@") or header.startswith(("@font-face", "@page")))
+        elif c == "}":
+            if out and out[-1] == ";":
+                out.pop()
+            if blocks:
+                blocks.pop()
+        if c in "{};,":
+            if out and out[-1] == " ":
+                out.pop()
+        out.append(c)
+        if c in "{};":
+            header_start = len(out)
+        i += 1
+    return "".join(out).strip()
+
+
+def minify_js(js):
+    """Strip comments and indentation from JS, keeping line breaks for ASI"""
+    out = []
+    i, n = 0, len(js)
+    while i < n:
+        c = js[i]
+        if c in "\"'`":
+            end = i + 1
+            while end < n and js[end] != c:
+                end += 2 if js[end] == "\\" else 1
+            out.append(js[i:end + 1])
+            i = end + 1
+            continue
+        if c == "/" and js.startswith("//", i):
+            end = js.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if c == "/" and js.startswith("/*", i):
+            end = js.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        if c == "/":
+            tail = "".join(out[-12:]).rstrip()
+            prev = tail[-1:]
+            if not prev or prev in "(,=:[!&|?{};+-*%<>~^" or re.search(r"\b(return|typeof|case)$", tail):
+                # Regex literal: copy through the closing slash
+                end, in_class = i + 1, False
+                while end < n and (js[end] != "/" or in_class):
+                    if js[end] == "\\":
+                        end += 1
+                    elif js[end] == "[":
+                        in_class = True
+                    elif js[end] == "]":
+                        in_class = False
+                    end += 1
+                out.append(js[i:end + 1])
+                i = end + 1
+                continue
+        out.append(c)
+        i += 1
+    lines = (line.strip() for line in "".join(out).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+# =====================================================
+# SHARED CSS EXTRACTION
+# =====================================================
+
+def split_rules(css):
+    """Split minified CSS into top-level rules / at-rule blocks"""
+    rules, depth, start, quote = [], 0, 0, None
+    for i, c in enumerate(css):
+        if quote:
+            if c == quote and css[i - 1] != "\\":
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                rules.append(css[start:i + 1])
+                start = i + 1
+        elif c == ";" and depth == 0:
+            rules.append(css[start:i + 1])
+            start = i + 1
+    if css[start:].strip():
+        rules.append(css[start:])
+    return rules
+
+
+def rule_properties(rule):
+    """Names a rule can set, used to decide whether two rules can interact"""
+    if rule.startswith("@keyframes") or rule.startswith("@-webkit-keyframes"):
+        return {"@keyframes " + rule.split("{", 1)[0].split()[-1]}
+    if rule.startswith("@font-face"):
+        return {"@font-face"}
+    return set(re.findall(r"[{;]\s*(-?-?[a-zA-Z][\w-]*)\s*:", rule))
+
+
+def properties_overlap(a, b):
+    for x in a:
+        for y in b:
+            # "border" also covers "border-top-color" and vice versa
+            if x == y or (not x.startswith("--") and (x.startswith(y + "-") or y.startswith(x + "-"))):
+                return True
+    return False
+
+
+def safe_shared_rules(sheets, candidates):
+    """
+    Drop candidates whose move to an earlier shared sheet could change the cascade:
+    a page rule left behind before it, or another shared rule in a different order,
+    must not set any of the same properties
+    """
+    props = {}
+    shared = set(candidates)
+    changed = True
+    while changed:
+        changed = False
+        order = [r for r in dict.fromkeys(itertools.chain(*sheets)) if r in shared]
+        position = {r: i for i, r in enumerate(order)}
+        for rules in sheets:
+            for i, rule in enumerate(rules):
+                if rule not in shared:
+                    continue
+                props.setdefault(rule, rule_properties(rule))
+                for earlier in rules[:i]:
+                    props.setdefault(earlier, rule_properties(earlier))
+                    moved_past = earlier not in shared or position[earlier] > position[rule]
+                    if moved_past and properties_overlap(props[rule], props[earlier]):
+                        shared.discard(rule)
+                        changed = True
+                        break
+    return [r for r in dict.fromkeys(itertools.chain(*sheets)) if r in shared]
+
+
+def adds_requests(rules, shared):
+    """
+    Whether moving shared out of a stylesheet adds a request to its pages:
+    it does unless the sheet was a request of its own and what remains is inlined
+    """
+    shared = set(shared)
+    remainder = sum(len(r) for r in rules if r not in shared)
+    return sum(len(r) for r in rules) <= INLINE_CSS_LIMIT or remainder > INLINE_CSS_LIMIT
+
+
+def extract_shared(sheets):
+    """
+    Pick the group of stylesheets whose common rules save the most bytes without adding requests
+    Returns: (group of sheet names, shared rules in order)
+    """
+    best = ((), [], 0)
+    names = sorted(sheets)
+    for size in range(2, len(names) + 1):
+        for group in itertools.combinations(names, size):
+            common = set(sheets[group[0]]).intersection(*(sheets[g] for g in group[1:]))
+            shared = safe_shared_rules([sheets[g] for g in group], common)
+            if not shared or any(adds_requests(sheets[g], shared) for g in group):
+                continue
+            saved = sum(len(r) for r in shared) * (len(group) - 1)
+            if saved > best[2]:
+                best = (group, shared, saved)
+    return best[0], best[1]
+
+
+# =====================================================
+# BUILD
+# =====================================================
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def fingerprint(name, content):
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:HASH_LENGTH]
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest}{ext}"
+
+
+def write_asset(out_dir, name, content):
+    """Write an asset with precompressed siblings; returns its path relative to out_dir"""
+    rel = f"assets/{name}"
+    path = os.path.join(out_dir, rel)
+    data = content.encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(data)
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, 9))
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+    return rel
+
+
+def gzip_size(text):
+    return len(gzip.compress(text.encode("utf-8"), 9))
+
+
+def page_assets(html):
+    return [m.group(2) for m in ASSET_REF_RE.finditer(html)]
+
+
+def bundle_scripts(html):
+    """
+    Replace each run of adjacent scripts loaded the same way with one script
+    named after its parts ("config+control.js"). Returns (html, {bundle: [parts]}).
+    """
+    runs, run = [], []
+    for match in SCRIPT_TAG_RE.finditer(html):
+        if run and (html[run[-1].end():match.start()].strip()
+                    or (match.group(1), match.group(3)) != (run[-1].group(1), run[-1].group(3))):
+            runs.append(run)
+            run = []
+        run.append(match)
+    runs.append(run)
+
+    bundles = {}
+    for run in reversed([r for r in runs if len(r) > 1]):
+        parts = [m.group(2) for m in run]
+        name = "+".join(os.path.splitext(p)[0] for p in parts) + ".js"
+        bundles[name] = parts
+        first = run[0]
+        tag = f'<script{first.group(1)}src="{name}"{first.group(3)}></script>'
+        html = html[:first.start()] + tag + html[run[-1].end():]
+    return html, bundles
+
+
+def check_requests(report):
+    """Pages whose build needs more requests than the source did"""
+    return [page for page, row in report.items()
+            if not page.startswith("_") and row["requests_after"] > row["requests_before"]]
+
+
+def build(root=ROOT, out_dir=None):
+    """Build the frontend into out_dir and return a per-page report"""
+    out_dir = out_dir or os.path.join(root, "dist")
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(os.path.join(out_dir, "assets"))
+
+    pages = {page: read(os.path.join(root, page)) for page in PAGES if os.path.exists(os.path.join(root, page))}
+    sources = {name: read(os.path.join(root, name)) for html in pages.values() for name in page_assets(html)}
+
+    minified = {}
+    for name, text in sources.items():
+        minified[name] = minify_css(text) if name.endswith(".css") else minify_js(text)
+
+    bundled = {}
+    for page, html in pages.items():
+        bundled[page], bundles = bundle_scripts(html)
+        for name, parts in bundles.items():
+            # Separate statements even if a part ends without a semicolon
+            minified[name] = ";\n".join(minified[p] for p in parts)
+
+    sheets = {name: split_rules(text) for name, text in minified.items() if name.endswith(".css")}
+    group, shared_rules = extract_shared(sheets)
+    shared_set = set(shared_rules)
+
+    outputs = {}
+    by_href = {}
+    shared_href = None
+    if shared_rules:
+        shared_css = "".join(shared_rules)
+        shared_href = write_asset(out_dir, fingerprint("shared.css", shared_css), shared_css)
+        by_href[shared_href] = shared_css
+    for name, text in minified.items():
+        if name in group:
+            text = "".join(r for r in sheets[name] if r not in shared_set)
+        outputs[name] = text
+
+    hrefs = {}
+    for name, text in outputs.items():
+        if name.endswith(".css") and len(text) <= INLINE_CSS_LIMIT:
+            continue
+        hrefs[name] = write_asset(out_dir, fingerprint(name, text), text)
+        by_href[hrefs[name]] = text
+
+    report = {}
+    for page, html in pages.items():
+        def rewrite(match):
+            name = match.group(2)
+            if name not in outputs:
+                return match.group(0)
+            tag = ""
+            if name in group and shared_href:
+                tag = f'<link rel="stylesheet" href="{shared_href}">'
+                if name not in hrefs:
+                    return tag + (f"<style>{outputs[name]}</style>" if outputs[name] else "")
+                return tag + match.group(1) + hrefs[name] + match.group(3)
+            if name not in hrefs:
+                return f"<style>{outputs[name]}</style>"
+            return match.group(1) + hrefs[name] + match.group(3)
+
+        built = ASSET_REF_RE.sub(rewrite, bundled[page])
+        with open(os.path.join(out_dir, page), "w", encoding="utf-8") as f:
+            f.write(built)
+
+        before = [html] + [sources[n] for n in page_assets(html)]
+        after = [built] + [by_href[h] for h in page_assets(built)]
+        report[page] = {
+            "requests_before": len(page_assets(html)),
+            "requests_after": len(page_assets(built)),
+            "bytes_before": sum(len(t.encode("utf-8")) for t in before),
+            "bytes_after": sum(len(t.encode("utf-8")) for t in after),
+            "gzip_before": sum(gzip_size(t) for t in before),
+            "gzip_after": sum(gzip_size(t) for t in after),
+        }
+    report["_shared"] = {
+        "stylesheets": list(group),
+        "rules": len(shared_rules),
+        "bytes": len(by_href.get(shared_href, "")),
+    }
+    return report
+
+
+def print_report(report):
+    print(f"{'page':<16}{'requests':>10}{'bytes':>20}{'gzip':>18}")
+    for page, row in report.items():
+        if page.startswith("_"):
+            continue
+        print(f"{page:<16}{row['requests_before']:>4} -> {row['requests_after']:<3}"
+              f"{row['bytes_before']:>9} -> {row['bytes_after']:<8}"
+              f"{row['gzip_before']:>7} -> {row['gzip_after']:<7}")
+    shared = report["_shared"]
+    print(f"shared.css: {shared['rules']} rules, {shared['bytes']} bytes, used by {', '.join(shared['stylesheets']) or 'none'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build fingerprinted, minified frontend assets")
+    parser.add_argument("--out", default=os.path.join(ROOT, "dist"))
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    result = build(out_dir=args.out)
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(result)
+    worse = check_requests(result)
+    if worse:
+        sys.exit(f"error: the build adds requests to {', '.join(worse)}")
@@ -0,0 +1,7 @@
+// Shared by every page; load it before the page's own script.
+// API base URL: same origin when the API also serves the pages (SERVE_FRONTEND),
+// the local API when opened via serve.py or file://, or window.API_URL if set.
+const API_URL = window.API_URL !== undefined ? window.API_URL
+    : (location.protocol === 'file:' || location.port === '5500') ? 'http://127.0.0.1:8000' : '';
+// Custom headers force a CORS preflight, so only send ngrok's when going through ngrok
+const API_HEADERS = API_URL.includes('ngrok') ? { 'ngrok-skip-browser-warning': 'true' } : {};
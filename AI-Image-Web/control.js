@@ -1,3 +1,5 @@
+// API_URL and API_HEADERS come from config.js, loaded first by each page
+
 document.getElementById("generate").addEventListener("click", async () => {
     const prompt = document.getElementById("prompt").value;
     const negative = document.getElementById("negative_prompt").value;
@@ -28,9 +30,6 @@ document.getElementById("generate").addEventListener("click", async () => {
 
     toggleLoader(true);
 
-    // Use ngrok URL when available, otherwise localhost
-    const API_URL = 'https://unsinuous-mercedes-pseudopolitic.ngrok-free.dev';
-
     const formData = new FormData();
     formData.append("prompt", prompt);
     formData.append("negative_prompt", negative);
@@ -66,10 +65,7 @@ document.getElementById("generate").addEventListener("click", async () => {
         const res = await fetch(`${API_URL}/generate`, {
             method: "POST",
             body: formData,
-            headers: {
-                "ngrok-skip-browser-warning": "true",
-                "User-Agent": "AI-Image-Generator"
-            }
+            headers: API_HEADERS
         });
 
         // Check if response is HTML (ngrok warning page)
@@ -79,7 +75,9 @@ document.getElementById("generate").addEventListener("click", async () => {
         }
 
         if (!res.ok) {
-            throw new Error(`Server error: ${res.status} ${res.statusText}`);
+            // Errors come back as JSON {"error": ...} with a matching status code
+            const body = await res.json().catch(() => ({}));
+            throw new Error(body.error || `Server error: ${res.status} ${res.statusText}`);
         }
 
         const data = await res.json();
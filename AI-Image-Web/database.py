@@ -10,7 +10,9 @@ from datetime import datetime, timedelta
 from typing import Optional, Tuple
 import json
 
-DATABASE_PATH = os.path.join(os.path.dirname(__file__), "users.db")
+from metrics import DB_SECONDS, timed
+
+DATABASE_PATH = os.environ.get("DATABASE_PATH", os.path.join(os.path.dirname(__file__), "users.db"))
 
 
 def get_db_connection():
@@ -49,6 +51,7 @@ def generate_session_token() -> str:
     return secrets.token_urlsafe(32)
 
 
+@timed(DB_SECONDS, "register_user")
 def register_user(username: str, email: str, password: str, full_name: str = None) -> Tuple[bool, str]:
     """
     Register a new user
@@ -81,6 +84,7 @@ def register_user(username: str, email: str, password: str, full_name: str = Non
         return False, f"Registration failed: {str(e)}"
 
 
+@timed(DB_SECONDS, "login_user")
 def login_user(username_or_email: str, password: str, ip_address: str = None, user_agent: str = None) -> Tuple[bool, str, Optional[dict]]:
     """
     Login a user and create a session
@@ -139,6 +143,7 @@ def login_user(username_or_email: str, password: str, ip_address: str = None, us
         return False, f"Login failed: {str(e)}", None
 
 
+@timed(DB_SECONDS, "verify_session")
 def verify_session(session_token: str) -> Tuple[bool, Optional[dict]]:
     """
     Verify if a session token is valid
@@ -175,6 +180,7 @@ def verify_session(session_token: str) -> Tuple[bool, Optional[dict]]:
         return False, None
 
 
+@timed(DB_SECONDS, "logout_user")
 def logout_user(session_token: str) -> bool:
     """
     Logout a user by deleting their session
@@ -192,6 +198,7 @@ def logout_user(session_token: str) -> bool:
         return False
 
 
+@timed(DB_SECONDS, "save_generated_image")
 def save_generated_image(user_id: int, image_path: str, prompt: str, negative_prompt: str = "", 
                         mode: str = "txt2img", parameters: dict = None):
     """Save a record of a generated image"""
@@ -215,6 +222,7 @@ def save_generated_image(user_id: int, image_path: str, prompt: str, negative_pr
         return False
 
 
+@timed(DB_SECONDS, "get_user_images")
 def get_user_images(user_id: int, limit: int = 50):
     """Get a user's generated images"""
     try:
@@ -238,6 +246,95 @@ def get_user_images(user_id: int, limit: int = 50):
         return []
 
 
-# Initialize database on module import
-if not os.path.exists(DATABASE_PATH):
+def ensure_usage_table(conn):
+    """Create the usage_counters table on databases created before it existed"""
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS usage_counters (
+               user_key VARCHAR(100) PRIMARY KEY,
+               request_tokens REAL NOT NULL,
+               gpu_tokens REAL NOT NULL,
+               updated_at REAL NOT NULL
+           )"""
+    )
+
+
+@timed(DB_SECONDS, "take_usage_tokens")
+def take_usage_tokens(user_key: str, buckets, now: float) -> Optional[float]:
+    """
+    Take tokens from a caller's rate-limit and GPU quota buckets, in one statement
+    buckets: (request, gpu) tuples of (amount, capacity, refill per second)
+    Every worker process shares these rows, so the check and the decrement
+    happen together. Returns 0.0 when charged, else the seconds until the
+    tokens are available; None if the database fails.
+    """
+    (req, req_cap, req_rate), (gpu, gpu_cap, gpu_rate) = buckets
+    params = {"key": user_key, "now": now, "req": req, "req_cap": req_cap, "req_rate": req_rate,
+              "gpu": gpu, "gpu_cap": gpu_cap, "gpu_rate": gpu_rate}
+    refilled_req = "MIN(:req_cap, request_tokens + MAX(0, :now - updated_at) * :req_rate)"
+    refilled_gpu = "MIN(:gpu_cap, gpu_tokens + MAX(0, :now - updated_at) * :gpu_rate)"
+    try:
+        conn = get_db_connection()
+        ensure_usage_table(conn)
+        with conn:
+            conn.execute(
+                """INSERT OR IGNORE INTO usage_counters (user_key, request_tokens, gpu_tokens, updated_at)
+                   VALUES (:key, :req_cap, :gpu_cap, :now)""",
+                params
+            )
+            cursor = conn.execute(
+                f"""UPDATE usage_counters SET
+                        request_tokens = {refilled_req} - :req,
+                        gpu_tokens = {refilled_gpu} - :gpu,
+                        updated_at = MAX(updated_at, :now)
+                    WHERE user_key = :key AND {refilled_req} >= :req AND {refilled_gpu} >= :gpu""",
+                params
+            )
+            if cursor.rowcount:
+                retry_after = 0.0
+            else:
+                row = conn.execute(
+                    f"SELECT {refilled_req} AS req_tokens, {refilled_gpu} AS gpu_tokens "
+                    "FROM usage_counters WHERE user_key = :key",
+                    params
+                ).fetchone()
+                retry_after = max(_refill_wait(req, row["req_tokens"], req_rate),
+                                  _refill_wait(gpu, row["gpu_tokens"], gpu_rate))
+        conn.close()
+        return retry_after
+    except Exception as e:
+        print(f"Failed to take usage tokens: {e}")
+        return None
+
+
+def _refill_wait(amount: float, tokens: float, rate: float) -> float:
+    if tokens >= amount:
+        return 0.0
+    return (amount - tokens) / rate if rate > 0 else float("inf")
+
+
+@timed(DB_SECONDS, "return_usage_tokens")
+def return_usage_tokens(user_key: str, buckets) -> bool:
+    """
+    Give back tokens taken by take_usage_tokens, up to each bucket's capacity
+    buckets: (request, gpu) tuples of (amount, capacity)
+    """
+    (req, req_cap), (gpu, gpu_cap) = buckets
+    try:
+        conn = get_db_connection()
+        with conn:
+            conn.execute(
+                """UPDATE usage_counters SET
+                       request_tokens = MIN(?, request_tokens + ?),
+                       gpu_tokens = MIN(?, gpu_tokens + ?)
+                   WHERE user_key = ?""",
+                (req_cap, req, gpu_cap, gpu, user_key)
+            )
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"Failed to return usage tokens: {e}")
+        return False
+
+
+if __name__ == "__main__":
     init_database()
@@ -0,0 +1,27 @@
+"""
+Shared image generation / captioning engine
+api.py, api_cloud.py and api_flask.py are thin adapters around it
+(engine.fastapi_app / engine.flask_app); the backend is picked with
+ENGINE_BACKEND=webui|replicate|diffusers.
+Names below are imported on first use, so importing one submodule (e.g.
+engine.auth for an auth-only app) doesn't load the backends and httpx.
+"""
+import importlib
+
+# name -> submodule it comes from
+_EXPORTS = {
+    "EngineError": "core", "GenerationRequest": "core", "GenerationResult": "core", "DecodingOptions": "core",
+    "admit": "core",
+    "save_images": "core",
+    "Backend": "backends", "WebUIBackend": "backends", "ReplicateBackend": "backends", "BACKENDS": "backends",
+    "get_backend": "backends", "register_backend": "backends",
+    "run_sync": "sync",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
@@ -0,0 +1,405 @@
+"""
+Model artifacts: weights converted once to safetensors, memory-mapped at load
+from_pretrained resolves configs and deserialises every weight into fresh
+memory on every process start. The first load of a model here still does
+that, then writes each weight-carrying component to MODEL_CACHE_DIR as one
+safetensors file (parameters and buffers, tied weights once) with its config
+and a manifest of SHA-256 checksums. Later loads build the modules on the
+meta device and point their tensors into a copy-on-write mmap of the files:
+nothing is copied, and worker processes loading the same model share its
+pages through the page cache. A Hub model's artifact is keyed by the commit
+the local Hub cache has for it, so loading one makes no network request;
+the Hub is asked only when that artifact is missing or unusable, and a new
+commit there builds a new one. MODEL_ARTIFACTS=false loads as before.
+Run: python -m engine.artifacts list|verify|clear
+"""
+import hashlib
+import importlib
+import itertools
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock; concurrent first loads each convert, the last one wins
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MODEL_ARTIFACTS = os.environ.get("MODEL_ARTIFACTS", "true").lower() not in ("0", "false", "no")
+MODEL_CACHE_DIR = os.environ.get("MODEL_CACHE_DIR",
+                                 os.path.join(os.path.expanduser("~"), ".cache", "ai-image-web", "models"))
+# changed: re-hash a file only when its size or mtime differ from the manifest; always: on every load
+ARTIFACT_VERIFY = os.environ.get("ARTIFACT_VERIFY", "changed").lower()
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+
+_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+class ArtifactError(Exception):
+    """An artifact that is missing, corrupt or can't be loaded; it gets rebuilt"""
+
+
+def local_revision(repo_id: str, revision: str = "main") -> str:
+    """Commit the local Hub cache has for a Hub id's revision (no network); "" if none"""
+    from huggingface_hub import constants
+
+    ref = os.path.join(constants.HF_HUB_CACHE, f"models--{repo_id.replace('/', '--')}", "refs", revision)
+    try:
+        with open(ref, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def hub_revision(repo_id: str, revision: str = "main") -> str:
+    """
+    Commit a Hub id's revision points at now, asked of the Hub; the local cache's
+    when offline or the Hub can't be reached, "" if neither knows
+    """
+    from huggingface_hub import HfApi, constants
+
+    if not constants.HF_HUB_OFFLINE:
+        try:
+            return HfApi().model_info(repo_id, revision=revision, timeout=10).sha or ""
+        except Exception as e:
+            logger.warning(f"Could not resolve {repo_id}@{revision} on the Hub ({e}); using the local cache")
+    return local_revision(repo_id, revision)
+
+
+def artifact_key(source: str, variant: str = "", revision: str = "") -> str:
+    """
+    Cache directory name for a Hub id or local directory, and a variant (e.g. the dtype)
+    revision, the Hub commit, keeps an artifact from outliving an update of the model.
+    """
+    fingerprint = f"{source}@{revision}" if revision else source
+    if os.path.isdir(source):
+        # A local model is rebuilt when any of its files change
+        stats = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                st = os.stat(os.path.join(root, name))
+                stats.append(f"{os.path.relpath(os.path.join(root, name), source)}:{st.st_size}:{st.st_mtime_ns}")
+        fingerprint = "\n".join([os.path.abspath(source)] + sorted(stats))
+        source = os.path.basename(os.path.normpath(source))
+    digest = hashlib.sha256(f"{fingerprint}\n{variant}".encode("utf-8")).hexdigest()[:16]
+    return f"{re.sub(r'[^A-Za-z0-9._-]+', '--', source)}-{digest}"
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 23), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _class_path(obj) -> str:
+    return f"{type(obj).__module__}.{type(obj).__qualname__}"
+
+
+def _import_class(path: str):
+    module, _, name = path.rpartition(".")
+    return getattr(importlib.import_module(module), name)
+
+
+# -------------------------------------------------
+# Writing
+# -------------------------------------------------
+
+def _module_tensors(module):
+    """Every parameter and buffer by name (tied ones once) and the names that alias them"""
+    tensors, aliases, seen, storages = {}, {}, {}, set()
+    named = itertools.chain(module.named_parameters(remove_duplicate=False),
+                            module.named_buffers(remove_duplicate=False))
+    for name, tensor in named:
+        if id(tensor) in seen:
+            aliases[name] = seen[id(tensor)]
+            continue
+        seen[id(tensor)] = name
+        tensor = tensor.detach().cpu().contiguous()
+        # safetensors refuses distinct tensors over one storage (views)
+        if tensor.numel() and tensor.untyped_storage().data_ptr() in storages:
+            tensor = tensor.clone()
+        storages.add(tensor.untyped_storage().data_ptr())
+        tensors[name] = tensor
+    return tensors, aliases
+
+
+def _save_component(name, component, directory) -> dict:
+    import torch
+    from safetensors.torch import save_file
+
+    if component is None:
+        return {"type": "none"}
+    if not isinstance(component, torch.nn.Module):
+        component.save_pretrained(os.path.join(directory, name))
+        return {"type": "pretrained", "class": _class_path(component)}
+
+    config_dir = os.path.join(directory, name)
+    if hasattr(component, "save_config"):  # diffusers
+        component.save_config(config_dir)
+    else:  # transformers
+        component.config.save_pretrained(config_dir)
+        if getattr(component, "generation_config", None) is not None:
+            component.generation_config.save_pretrained(config_dir)
+    tensors, aliases = _module_tensors(component)
+    save_file(tensors, os.path.join(directory, f"{name}.safetensors"), metadata={"format": "pt"})
+    return {"type": "module", "class": _class_path(component), "file": f"{name}.safetensors", "aliases": aliases}
+
+
+def save_artifact(components: Dict[str, object], directory: str, source: str = "", variant: str = "",
+                  revision: str = ""):
+    """Write components (nn.Modules, save_pretrained-able objects or None) as an artifact, atomically"""
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=os.path.dirname(directory))
+    try:
+        manifest = {"format": FORMAT_VERSION, "source": source, "variant": variant, "revision": revision,
+                    "created": time.time(), "components": {}, "files": {}}
+        for name, component in components.items():
+            entry = _save_component(name, component, staging)
+            manifest["components"][name] = entry
+            if "file" in entry:
+                path = os.path.join(staging, entry["file"])
+                manifest["files"][entry["file"]] = {"sha256": sha256_file(path), "size": os.path.getsize(path)}
+        # mtimes as they'll be after the rename, which keeps them
+        for file_name, info in manifest["files"].items():
+            info["mtime_ns"] = os.stat(os.path.join(staging, file_name)).st_mtime_ns
+        with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(staging, directory)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+# -------------------------------------------------
+# Loading
+# -------------------------------------------------
+
+def read_manifest(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f"unreadable manifest: {e}")
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ArtifactError(f"format {manifest.get('format')}, expected {FORMAT_VERSION}")
+    return manifest
+
+
+def verify(directory: str, manifest: dict, full: bool = False):
+    """Check every file against the manifest; re-hashes those whose size or mtime changed (all if full)"""
+    for file_name, info in manifest["files"].items():
+        path = os.path.join(directory, file_name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            raise ArtifactError(f"{file_name} is missing")
+        if st.st_size != info["size"]:
+            raise ArtifactError(f"{file_name} is {st.st_size} bytes, expected {info['size']}")
+        if full or st.st_mtime_ns != info["mtime_ns"]:
+            if sha256_file(path) != info["sha256"]:
+                raise ArtifactError(f"{file_name} does not match its checksum")
+
+
+def mmap_safetensors(path: str) -> dict:
+    """Tensors of a safetensors file backed by a copy-on-write mmap of it (no copy)"""
+    import torch
+
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    header_size = struct.unpack("<Q", mapped[:8])[0]
+    header = json.loads(mapped[8:8 + header_size])
+    header.pop("__metadata__", None)
+    tensors = {}
+    for name, info in header.items():
+        dtype = getattr(torch, _DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        offset = 8 + header_size + start
+        count = (end - start) // dtype.itemsize
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+        elif offset % dtype.itemsize:
+            # Misaligned (not written by save_artifact): copy this one
+            tensors[name] = torch.frombuffer(bytearray(mapped[offset:8 + header_size + end]), dtype=dtype
+                                             ).reshape(info["shape"])
+        else:
+            tensors[name] = torch.frombuffer(mapped, dtype=dtype, count=count, offset=offset).reshape(info["shape"])
+    return tensors
+
+
+def _load_module(entry: dict, config_dir: str, path: str):
+    import torch
+
+    cls = _import_class(entry["class"])
+    with torch.device("meta"):
+        if hasattr(cls, "load_config"):  # diffusers
+            module = cls.from_config(cls.load_config(config_dir))
+        else:  # transformers
+            module = cls(cls.config_class.from_pretrained(config_dir))
+    if os.path.exists(os.path.join(config_dir, "generation_config.json")):
+        from transformers import GenerationConfig
+
+        module.generation_config = GenerationConfig.from_pretrained(config_dir)
+
+    tensors = mmap_safetensors(path)
+    for name, tensor in itertools.chain(tensors.items(), entry["aliases"].items()):
+        owner_name, _, leaf = name.rpartition(".")
+        owner = module.get_submodule(owner_name)
+        if isinstance(tensor, str):  # an alias: the very same object as its target
+            target_owner, _, target_leaf = tensor.rpartition(".")
+            target = module.get_submodule(target_owner)
+            tensor = target._parameters.get(target_leaf, target._buffers.get(target_leaf))
+        if leaf in owner._parameters:
+            owner._parameters[leaf] = (tensor if isinstance(tensor, torch.nn.Parameter)
+                                       else torch.nn.Parameter(tensor, requires_grad=False))
+        elif leaf in owner._buffers:
+            owner._buffers[leaf] = tensor
+        else:
+            raise ArtifactError(f"{entry['file']}: {name} is not a parameter or buffer of {entry['class']}")
+    missing = [name for name, t in itertools.chain(module.named_parameters(), module.named_buffers()) if t.is_meta]
+    if missing:
+        raise ArtifactError(f"{entry['file']} lacks {', '.join(missing[:5])}")
+    return module.eval()
+
+
+def load_artifact(directory: str) -> Dict[str, object]:
+    """The components saved in directory, weights memory-mapped. Raises FileNotFoundError or ArtifactError."""
+    manifest = read_manifest(directory)
+    verify(directory, manifest, full=ARTIFACT_VERIFY == "always")
+    components = {}
+    for name, entry in manifest["components"].items():
+        try:
+            if entry["type"] == "none":
+                components[name] = None
+            elif entry["type"] == "pretrained":
+                components[name] = _import_class(entry["class"]).from_pretrained(os.path.join(directory, name))
+            else:
+                components[name] = _load_module(entry, os.path.join(directory, name),
+                                                os.path.join(directory, entry["file"]))
+        except ArtifactError:
+            raise
+        except Exception as e:
+            raise ArtifactError(f"{name}: {e}")
+    return components
+
+
+@contextmanager
+def _locked(directory: str):
+    """One process converts a model; the others wait for it and then map its files"""
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    with open(directory + ".lock", "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_components(source: str, variant: str, load_original: Callable[[], Dict[str, object]]) -> Dict[str, object]:
+    """
+    The components load_original() returns (e.g. a pipeline's .components),
+    from the artifact cache; converted from load_original() the first time
+    """
+    if not MODEL_ARTIFACTS:
+        return load_original()
+    # The commit already in the local Hub cache: a cold start with a built artifact makes no request
+    on_hub = not os.path.isdir(source)
+    local = local_revision(source) if on_hub else ""
+    revision = local or (hub_revision(source) if on_hub else "")
+    directory = os.path.join(MODEL_CACHE_DIR, artifact_key(source, variant, revision))
+    try:
+        return load_artifact(directory)
+    except FileNotFoundError:
+        pass
+    except ArtifactError as e:
+        logger.warning(f"Model artifact {directory} is unusable ({e}); rebuilding it")
+
+    if local:
+        # About to convert anyway: build from what the Hub serves now
+        latest = hub_revision(source)
+        if latest and latest != revision:
+            revision = latest
+            directory = os.path.join(MODEL_CACHE_DIR, artifact_key(source, variant, revision))
+            try:
+                return load_artifact(directory)
+            except (FileNotFoundError, ArtifactError):
+                pass
+
+    with _locked(directory):
+        try:
+            # Built by another worker while this one waited
+            return load_artifact(directory)
+        except (FileNotFoundError, ArtifactError):
+            pass
+        components = load_original()
+        logger.info(f"Converting {source} to a model artifact in {directory}...")
+        try:
+            save_artifact(components, directory, source, variant, revision)
+        except Exception as e:
+            logger.warning(f"Could not write model artifact {directory}: {e}")
+            return components
+    # Map the files just written, so this process shares pages with the next ones
+    del components
+    return load_artifact(directory)
+
+
+# -------------------------------------------------
+# Command line
+# -------------------------------------------------
+
+def _artifacts():
+    if not os.path.isdir(MODEL_CACHE_DIR):
+        return
+    for name in sorted(os.listdir(MODEL_CACHE_DIR)):
+        directory = os.path.join(MODEL_CACHE_DIR, name)
+        if os.path.isdir(directory) and not name.startswith("."):
+            yield directory
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["list", "verify", "clear"],
+                        help="list artifacts, re-hash every file, or delete them all")
+    args = parser.parse_args()
+
+    failed = False
+    for directory in _artifacts():
+        if args.command == "clear":
+            shutil.rmtree(directory)
+            print(f"removed {directory}")
+            continue
+        try:
+            manifest = read_manifest(directory)
+            if args.command == "verify":
+                verify(directory, manifest, full=True)
+            size = sum(info["size"] for info in manifest["files"].values())
+            revision = manifest.get("revision", "")[:12]
+            print(f"{os.path.basename(directory)}  {manifest['source']}{'@' + revision if revision else ''}  "
+                  f"{manifest['variant']}  {size / 2 ** 20:.1f} MiB  ok")
+        except (OSError, ArtifactError) as e:
+            failed = True
+            print(f"{os.path.basename(directory)}  {e}")
+    raise SystemExit(1 if failed else 0)
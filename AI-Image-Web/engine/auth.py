@@ -0,0 +1,107 @@
+"""
+Account and session handlers shared by the FastAPI and Flask adapters
+Each returns (status_code, body) for the adapter to serialise.
+"""
+import hmac
+import logging
+import os
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# The database is optional for deployments that only generate images
+try:
+    import database
+    DB_AVAILABLE = True
+except ImportError:
+    database = None
+    DB_AVAILABLE = False
+    logger.warning("Database module not available")
+
+DB_UNAVAILABLE = (503, {"success": False, "message": "Database not available"})
+
+# Bearer token for the /admin endpoints; unset, they are not served at all
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+
+def init_database():
+    """Create the tables if they don't exist yet; the adapters call this once at startup"""
+    if DB_AVAILABLE:
+        database.init_database()
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    return authorization.replace("Bearer ", "")
+
+
+def is_admin(authorization: Optional[str]) -> bool:
+    """Whether the request carries ADMIN_TOKEN"""
+    token = bearer_token(authorization)
+    if not ADMIN_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+def register(username: str, email: str, password: str, full_name: Optional[str] = None) -> Tuple[int, dict]:
+    """Register a new user"""
+    if not DB_AVAILABLE:
+        return DB_UNAVAILABLE
+    if len(password) < 6:
+        return 400, {"success": False, "message": "Password must be at least 6 characters"}
+
+    success, message = database.register_user(username, email, password, full_name)
+    if success:
+        return 200, {"success": True, "message": message}
+    return 400, {"success": False, "message": message}
+
+
+def login(username: str, password: str, user_agent: Optional[str] = None,
+          ip_address: Optional[str] = None) -> Tuple[int, dict]:
+    """Login a user and return session token"""
+    if not DB_AVAILABLE:
+        return DB_UNAVAILABLE
+    success, message, user_data = database.login_user(username, password, ip_address=ip_address,
+                                                      user_agent=user_agent)
+    if success:
+        return 200, {"success": True, "message": message, "user": user_data}
+    return 401, {"success": False, "message": message}
+
+
+def logout(authorization: Optional[str]) -> Tuple[int, dict]:
+    """Logout a user by invalidating their session"""
+    if not DB_AVAILABLE:
+        return DB_UNAVAILABLE
+    session_token = bearer_token(authorization)
+    if session_token is None:
+        return 401, {"detail": "Not authenticated"}
+    if database.logout_user(session_token):
+        return 200, {"success": True, "message": "Logged out successfully"}
+    return 400, {"success": False, "message": "Logout failed"}
+
+
+def verify(authorization: Optional[str]) -> Tuple[int, dict]:
+    """Verify if a session token is valid"""
+    if not DB_AVAILABLE:
+        return DB_UNAVAILABLE
+    session_token = bearer_token(authorization)
+    if session_token is None:
+        return 401, {"success": False, "message": "Not authenticated"}
+    valid, user_data = database.verify_session(session_token)
+    if valid:
+        return 200, {"success": True, "user": user_data}
+    return 401, {"success": False, "message": "Invalid or expired session"}
+
+
+def my_images(authorization: Optional[str]) -> Tuple[int, dict]:
+    """Get the current user's generated images"""
+    if not DB_AVAILABLE:
+        return DB_UNAVAILABLE
+    session_token = bearer_token(authorization)
+    if session_token is None:
+        return 401, {"detail": "Not authenticated"}
+    valid, user_data = database.verify_session(session_token)
+    if not valid:
+        return 401, {"detail": "Invalid or expired session"}
+    return 200, {"success": True, "images": database.get_user_images(user_data["id"])}
@@ -0,0 +1,429 @@
+"""
+Generation/captioning backends and the registry the adapters pick from
+Select one with ENGINE_BACKEND=webui|replicate|diffusers (each app has its own default).
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+from image_relay import open_image_stream
+from metrics import GENERATE_STAGE_SECONDS
+from replicate_client import CAPTION_INPUT_SIZE, InvalidImage, ReplicateClient, PredictionTimeout
+from tracing import stage, traced
+from .core import DecodingOptions, EngineError, GenerationRequest, GenerationResult, is_generic_question
+
+logger = logging.getLogger(__name__)
+
+ENGINE_BACKEND = os.environ.get("ENGINE_BACKEND", "").lower()
+
+STABLE_URL = os.environ.get("STABLE_URL", "http://127.0.0.1:7861")
+WEBUI_TIMEOUT = float(os.environ.get("WEBUI_TIMEOUT", 120))
+# Keep-alive connections to the WebUI per process
+WEBUI_POOL_SIZE = int(os.environ.get("WEBUI_POOL_SIZE", 16))
+
+REPLICATE_API_TOKEN = os.environ.get("REPLICATE_API_TOKEN", "")
+SDXL_VERSION = "39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b"
+BLIP_VERSION = "2e1dddc8621f72155f24cf2e0adbde548458d3cab9f00c0139eea840d0ac4746"
+REPLICATE_MAX_STEPS = 50
+
+
+class Backend:
+    """Base class: one instance per process, shared by all requests"""
+
+    name = ""
+    # Steps above this are capped by the backend (and not charged)
+    max_steps: Optional[int] = None
+    # n_iter above this is not run by the backend (so rejected, not charged)
+    max_iterations: Optional[int] = None
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def check_available(self):
+        """Raise EngineError when the backend cannot take requests"""
+
+    def status(self) -> dict:
+        """Extra fields for the / health check"""
+        return {}
+
+    async def generate(self, req: GenerationRequest, inline: bool = True) -> GenerationResult:
+        """
+        Run a generation
+        inline=False lets a backend return remote URLs for the caller to stream
+        """
+        raise NotImplementedError
+
+    async def open_image(self, url: str) -> httpx.Response:
+        """Start streaming one of a result's urls; the caller must close the response"""
+        raise NotImplementedError
+
+    async def caption(self, img_bytes: bytes, question: Optional[str] = None,
+                      decoding: Optional[DecodingOptions] = None) -> str:
+        raise NotImplementedError
+
+    async def caption_stream(self, img_bytes: bytes, question: Optional[str] = None,
+                             decoding: Optional[DecodingOptions] = None) -> AsyncIterator[str]:
+        """caption() as text pieces while it's decoded; backends that can't stream yield the whole answer"""
+        yield await self.caption(img_bytes, question, decoding)
+
+    async def caption_batch(self, images: List[bytes], question: Optional[str] = None,
+                            decoding: Optional[DecodingOptions] = None) -> list:
+        """
+        caption() for many images; an EngineError takes the place of each one that fails
+        Backends that can batch inference override this one-at-a-time loop.
+        """
+        results = []
+        for img_bytes in images:
+            try:
+                results.append(await self.caption(img_bytes, question, decoding))
+            except EngineError as e:
+                results.append(e)
+        return results
+
+    def generate_sync(self, req: GenerationRequest) -> GenerationResult:
+        """Blocking generate() for WSGI adapters; runs on the shared engine loop unless overridden"""
+        return self._run_sync(self.generate, req)
+
+    def caption_sync(self, img_bytes: bytes, question: Optional[str] = None,
+                     decoding: Optional[DecodingOptions] = None) -> str:
+        return self._run_sync(self.caption, img_bytes, question, decoding)
+
+    def caption_stream_sync(self, img_bytes: bytes, question: Optional[str] = None,
+                            decoding: Optional[DecodingOptions] = None) -> Iterator[str]:
+        yield self.caption_sync(img_bytes, question, decoding)
+
+    def caption_batch_sync(self, images: List[bytes], question: Optional[str] = None,
+                           decoding: Optional[DecodingOptions] = None) -> list:
+        return self._run_sync(self.caption_batch, images, question, decoding)
+
+    def _run_sync(self, method, *args):
+        from .sync import run_sync
+
+        async def call():
+            # WSGI apps have no startup hook; start() is idempotent
+            await self.start()
+            return await method(*args)
+        return run_sync(call())
+
+
+class LocalCaptioning:
+    """Mixin: answer /image-to-text with BLIP in this process"""
+
+    async def caption(self, img_bytes: bytes, question: Optional[str] = None,
+                      decoding: Optional[DecodingOptions] = None) -> str:
+        from .captioning import caption_image
+
+        # BLIP inference blocks; keep it off the event loop
+        return await asyncio.to_thread(caption_image, img_bytes, question, decoding)
+
+    async def caption_stream(self, img_bytes: bytes, question: Optional[str] = None,
+                             decoding: Optional[DecodingOptions] = None) -> AsyncIterator[str]:
+        from .captioning import caption_stream
+
+        pieces = caption_stream(img_bytes, question, decoding)
+        try:
+            while True:
+                piece = await asyncio.to_thread(next, pieces, None)
+                if piece is None:
+                    break
+                yield piece
+        finally:
+            # Waits for the generation thread; off the loop too
+            await asyncio.to_thread(pieces.close)
+
+    async def caption_batch(self, images: List[bytes], question: Optional[str] = None,
+                            decoding: Optional[DecodingOptions] = None) -> list:
+        from .captioning import caption_batch
+
+        return await asyncio.to_thread(caption_batch, images, question, decoding)
+
+    def caption_sync(self, img_bytes: bytes, question: Optional[str] = None,
+                     decoding: Optional[DecodingOptions] = None) -> str:
+        from .captioning import caption_image
+
+        return caption_image(img_bytes, question, decoding)
+
+    def caption_stream_sync(self, img_bytes: bytes, question: Optional[str] = None,
+                            decoding: Optional[DecodingOptions] = None) -> Iterator[str]:
+        from .captioning import caption_stream
+
+        return caption_stream(img_bytes, question, decoding)
+
+    def caption_batch_sync(self, images: List[bytes], question: Optional[str] = None,
+                           decoding: Optional[DecodingOptions] = None) -> list:
+        from .captioning import caption_batch
+
+        return caption_batch(images, question, decoding)
+
+
+class WebUIBackend(LocalCaptioning, Backend):
+    """AUTOMATIC1111 Stable Diffusion WebUI API + local BLIP"""
+
+    name = "webui"
+
+    def __init__(self, base_url: str = STABLE_URL, timeout: float = WEBUI_TIMEOUT, pool_size: int = WEBUI_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.client: Optional[httpx.AsyncClient] = None
+        # Blocking client for WSGI threads, so they don't hop through an event loop
+        self.sync_client: Optional[httpx.Client] = None
+        self._sync_pid: Optional[int] = None
+        self._sync_lock = threading.Lock()
+
+    def _client_options(self, transport_class) -> dict:
+        # Retries only cover failures to connect; a generation may have started otherwise
+        # (limits belong to the transport; the client ignores its own when given one)
+        return {
+            "base_url": self.base_url,
+            "timeout": httpx.Timeout(self.timeout, connect=10.0),
+            "transport": traced(transport_class(
+                retries=2,
+                limits=httpx.Limits(max_keepalive_connections=self.pool_size, max_connections=None),
+            )),
+        }
+
+    async def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(**self._client_options(httpx.AsyncHTTPTransport))
+
+    def _sync(self) -> httpx.Client:
+        # Created per process: pooled sockets must not be shared across fork
+        if self.sync_client is None or self._sync_pid != os.getpid():
+            with self._sync_lock:
+                if self.sync_client is None or self._sync_pid != os.getpid():
+                    self.sync_client = httpx.Client(**self._client_options(httpx.HTTPTransport))
+                    self._sync_pid = os.getpid()
+        return self.sync_client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        if self.sync_client is not None:
+            self.sync_client.close()
+            self.sync_client = None
+
+    def status(self) -> dict:
+        return {"backend": self.name}
+
+    def payload(self, req: GenerationRequest) -> dict:
+        payload = {
+            "prompt": req.prompt,
+            "negative_prompt": req.negative_prompt,
+            "steps": req.steps,
+            "cfg_scale": req.cfg_scale,
+            "width": req.width,
+            "height": req.height,
+            "sampler_name": req.sampler_name,
+            "seed": req.seed,
+            "batch_size": req.batch_size,
+            "n_iter": req.n_iter,
+        }
+        if req.is_img2img:
+            payload["denoising_strength"] = req.denoising_strength
+            # SD WebUI accepts plain base64 strings for init_images
+            with stage(GENERATE_STAGE_SECONDS, "payload_encode"):
+                payload["init_images"] = [base64.b64encode(req.init_image).decode("utf-8")]
+        return payload
+
+    def endpoint(self, req: GenerationRequest) -> str:
+        endpoint = "/sdapi/v1/img2img" if req.is_img2img else "/sdapi/v1/txt2img"
+        logger.info(f"Sending request to {self.base_url}{endpoint}")
+        return endpoint
+
+    def transport_error(self, e: httpx.TransportError) -> EngineError:
+        if isinstance(e, httpx.TimeoutException):
+            return EngineError("Stable WebUI timed out", 504)
+        return EngineError(f"Stable WebUI unavailable: {e}", 503)
+
+    def parse(self, req: GenerationRequest, res: httpx.Response) -> GenerationResult:
+        logger.info(f"Response status: {res.status_code}")
+        if res.status_code >= 400:
+            logger.error(f"Stable WebUI error: {res.status_code} {res.text}")
+            raise EngineError(f"Stable WebUI error: {res.status_code} {res.text}", 502)
+
+        with stage(GENERATE_STAGE_SECONDS, "response_decode"):
+            data = res.json()
+        if not data or not data.get("images"):
+            raise EngineError("No image returned from Stable WebUI", 502)
+
+        info = data.get("info")
+        seed = req.seed
+        if isinstance(info, str):
+            try:
+                seed = json.loads(info).get("seed", seed)
+            except ValueError:
+                pass
+        return GenerationResult(images=data["images"], seed=seed)
+
+    async def generate(self, req: GenerationRequest, inline: bool = True) -> GenerationResult:
+        await self.start()
+        payload = self.payload(req)
+        try:
+            with stage(GENERATE_STAGE_SECONDS, "webui_request"):
+                res = await self.client.post(self.endpoint(req), json=payload)
+        except httpx.TransportError as e:
+            raise self.transport_error(e)
+        return self.parse(req, res)
+
+    def generate_sync(self, req: GenerationRequest) -> GenerationResult:
+        payload = self.payload(req)
+        try:
+            with stage(GENERATE_STAGE_SECONDS, "webui_request"):
+                res = self._sync().post(self.endpoint(req), json=payload)
+        except httpx.TransportError as e:
+            raise self.transport_error(e)
+        return self.parse(req, res)
+
+
+class ReplicateBackend(Backend):
+    """Stable Diffusion XL and BLIP on Replicate (no local GPU needed)"""
+
+    name = "replicate"
+    max_steps = REPLICATE_MAX_STEPS
+    # One prediction per request: num_outputs covers batch_size only
+    max_iterations = 1
+
+    def __init__(self, api_token: str = REPLICATE_API_TOKEN):
+        self.api_token = api_token
+        self.replicate = ReplicateClient(api_token)
+
+    async def start(self):
+        await self.replicate.start()
+
+    async def close(self):
+        await self.replicate.close()
+
+    def check_available(self):
+        if not self.api_token:
+            raise EngineError("Replicate API not configured", 503, extra={
+                "message": "Set REPLICATE_API_TOKEN environment variable",
+                "demo_mode": True,
+            })
+
+    def status(self) -> dict:
+        return {
+            "backend": self.name,
+            "version": "2.0 - Cloud Edition",
+            "replicate_configured": bool(self.api_token),
+        }
+
+    async def generate(self, req: GenerationRequest, inline: bool = True) -> GenerationResult:
+        self.check_available()
+        inputs = {
+            "prompt": req.prompt,
+            "negative_prompt": req.negative_prompt,
+            "num_inference_steps": min(req.steps, REPLICATE_MAX_STEPS),  # Cap at 50 for speed
+            "guidance_scale": req.cfg_scale,
+            "width": req.width,
+            "height": req.height,
+            "num_outputs": req.batch_size,
+            "seed": req.seed if req.seed != -1 else None,
+        }
+        if req.is_img2img:
+            with stage(GENERATE_STAGE_SECONDS, "replicate_upload"):
+                inputs["image"] = await self._upload(req.init_image, max(req.width, req.height))
+            inputs["prompt_strength"] = req.denoising_strength
+
+        with stage(GENERATE_STAGE_SECONDS, "replicate_predict") as span:
+            response = await self.replicate.create_prediction(SDXL_VERSION, inputs)
+            if response.status_code != 201:
+                logger.error(f"Replicate API error: {response.text}")
+                # Replicate's 4xx (bad token, billing, rate limit) is our failure, not the caller's: refunded
+                raise EngineError("Failed to start generation", 502,
+                                  extra={"details": response.text, "upstream_status": response.status_code})
+
+            span.set_attribute("replicate.prediction_id", response.json().get("id", ""))
+            try:
+                result = await self.replicate.wait_for_prediction(response.json(), timeout=120)
+            except PredictionTimeout:
+                raise EngineError("Generation timed out", 408)
+        if result["status"] != "succeeded" or not result.get("output"):
+            raise EngineError("Generation failed", 500, extra={"details": result.get("error")})
+
+        urls = list(result["output"])
+        seed = result.get("seed", req.seed)
+        if not inline:
+            return GenerationResult(urls=urls, seed=seed)
+
+        images = []
+        with stage(GENERATE_STAGE_SECONDS, "download"):
+            for url in urls:
+                res = await self.replicate.client.get(url)
+                res.raise_for_status()
+                images.append(base64.b64encode(res.content).decode("ascii"))
+        return GenerationResult(images=images, seed=seed)
+
+    async def open_image(self, url: str) -> httpx.Response:
+        return await open_image_stream(self.replicate.client, url)
+
+    async def _upload(self, img_bytes: bytes, max_side: int = CAPTION_INPUT_SIZE) -> str:
+        try:
+            return await self.replicate.upload_image(img_bytes, max_side)
+        except InvalidImage as e:
+            raise EngineError(str(e), 400)
+
+    async def caption(self, img_bytes: bytes, question: Optional[str] = None,
+                      decoding: Optional[DecodingOptions] = None) -> str:
+        # Replicate's BLIP takes no decoding controls; decoding is validated but not forwarded
+        self.check_available()
+        # Downsize and upload once per distinct image instead of inlining base64
+        img_url = await self._upload(img_bytes)
+        conditional = not is_generic_question(question)
+        response = await self.replicate.create_prediction(BLIP_VERSION, {
+            "image": img_url,
+            "task": "visual_question_answering" if conditional else "image_captioning",
+            "question": question if conditional else "",
+        })
+        if response.status_code != 201:
+            logger.error(f"Replicate API error: {response.text}")
+            raise EngineError("Failed to start captioning", 502,
+                              extra={"details": response.text, "upstream_status": response.status_code})
+
+        try:
+            result = await self.replicate.wait_for_prediction(response.json(), timeout=30)
+        except PredictionTimeout:
+            raise EngineError("Captioning timed out", 408)
+        if result["status"] != "succeeded":
+            raise EngineError("Captioning failed", 500)
+        return result["output"]
+
+
+def _diffusers_backend() -> Backend:
+    # Imported on demand: only this backend needs torch/diffusers
+    from .diffusers_backend import DiffusersBackend
+
+    return DiffusersBackend()
+
+
+BACKENDS: Dict[str, Callable[[], Backend]] = {
+    "webui": WebUIBackend,
+    "replicate": ReplicateBackend,
+    "diffusers": _diffusers_backend,
+}
+_instances: Dict[str, Backend] = {}
+
+
+def register_backend(name: str, factory: Callable[[], Backend]):
+    """Make a backend selectable through ENGINE_BACKEND / get_backend(name)"""
+    BACKENDS[name] = factory
+
+
+def get_backend(name: Optional[str] = None, default: str = "webui") -> Backend:
+    """Return this process's shared instance of a backend"""
+    name = (name or ENGINE_BACKEND or default).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(sorted(BACKENDS))}")
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
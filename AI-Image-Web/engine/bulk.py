@@ -0,0 +1,285 @@
+"""
+Captioning many images: /image-to-text/bulk uploads and a folder CLI
+The endpoint takes several "images" files or one zip "archive" and streams
+back one JSON line per image as BLIP finishes each batch, then a summary.
+The CLI walks a directory, decodes and preprocesses images in a process pool
+while BLIP captions the previous batch, and appends one JSON line per image
+to its output as it goes; run again, it skips the files already there.
+Run: python -m engine.bulk DIR [--out captions.jsonl] [--question Q] [--batch-size 8] [--workers N]
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import time
+import zipfile
+from collections import deque
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from . import captioning
+from .core import DecodingOptions, EngineError
+
+logger = logging.getLogger(__name__)
+
+BULK_MAX_IMAGES = int(os.environ.get("BULK_MAX_IMAGES", 64))
+BULK_MAX_FILE_MB = float(os.environ.get("BULK_MAX_FILE_MB", 20))
+BULK_MAX_ARCHIVE_MB = float(os.environ.get("BULK_MAX_ARCHIVE_MB", 200))
+# Adapters read at most this much of an archive: one byte more than collect_uploads accepts
+ARCHIVE_READ_LIMIT = int(BULK_MAX_ARCHIVE_MB * 2 ** 20) + 1
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+
+# -------------------------------------------------
+# Uploads
+# -------------------------------------------------
+
+def check_count(files: int):
+    """Raise EngineError when more files were sent than a request takes; checked before reading them"""
+    if files > BULK_MAX_IMAGES:
+        raise EngineError(f"At most {BULK_MAX_IMAGES} images per request", 413)
+
+
+def collect_uploads(files: List[Tuple[str, bytes]], archive: Optional[bytes] = None) -> List[Tuple[str, bytes]]:
+    """(name, bytes) of every image uploaded as a file or inside a zip archive; raises EngineError"""
+    max_bytes = BULK_MAX_FILE_MB * 2 ** 20
+    uploads = []
+    for name, data in files:
+        if len(data) > max_bytes:
+            raise EngineError(f"{name} is larger than {BULK_MAX_FILE_MB:g} MB", 413)
+        uploads.append((name, data))
+    if archive is not None:
+        if len(archive) >= ARCHIVE_READ_LIMIT:
+            raise EngineError(f"archive is larger than {BULK_MAX_ARCHIVE_MB:g} MB", 413)
+        try:
+            with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+                for info in zf.infolist():
+                    name = info.filename
+                    if (info.is_dir() or not name.lower().endswith(IMAGE_EXTENSIONS) or name.startswith("__MACOSX/")
+                            or os.path.basename(name).startswith(".")):
+                        continue
+                    # Checked before decompressing: the sizes come from the archive's directory
+                    if info.file_size > max_bytes:
+                        raise EngineError(f"{name} is larger than {BULK_MAX_FILE_MB:g} MB", 413)
+                    if len(uploads) >= BULK_MAX_IMAGES:
+                        raise EngineError(f"At most {BULK_MAX_IMAGES} images per request", 413)
+                    uploads.append((name, zf.read(info)))
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError) as e:
+            raise EngineError(f"archive is not a readable zip file: {e}", 400)
+    if not uploads:
+        raise EngineError("No images provided", 400)
+    if len(uploads) > BULK_MAX_IMAGES:
+        raise EngineError(f"At most {BULK_MAX_IMAGES} images per request", 413)
+    return uploads
+
+
+def _record(name: str, result) -> str:
+    if isinstance(result, EngineError):
+        return json.dumps({"file": name, "error": result.message}) + "\n"
+    return json.dumps({"file": name, "text": result}) + "\n"
+
+
+def _summary(captioned: int, errors: int, seconds: float) -> str:
+    # Throughput counts captions only; failed images are reported on their own
+    return json.dumps({"done": True, "images": captioned, "errors": errors, "seconds": round(seconds, 3),
+                       "images_per_second": round(captioned / seconds, 3) if seconds else None}) + "\n"
+
+
+def _error(e: Exception) -> str:
+    return json.dumps(e.to_dict() if isinstance(e, EngineError) else {"error": str(e)}) + "\n"
+
+
+async def caption_results(backend, uploads: List[Tuple[str, bytes]], question: Optional[str],
+                          decoding: DecodingOptions,
+                          refund: Optional[Callable[[int, Optional[Exception]], None]] = None) -> AsyncIterator[str]:
+    """
+    JSON lines: one per image as each batch is captioned, then a summary (or an error line)
+    refund(images, error) (blocking; run in a worker thread) is given the images that got no
+    caption: each batch's unreadable ones with error None, the rest with the error that ends the request.
+    """
+    start, errors, done = time.perf_counter(), 0, 0
+    try:
+        for i in range(0, len(uploads), captioning.BLIP_BATCH_SIZE):
+            batch = uploads[i:i + captioning.BLIP_BATCH_SIZE]
+            results = await backend.caption_batch([data for _, data in batch], question, decoding)
+            done += len(batch)
+            failed = sum(isinstance(result, EngineError) for result in results)
+            if failed and refund is not None:
+                await asyncio.to_thread(refund, failed, None)
+            errors += failed
+            for (name, _), result in zip(batch, results):
+                yield _record(name, result)
+        yield _summary(len(uploads) - errors, errors, time.perf_counter() - start)
+    except Exception as e:
+        if not isinstance(e, EngineError):
+            logger.exception(f"Error in bulk image-to-text: {e}")
+        if refund is not None:
+            await asyncio.to_thread(refund, len(uploads) - done, e)
+        yield _error(e)
+
+
+def caption_results_sync(backend, uploads: List[Tuple[str, bytes]], question: Optional[str],
+                         decoding: DecodingOptions,
+                         refund: Optional[Callable[[int, Optional[Exception]], None]] = None) -> Iterator[str]:
+    """caption_results for WSGI adapters"""
+    start, errors, done = time.perf_counter(), 0, 0
+    try:
+        for i in range(0, len(uploads), captioning.BLIP_BATCH_SIZE):
+            batch = uploads[i:i + captioning.BLIP_BATCH_SIZE]
+            results = backend.caption_batch_sync([data for _, data in batch], question, decoding)
+            done += len(batch)
+            failed = sum(isinstance(result, EngineError) for result in results)
+            if failed and refund is not None:
+                refund(failed, None)
+            errors += failed
+            for (name, _), result in zip(batch, results):
+                yield _record(name, result)
+        yield _summary(len(uploads) - errors, errors, time.perf_counter() - start)
+    except Exception as e:
+        if not isinstance(e, EngineError):
+            logger.exception(f"Error in bulk image-to-text: {e}")
+        if refund is not None:
+            refund(len(uploads) - done, e)
+        yield _error(e)
+
+
+# -------------------------------------------------
+# Folders
+# -------------------------------------------------
+
+def find_images(root: str) -> List[str]:
+    """Image files under root, as sorted relative paths with "/" separators"""
+    found = []
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith("."):
+                found.append(os.path.relpath(os.path.join(directory, name), root).replace(os.sep, "/"))
+    return found
+
+
+def read_checkpoint(out_path: str, retry_errors: bool = False) -> set:
+    """Files already in an output file; a last line cut short by a crash is dropped and redone"""
+    if not os.path.exists(out_path):
+        return set()
+    with open(out_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    done = set()
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if "file" in record and not (retry_errors and "error" in record):
+            done.add(record["file"])
+    return done
+
+
+def _preprocess_file(path: str):
+    try:
+        return captioning.preprocess(path), None
+    except Exception as e:
+        return None, f"Not a readable image ({type(e).__name__}: {e})"
+
+
+def _decoded(root: str, names: List[str], executor, window: int) -> Iterator[tuple]:
+    """(name, pixels, error) in order; with a pool, the first window images are submitted right away"""
+    if executor is None:
+        return ((name, *_preprocess_file(os.path.join(root, name))) for name in names)
+    remaining = iter(names)
+    pending = deque((name, executor.submit(_preprocess_file, os.path.join(root, name)))
+                    for _, name in zip(range(window), remaining))
+
+    def results():
+        while pending:
+            name, future = pending.popleft()
+            following = next(remaining, None)
+            if following is not None:
+                pending.append((following, executor.submit(_preprocess_file, os.path.join(root, following))))
+            yield (name, *future.result())
+    return results()
+
+
+def caption_folder(root: str, out_path: str, question: Optional[str] = None,
+                   decoding: Optional[DecodingOptions] = None, batch_size: int = captioning.BLIP_BATCH_SIZE,
+                   workers: int = 0, retry_errors: bool = False) -> dict:
+    """Caption every image under root into out_path (JSON lines), resuming; returns throughput stats"""
+    done = read_checkpoint(out_path, retry_errors)
+    names = [name for name in find_images(root) if name not in done]
+    executor = None
+    if workers and names:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # spawn: forking a process that has loaded torch can deadlock
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    decoded = _decoded(root, names, executor, window=2 * batch_size + workers)
+    # Loads while the pool starts up and decodes the first images
+    start = time.perf_counter()
+    if names:
+        captioning.load_blip_model()
+    load = time.perf_counter() - start
+    captioned = errors = 0
+    start = time.perf_counter()
+    try:
+        with open(out_path, "a", encoding="utf-8") as out:
+            batch = []
+
+            def flush():
+                nonlocal captioned
+                if batch:
+                    texts = captioning.caption_pixels([pixels for _, pixels in batch], question, decoding)
+                    out.writelines(_record(name, text) for (name, _), text in zip(batch, texts))
+                    captioned += len(batch)
+                    batch.clear()
+                # Each written line is a checkpoint
+                out.flush()
+                elapsed = time.perf_counter() - start
+                print(f"{captioned + errors}/{len(names)} images, {captioned / elapsed:.2f} images/s",
+                      file=sys.stderr, flush=True)
+
+            for name, pixels, error in decoded:
+                if error:
+                    errors += 1
+                    out.write(json.dumps({"file": name, "error": error}) + "\n")
+                    continue
+                batch.append((name, pixels))
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+        seconds = time.perf_counter() - start
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return {"images": captioned, "errors": errors, "skipped": len(done), "load_s": round(load, 3),
+            "seconds": round(seconds, 3),
+            "images_per_second": round(captioned / seconds, 3) if seconds else None}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Caption every image under a directory into a JSON lines file")
+    parser.add_argument("root", help="directory to walk")
+    parser.add_argument("--out", default="captions.jsonl", help="appended to; files already in it are skipped")
+    parser.add_argument("--question", default=None, help="ask this about every image (default: plain captions)")
+    parser.add_argument("--max-new-tokens", type=int, default=DecodingOptions.DEFAULT_MAX_NEW_TOKENS)
+    parser.add_argument("--num-beams", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=captioning.BLIP_BATCH_SIZE, help="images per generate call")
+    parser.add_argument("--workers", type=int, default=(os.cpu_count() or 1) - 1,
+                        help="image decoding processes (0: decode in this process)")
+    parser.add_argument("--retry-errors", action="store_true", help="redo files recorded with an error (the new line follows the old)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    try:
+        decoding = DecodingOptions.parse(args.max_new_tokens, args.num_beams)
+    except EngineError as e:
+        parser.error(e.message)
+    stats = caption_folder(args.root, args.out, args.question, decoding, args.batch_size, args.workers,
+                           args.retry_errors)
+    print(json.dumps(stats))
@@ -0,0 +1,388 @@
+"""
+Local BLIP image captioning (lazy loaded, shared by every adapter)
+"""
+import contextvars
+import gc
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, Optional
+
+from metrics import BLIP_FEATURE_CACHE, CAPTION_STAGE_SECONDS
+from tracing import stage
+from .core import DecodingOptions, EngineError, is_generic_question
+
+logger = logging.getLogger(__name__)
+
+# A Hub id or a local directory (e.g. benchmarks/tiny_blip.py for offline benchmarks)
+BLIP_MODEL_NAME = os.environ.get("BLIP_MODEL", "Salesforce/blip-image-captioning-large")
+# Concurrent BLIP generations per process (the rest queue)
+BLIP_CONCURRENCY = int(os.environ.get("BLIP_CONCURRENCY", 1))
+# CPU inference mode; benchmarks/blip_precision.py reports each one's speed and agreement with fp32
+BLIP_PRECISION = os.environ.get("BLIP_PRECISION", "fp32").lower()
+PRECISIONS = {
+    "fp32": "full precision",
+    "bf16-vision": "the image encoder in bfloat16",
+    "bf16": "the whole model in bfloat16",
+    "int8": "dynamic int8 quantization of every linear layer",
+    "int8+bf16-vision": "the image encoder in bfloat16, the text decoder's linear layers dynamically int8",
+}
+
+# Preprocessed pixels and image-encoder output of recent uploads (LRU, bounded by their size; 0 turns it
+# off), so further questions about an image only run the text decoder
+BLIP_FEATURE_CACHE_MB = float(os.environ.get("BLIP_FEATURE_CACHE_MB", 64))
+# Images per generate call when captioning many at once (/image-to-text/bulk, python -m engine.bulk)
+BLIP_BATCH_SIZE = int(os.environ.get("BLIP_BATCH_SIZE", 8))
+
+blip_model = None
+blip_processor = None
+blip_lock = threading.Lock()
+blip_slots = threading.BoundedSemaphore(BLIP_CONCURRENCY)
+_image_processor = None
+
+
+def load_blip_model():
+    """Load BLIP model for image-to-text (lighter, works well on CPU)."""
+    global blip_model, blip_processor
+    if blip_model is not None:
+        return blip_model, blip_processor
+    with blip_lock:
+        if blip_model is not None:
+            return blip_model, blip_processor
+        try:
+            from transformers import BlipProcessor, BlipForConditionalGeneration
+            import torch
+
+            from . import artifacts
+
+            logger.info("Loading BLIP model...")
+            # Memory-mapped from the artifact cache after the first load
+            components = artifacts.load_components(BLIP_MODEL_NAME, "float32", lambda: {
+                "processor": BlipProcessor.from_pretrained(BLIP_MODEL_NAME),
+                "model": BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME),
+            })
+            processor, model = components["processor"], components["model"]
+
+            # Move to GPU if available
+            if torch.cuda.is_available():
+                model = model.cuda()
+                logger.info("BLIP model loaded on GPU")
+            else:
+                apply_precision(model, BLIP_PRECISION)
+                logger.info(f"BLIP model loaded on CPU ({BLIP_PRECISION})")
+
+            model.eval()
+            _reuse_vision_outputs(model)
+            # Publish only once fully initialised; other threads read without the lock
+            blip_model, blip_processor = model, processor
+            logger.info("BLIP model loaded successfully")
+        except Exception as e:
+            logger.error(f"Failed to load BLIP model: {e}")
+            raise
+
+    return blip_model, blip_processor
+
+
+def apply_precision(model, precision: str):
+    """
+    Switch BLIP to one of the CPU modes in PRECISIONS, in place
+    Converted weights are new memory rather than the artifact cache's mmap
+    (workers forked after PRELOAD_BLIP still share them).
+    """
+    import torch
+
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown BLIP_PRECISION {precision!r}; choose from {', '.join(PRECISIONS)}")
+    if precision in ("bf16", "bf16-vision", "int8+bf16-vision"):
+        vision = model if precision == "bf16" else model.vision_model
+        vision.to(torch.bfloat16)
+    if precision in ("int8", "int8+bf16-vision"):
+        from torch.ao.quantization import quantize_dynamic
+
+        target = model if precision == "int8" else model.text_decoder
+        quantize_dynamic(target, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if "bf16" in precision:
+        # The processor's fp32 pixels into the image encoder's dtype, its output into the decoder's
+        model.vision_model.register_forward_pre_hook(_to_encoder_dtype, with_kwargs=True)
+        model.vision_model.register_forward_hook(_to_decoder_dtype(model), with_kwargs=True)
+
+
+def _cast(value, dtype):
+    import torch
+
+    return value.to(dtype) if isinstance(value, torch.Tensor) and value.is_floating_point() else value
+
+
+def _to_encoder_dtype(module, args, kwargs):
+    dtype = module.embeddings.patch_embedding.weight.dtype
+    return tuple(_cast(a, dtype) for a in args), {k: _cast(v, dtype) for k, v in kwargs.items()}
+
+
+def _to_decoder_dtype(model):
+    dtype = model.text_decoder.get_input_embeddings().weight.dtype
+
+    def hook(module, args, kwargs, output):
+        if isinstance(output, tuple):
+            return (_cast(output[0], dtype),) + output[1:]
+        output.last_hidden_state = _cast(output.last_hidden_state, dtype)
+        return output
+    return hook
+
+
+def preload_blip_model():
+    """
+    Load BLIP before a server forks its workers
+    CPU only: a CUDA context cannot be used in a forked child, so GPU hosts
+    keep loading lazily inside each worker.
+    """
+    import torch
+
+    if torch.cuda.is_available():
+        logger.info("BLIP preload skipped on GPU hosts; each worker loads BLIP on first use")
+        return
+    load_blip_model()
+    # Move everything loaded so far out of the GC's reach so collections in
+    # forked workers don't write to (and un-share) these pages
+    gc.freeze()
+
+
+class ImageFeatures:
+    """What BLIP computes from an image alone, whatever the question"""
+
+    __slots__ = ("pixel_values", "vision_outputs")
+
+    def __init__(self, pixel_values):
+        self.pixel_values = pixel_values
+        self.vision_outputs = None
+
+    @property
+    def nbytes(self) -> int:
+        import torch
+
+        outputs = self.vision_outputs if self.vision_outputs is not None else ()
+        tensors = [self.pixel_values, *(outputs.values() if isinstance(outputs, dict) else outputs)]
+        return sum(t.nbytes for t in tensors if isinstance(t, torch.Tensor))
+
+
+class FeatureCache:
+    """LRU of ImageFeatures by upload content hash, bounded by their total size"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, ImageFeatures]" = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[ImageFeatures]:
+        with self.lock:
+            features = self.entries.get(key)
+            if features is not None:
+                self.entries.move_to_end(key)
+        BLIP_FEATURE_CACHE.labels("hit" if features is not None else "miss").inc()
+        return features
+
+    def put(self, key: str, features: ImageFeatures):
+        nbytes = features.nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old.nbytes
+            self.entries[key] = features
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                self.size -= self.entries.popitem(last=False)[1].nbytes
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"images": len(self.entries), "bytes": self.size, "max_bytes": self.max_bytes}
+
+
+feature_cache = FeatureCache(int(BLIP_FEATURE_CACHE_MB * 2 ** 20))
+# The features of the image being captioned in this thread / task
+_current_features: contextvars.ContextVar = contextvars.ContextVar("blip_image_features", default=None)
+
+
+def _reuse_vision_outputs(model):
+    """Make the image encoder return the current image's cached output instead of running again"""
+    forward = model.vision_model.forward
+
+    def cached_forward(*args, **kwargs):
+        features = _current_features.get()
+        if features is None:
+            return forward(*args, **kwargs)
+        if features.vision_outputs is None:
+            features.vision_outputs = forward(*args, **kwargs)
+        return features.vision_outputs
+
+    model.vision_model.forward = cached_forward
+
+
+def _prepare(img_bytes: bytes, question: Optional[str]):
+    """The model inputs for an image and question, and its features (from the cache when possible)"""
+    import torch
+    from PIL import Image
+
+    model, processor = load_blip_model()
+    with stage(CAPTION_STAGE_SECONDS, "blip_preprocess"):
+        key = hashlib.blake2b(img_bytes, digest_size=16).hexdigest() if feature_cache.max_bytes else None
+        features = feature_cache.get(key) if key else None
+        if features is None:
+            img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+            logger.info(f"Image loaded: {img.size}")
+            pixel_values = processor(images=img, return_tensors="pt")["pixel_values"]
+            if torch.cuda.is_available():
+                pixel_values = pixel_values.cuda()
+            features = ImageFeatures(pixel_values)
+        else:
+            key = None  # nothing to store afterwards
+
+        # BLIP supports both unconditional and conditional captioning
+        inputs = {"pixel_values": features.pixel_values}
+        if not is_generic_question(question):
+            inputs.update(processor(text=question, return_tensors="pt"))
+        if torch.cuda.is_available():
+            inputs = {k: v.cuda() for k, v in inputs.items()}
+    return model, processor, inputs, features, key
+
+
+def _generate(model, inputs: dict, features: ImageFeatures, key: Optional[str], decoding: DecodingOptions,
+              streamer=None):
+    import torch
+
+    with stage(CAPTION_STAGE_SECONDS, "blip_wait"):
+        blip_slots.acquire()
+    token = _current_features.set(features)
+    try:
+        with stage(CAPTION_STAGE_SECONDS, "blip_generate"), torch.no_grad():
+            output_ids = model.generate(**inputs, **decoding.generate_kwargs(), streamer=streamer)
+    finally:
+        _current_features.reset(token)
+        blip_slots.release()
+    if key:
+        feature_cache.put(key, features)
+    return output_ids
+
+
+def caption_image(img_bytes: bytes, question: Optional[str] = None,
+                  decoding: Optional[DecodingOptions] = None) -> str:
+    """
+    Caption an image (or answer a question about it) with BLIP
+    Blocking; async callers should run it in a worker thread.
+    """
+    model, processor, inputs, features, key = _prepare(img_bytes, question)
+    output_ids = _generate(model, inputs, features, key, decoding or DecodingOptions())
+    with stage(CAPTION_STAGE_SECONDS, "blip_decode"):
+        return processor.decode(output_ids[0], skip_special_tokens=True)
+
+
+def caption_stream(img_bytes: bytes, question: Optional[str] = None,
+                   decoding: Optional[DecodingOptions] = None) -> Iterator[str]:
+    """
+    caption_image as text pieces, yielded as BLIP decodes them; they join to its answer
+    Greedy decoding only. Blocking; generation runs on a thread of its own.
+    """
+    from transformers import TextIteratorStreamer
+
+    decoding = decoding or DecodingOptions()
+    decoding.check_streamable()
+    model, processor, inputs, features, key = _prepare(img_bytes, question)
+    streamer = TextIteratorStreamer(processor.tokenizer, skip_special_tokens=True)
+    failure = []
+
+    def run():
+        try:
+            _generate(model, inputs, features, key, decoding, streamer)
+        except BaseException as e:
+            failure.append(e)
+            streamer.end()  # unblock the reader
+
+    # Same context as the caller: stage timings and the trace follow the request
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), name="blip-stream", daemon=True)
+    thread.start()
+    try:
+        for piece in streamer:
+            if piece:
+                yield piece
+    finally:
+        thread.join()
+    if failure:
+        raise failure[0]
+
+
+# -------------------------------------------------
+# Many images
+# -------------------------------------------------
+
+def preprocess(image):
+    """
+    BLIP's input pixels for one image (bytes, a path or a PIL image): a float32 CHW numpy array
+    Needs only the image processor, not the model, so bulk captioning can
+    run it in worker processes.
+    """
+    global _image_processor
+    from PIL import Image
+
+    if _image_processor is None:
+        if blip_processor is not None:
+            _image_processor = blip_processor.image_processor
+        else:
+            from transformers import BlipProcessor
+
+            _image_processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME).image_processor
+    if isinstance(image, bytes):
+        image = io.BytesIO(image)
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    return _image_processor(image.convert("RGB"), return_tensors="np")["pixel_values"][0]
+
+
+def caption_pixels(pixel_values: list, question: Optional[str] = None,
+                   decoding: Optional[DecodingOptions] = None) -> List[str]:
+    """Answers for a batch of preprocess() outputs, from one generate call"""
+    import numpy as np
+    import torch
+
+    model, processor = load_blip_model()
+    inputs = {"pixel_values": torch.from_numpy(np.stack(pixel_values))}
+    if not is_generic_question(question):
+        inputs.update(processor(text=[question] * len(pixel_values), return_tensors="pt"))
+    if torch.cuda.is_available():
+        inputs = {k: v.cuda() for k, v in inputs.items()}
+
+    with stage(CAPTION_STAGE_SECONDS, "blip_wait"):
+        blip_slots.acquire()
+    try:
+        with stage(CAPTION_STAGE_SECONDS, "blip_generate"), torch.no_grad():
+            output_ids = model.generate(**inputs, **(decoding or DecodingOptions()).generate_kwargs())
+    finally:
+        blip_slots.release()
+    with stage(CAPTION_STAGE_SECONDS, "blip_decode"):
+        return processor.batch_decode(output_ids, skip_special_tokens=True)
+
+
+def caption_batch(images: List[bytes], question: Optional[str] = None,
+                  decoding: Optional[DecodingOptions] = None) -> list:
+    """
+    caption_image for many images, BLIP_BATCH_SIZE per generate call
+    An EngineError takes the place of each image that can't be read.
+    Blocking; async callers should run it in a worker thread.
+    """
+    load_blip_model()
+    results: list = [None] * len(images)
+    readable = []
+    with stage(CAPTION_STAGE_SECONDS, "blip_preprocess"):
+        for i, img_bytes in enumerate(images):
+            try:
+                readable.append((i, preprocess(img_bytes)))
+            except Exception as e:
+                results[i] = EngineError(f"Not a readable image ({type(e).__name__})", 400)
+    for start in range(0, len(readable), BLIP_BATCH_SIZE):
+        batch = readable[start:start + BLIP_BATCH_SIZE]
+        for (i, _), text in zip(batch, caption_pixels([pixels for _, pixels in batch], question, decoding)):
+            results[i] = text
+    return results
@@ -0,0 +1,224 @@
+"""
+Request/result types and the steps every adapter shares:
+admission (validation + quota) and saving outputs
+"""
+import base64
+import json
+import logging
+import math
+import os
+from typing import List, Optional
+
+from image_relay import output_path
+from metrics import GENERATE_STAGE_SECONDS
+from quota import (CAPTION_COST, CAPTION_MAX_NEW_TOKENS, estimate_cost, get_quota_manager, validate_caption,
+                   validate_request, validate_thumbnail)
+from tracing import stage
+
+logger = logging.getLogger(__name__)
+
+# Origins other than the API's own that may call it: serve.py during development and the
+# published frontend. Pages served by the API itself (SERVE_FRONTEND) are same-origin.
+CORS_ORIGINS = [o.strip() for o in os.environ.get(
+    "CORS_ORIGINS", "http://localhost:5500,http://127.0.0.1:5500,https://powerx1.github.io").split(",") if o.strip()]
+
+GENERIC_CAPTION_PROMPTS = ["describe this image", "what is in this image", "describe"]
+
+
+class EngineError(Exception):
+    """An error with the HTTP status and JSON body the adapters should return"""
+
+    def __init__(self, message: str, status_code: int = 500, extra: Optional[dict] = None,
+                 headers: Optional[dict] = None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.extra = extra or {}
+        self.headers = headers or {}
+
+    def to_dict(self) -> dict:
+        return {"error": self.message, **self.extra}
+
+
+class GenerationRequest:
+    """One txt2img/img2img request, independent of the web framework"""
+
+    def __init__(self, prompt: str, negative_prompt: str = "", steps: int = 30, cfg_scale: float = 7.0,
+                 width: int = 512, height: int = 512, sampler_name: str = "DPM++ 2M Karras", seed: int = -1,
+                 batch_size: int = 1, n_iter: int = 1, mode: str = "txt2img", denoising_strength: float = 0.75,
+                 init_image: Optional[bytes] = None):
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self.steps = int(steps)
+        self.cfg_scale = float(cfg_scale)
+        self.width = int(width)
+        self.height = int(height)
+        self.sampler_name = sampler_name
+        self.seed = int(seed)
+        self.batch_size = int(batch_size)
+        self.n_iter = int(n_iter)
+        self.mode = mode
+        self.denoising_strength = float(denoising_strength)
+        self.init_image = init_image
+
+    @property
+    def is_img2img(self) -> bool:
+        return self.mode == "img2img"
+
+
+class GenerationResult:
+    """
+    Output of a backend
+    images: base64-encoded images; urls: remote images not downloaded yet
+    """
+
+    def __init__(self, images: Optional[List[str]] = None, urls: Optional[List[str]] = None,
+                 seed: Optional[int] = None, info: Optional[dict] = None):
+        self.images = images or []
+        self.urls = urls or []
+        self.seed = seed
+        self.info = info or {}
+
+
+class DecodingOptions:
+    """
+    How an /image-to-text answer is decoded: at most max_new_tokens, greedy
+    (num_beams=1) or beam search, stopping beams as soon as enough finish
+    """
+
+    DEFAULT_MAX_NEW_TOKENS = 40
+
+    def __init__(self, max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS, num_beams: int = 1,
+                 early_stopping: bool = True):
+        self.max_new_tokens = int(max_new_tokens)
+        self.num_beams = int(num_beams)
+        self.early_stopping = bool(early_stopping)
+
+    @classmethod
+    def parse(cls, max_new_tokens=None, num_beams=None, early_stopping=None,
+              max_length=None) -> "DecodingOptions":
+        """
+        From form fields (strings, numbers or None); raises EngineError
+        max_length, the older total-length control, is clamped to the token
+        ceiling instead of rejected so existing clients keep working.
+        """
+        try:
+            if max_new_tokens not in (None, ""):
+                max_new_tokens = int(max_new_tokens)
+            elif max_length not in (None, ""):
+                max_new_tokens = max(1, min(int(max_length), CAPTION_MAX_NEW_TOKENS))
+            else:
+                max_new_tokens = cls.DEFAULT_MAX_NEW_TOKENS
+            num_beams = int(num_beams) if num_beams not in (None, "") else 1
+        except (TypeError, ValueError):
+            raise EngineError("max_new_tokens, num_beams and max_length must be integers", 400)
+        if isinstance(early_stopping, str):
+            early_stopping = early_stopping.lower() not in ("0", "false", "no", "")
+        error = validate_caption(max_new_tokens, num_beams)
+        if error:
+            raise EngineError(error, 400)
+        return cls(max_new_tokens, num_beams, True if early_stopping is None else early_stopping)
+
+    def check_streamable(self):
+        # transformers' streamers can't follow beam search
+        if self.num_beams != 1:
+            raise EngineError("Streaming supports num_beams=1 only", 400)
+
+    def generate_kwargs(self) -> dict:
+        kwargs = {"max_new_tokens": self.max_new_tokens, "num_beams": self.num_beams}
+        if self.num_beams > 1:
+            kwargs["early_stopping"] = self.early_stopping
+        return kwargs
+
+    def to_dict(self) -> dict:
+        return {"max_new_tokens": self.max_new_tokens, "num_beams": self.num_beams,
+                "early_stopping": self.early_stopping}
+
+
+def parse_thumbnail(value) -> int:
+    """The thumbnail form field (0 or empty: none) as a maximum side; raises EngineError"""
+    try:
+        max_side = int(value) if value not in (None, "") else 0
+    except (TypeError, ValueError):
+        raise EngineError("thumbnail must be an integer", 400)
+    error = validate_thumbnail(max_side)
+    if error:
+        raise EngineError(error, 400)
+    return max_side
+
+
+def sse(data: dict, event: Optional[str] = None) -> str:
+    """One server-sent event (text/event-stream)"""
+    return (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # no proxy buffering
+
+
+def is_generic_question(question: Optional[str]) -> bool:
+    """Generic "describe" prompts get unconditional captioning"""
+    return not question or any(p in question.lower() for p in GENERIC_CAPTION_PROMPTS)
+
+
+def admit(backend, req: GenerationRequest, caller: str) -> float:
+    """Validate a request and charge the caller's quota; returns the cost charged, raises EngineError"""
+    error = validate_request(req.steps, req.width, req.height, req.batch_size, req.n_iter)
+    if error:
+        raise EngineError(error, 400)
+    if req.is_img2img and not req.init_image:
+        raise EngineError("img2img mode requires an init image", 400)
+    if backend.max_iterations and req.n_iter > backend.max_iterations:
+        raise EngineError(f"The {backend.name} backend runs at most {backend.max_iterations} "
+                          f"iteration(s) per request; use batch_size instead", 400)
+    backend.check_available()
+
+    steps = min(req.steps, backend.max_steps) if backend.max_steps else req.steps
+    return charge(caller, estimate_cost(steps, req.width, req.height, req.batch_size, req.n_iter))
+
+
+def admit_caption(caller: str, images: int = 1) -> float:
+    """Charge the caller's quota for captioning images (one request); returns the cost, raises EngineError"""
+    return charge(caller, images * CAPTION_COST)
+
+
+def charge(caller: str, cost: float) -> float:
+    allowed, retry_after = get_quota_manager().charge(caller, cost)
+    if not allowed:
+        logger.warning(f"Rate limit exceeded for {caller}, retry after {retry_after:.1f}s")
+        retry_after = math.ceil(retry_after)
+        raise EngineError("Rate limit or GPU quota exceeded", 429, extra={"retry_after": retry_after},
+                          headers={"Retry-After": str(retry_after)})
+    return cost
+
+
+def refund_on_error(caller: str, cost: Optional[float], error: Exception):
+    """Give back the charge of a request that failed on our side (a 5xx or an unexpected error)"""
+    if cost is None or (isinstance(error, EngineError) and error.status_code < 500):
+        return
+    get_quota_manager().refund(caller, cost)
+
+
+def refund_captions(caller: str, images: int, error: Optional[Exception] = None):
+    """
+    Give back the charge for images that got no caption: always for an image that failed on
+    its own (error None), for the rest of a request only when it failed on our side
+    """
+    if images <= 0:
+        return
+    if error is None:
+        get_quota_manager().refund(caller, images * CAPTION_COST)
+    else:
+        refund_on_error(caller, images * CAPTION_COST, error)
+
+
+def save_images(result: GenerationResult, suffix: str = ".png") -> List[str]:
+    """Write a result's base64 images under output/ and return the file names"""
+    files = []
+    for img_base64 in result.images:
+        file_name = output_path(suffix)
+        with stage(GENERATE_STAGE_SECONDS, "base64_decode"):
+            data = base64.b64decode(img_base64)
+        with stage(GENERATE_STAGE_SECONDS, "file_write"), open(file_name, "wb") as f:
+            f.write(data)
+        files.append(file_name)
+    return files
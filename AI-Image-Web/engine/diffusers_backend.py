@@ -0,0 +1,243 @@
+"""
+In-process Stable Diffusion with diffusers (ENGINE_BACKEND=diffusers)
+Replaces the JSON/base64 round trip to a separate WebUI process. One
+dedicated inference thread owns the pipeline and runs jobs in order; request
+handlers only enqueue work and encode the finished images.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Optional
+
+import tracing
+from metrics import GENERATE_STAGE_SECONDS
+from tracing import stage
+from . import artifacts
+from .backends import Backend, LocalCaptioning
+from .core import EngineError, GenerationRequest, GenerationResult
+
+logger = logging.getLogger(__name__)
+
+DIFFUSERS_MODEL = os.environ.get("DIFFUSERS_MODEL", "runwayml/stable-diffusion-v1-5")
+DIFFUSERS_DEVICE = os.environ.get("DIFFUSERS_DEVICE", "")  # default: cuda when available
+# Jobs waiting for the inference thread before new requests get a 503
+DIFFUSERS_QUEUE_SIZE = int(os.environ.get("DIFFUSERS_QUEUE_SIZE", 8))
+# Encoded img2img init images kept for follow-up requests on the same upload
+DIFFUSERS_LATENT_CACHE = int(os.environ.get("DIFFUSERS_LATENT_CACHE", 16))
+
+_STOP = object()
+
+
+class InferenceJob:
+    """A generation waiting for (or running on) the inference thread"""
+
+    def __init__(self, req: GenerationRequest, seed: int):
+        self.req = req
+        self.seed = seed
+        self.future: Future = Future()
+        self.queued_at = time.perf_counter()
+        # The inference thread runs the job under the submitting request's span
+        self.span = tracing.current_span()
+        self.wait_span = tracing.start_span("queue_wait")
+        self.timings = tracing.stage_timings.get()
+
+
+class DiffusersBackend(LocalCaptioning, Backend):
+    """Stable Diffusion pipeline run in this process + local BLIP"""
+
+    name = "diffusers"
+
+    def __init__(self, model_id: str = DIFFUSERS_MODEL, device: str = DIFFUSERS_DEVICE,
+                 queue_size: int = DIFFUSERS_QUEUE_SIZE, latent_cache_size: int = DIFFUSERS_LATENT_CACHE):
+        self.model_id = model_id
+        self.device = device
+        self.jobs: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.txt2img = None
+        self.img2img = None
+        # Only touched by the inference thread
+        self.latent_cache: "OrderedDict" = OrderedDict()
+        self.latent_cache_size = latent_cache_size
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    # -------------------------------------------------
+    # Inference thread
+    # -------------------------------------------------
+
+    def load(self):
+        """Load the pipelines (on the inference thread, before the first job)"""
+        import torch
+        from diffusers import StableDiffusionImg2ImgPipeline, StableDiffusionPipeline
+
+        self.device = self.device or ("cuda" if torch.cuda.is_available() else "cpu")
+        logger.info(f"Loading {self.model_id} on {self.device}...")
+        dtype = torch.float16 if self.device == "cuda" else torch.float32
+        # Memory-mapped from the artifact cache after the first load
+        components = artifacts.load_components(self.model_id, str(dtype).replace("torch.", ""), lambda: (
+            StableDiffusionPipeline.from_pretrained(self.model_id, torch_dtype=dtype, safety_checker=None).components
+        ))
+        pipe = StableDiffusionPipeline(**components, requires_safety_checker=False)
+        pipe = pipe.to(self.device)
+        if self.device == "cuda":
+            pipe.enable_attention_slicing()
+        pipe.set_progress_bar_config(disable=True)
+        self.txt2img = pipe
+        # img2img shares every weight with txt2img; no second copy in memory
+        self.img2img = StableDiffusionImg2ImgPipeline(**pipe.components)
+        self.img2img.set_progress_bar_config(disable=True)
+        logger.info("Diffusers pipeline loaded")
+
+    def _run(self):
+        try:
+            self.load()
+            load_error = None
+        except Exception as e:
+            logger.exception(f"Failed to load diffusers pipeline: {e}")
+            load_error = e
+
+        while True:
+            job = self.jobs.get()
+            if job is _STOP:
+                break
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            waited = time.perf_counter() - job.queued_at
+            GENERATE_STAGE_SECONDS.labels("queue_wait").observe(waited)
+            job.wait_span.end()
+            if job.timings is not None:
+                job.timings.append(("queue_wait", waited))
+            if load_error is not None:
+                job.future.set_exception(EngineError(f"Model failed to load: {load_error}", 503))
+                continue
+            token = tracing.attach(job.span)
+            timings_token = tracing.stage_timings.set(job.timings)
+            try:
+                with stage(GENERATE_STAGE_SECONDS, "inference"):
+                    images = self.infer(job.req, job.seed)
+                job.future.set_result(images)
+            except Exception as e:
+                job.future.set_exception(e)
+            finally:
+                tracing.stage_timings.reset(timings_token)
+                tracing.detach(token)
+
+    def init_latent_dist(self, req: GenerationRequest):
+        """VAE latent distribution of the init image at the requested size, cached by content"""
+        import torch
+        from PIL import Image, ImageOps
+
+        key = (hashlib.blake2b(req.init_image, digest_size=16).digest(), req.width, req.height)
+        dist = self.latent_cache.get(key)
+        if dist is not None:
+            self.latent_cache.move_to_end(key)
+            return dist
+
+        # Upright as the browser showed it: the pixels alone ignore the EXIF orientation
+        init_image = ImageOps.exif_transpose(Image.open(io.BytesIO(req.init_image)))
+        init_image = init_image.convert("RGB").resize((req.width, req.height))
+        pixels = self.img2img.image_processor.preprocess(init_image)
+        with torch.inference_mode():
+            dist = self.img2img.vae.encode(pixels.to(self.device, self.img2img.vae.dtype)).latent_dist
+        if self.latent_cache_size > 0:
+            self.latent_cache[key] = dist
+            while len(self.latent_cache) > self.latent_cache_size:
+                self.latent_cache.popitem(last=False)
+        return dist
+
+    def infer(self, req: GenerationRequest, seed: int) -> list:
+        """Run one request on the pipeline; returns PIL images"""
+        import torch
+
+        common = {
+            "prompt": req.prompt,
+            "negative_prompt": req.negative_prompt or None,
+            "num_inference_steps": req.steps,
+            "guidance_scale": req.cfg_scale,
+            "num_images_per_prompt": req.batch_size,
+        }
+        images = []
+        # Decoded, resized and encoded once, then sampled per iteration like the pipeline does
+        init_dist = self.init_latent_dist(req) if req.is_img2img else None
+        with torch.inference_mode():
+            for i in range(req.n_iter):
+                # Same convention as the WebUI: iteration i starts at seed + i * batch_size
+                generator = torch.Generator(self.device).manual_seed(seed + i * req.batch_size)
+                if init_dist is not None:
+                    init_latents = init_dist.sample(generator) * self.img2img.vae.config.scaling_factor
+                    result = self.img2img(image=init_latents, strength=req.denoising_strength,
+                                          generator=generator, **common)
+                else:
+                    result = self.txt2img(width=req.width, height=req.height, generator=generator, **common)
+                images.extend(result.images)
+        return images
+
+    def _ensure_worker(self):
+        # Per process: a thread started before fork does not exist in the child
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="diffusers-inference", daemon=True)
+                    self._worker.start()
+
+    # -------------------------------------------------
+    # Backend API
+    # -------------------------------------------------
+
+    async def start(self):
+        # Starts loading the model right away instead of on the first request
+        self._ensure_worker()
+
+    async def close(self):
+        if self._worker is not None and self._worker.is_alive():
+            self.jobs.put(_STOP)
+            await asyncio.to_thread(self._worker.join)
+        self._worker = None
+
+    def status(self) -> dict:
+        return {"backend": self.name, "model": self.model_id, "loaded": self.txt2img is not None,
+                "queued": self.jobs.qsize(), "cached_init_images": len(self.latent_cache)}
+
+    def submit(self, req: GenerationRequest) -> InferenceJob:
+        self._ensure_worker()
+        # The pipelines need multiples of 8 (the VAE's latent grid); round down like the WebUI
+        req.width, req.height = req.width - req.width % 8, req.height - req.height % 8
+        seed = req.seed if req.seed != -1 else random.randrange(2 ** 32)
+        job = InferenceJob(req, seed)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            # The job never reaches the inference thread, which ends the span otherwise
+            job.wait_span.set_error("queue full")
+            job.wait_span.end()
+            raise EngineError("Generation queue is full, try again shortly", 503,
+                              headers={"Retry-After": "5"})
+        return job
+
+    @staticmethod
+    def encode(images: list) -> List[str]:
+        encoded = []
+        with stage(GENERATE_STAGE_SECONDS, "png_encode"):
+            for image in images:
+                buf = io.BytesIO()
+                image.save(buf, format="PNG")
+                encoded.append(base64.b64encode(buf.getvalue()).decode("ascii"))
+        return encoded
+
+    async def generate(self, req: GenerationRequest, inline: bool = True) -> GenerationResult:
+        job = self.submit(req)
+        images = await asyncio.wrap_future(job.future)
+        # PNG encoding runs outside the inference thread so the next job can start
+        return GenerationResult(images=await asyncio.to_thread(self.encode, images), seed=job.seed)
+
+    def generate_sync(self, req: GenerationRequest) -> GenerationResult:
+        job = self.submit(req)
+        return GenerationResult(images=self.encode(job.future.result()), seed=job.seed)
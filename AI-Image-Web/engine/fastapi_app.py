@@ -0,0 +1,439 @@
+"""
+FastAPI adapter: the HTTP surface shared by api.py (WebUI) and api_cloud.py (Replicate)
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, FastAPI, File, Form, Header, Request, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+import metrics
+import profiler
+import tracing
+from frontend import mount_frontend
+from image_relay import make_thumbnail, output_path, relayed_length, stream_image, stream_json
+from metrics import CAPTION_STAGE_SECONDS, GENERATE_STAGE_SECONDS
+from quota import get_quota_manager, user_key
+from tracing import stage
+from . import auth, bulk
+from .backends import Backend, ReplicateBackend, get_backend
+from .core import (CORS_ORIGINS, SSE_HEADERS, DecodingOptions, EngineError, GenerationRequest, admit, admit_caption,
+                   parse_thumbnail, refund_captions, refund_on_error, save_images, sse)
+from .fastapi_auth import auth_router
+
+logger = logging.getLogger(__name__)
+
+
+def error_response(e: EngineError) -> JSONResponse:
+    return JSONResponse(status_code=e.status_code, content=e.to_dict(), headers=e.headers)
+
+
+class MetricsMiddleware:
+    """Request count, latency and in-flight gauge per route (plain ASGI, no extra task per request)"""
+
+    # The in-flight gauge is labelled before routing, so it follows the inference endpoints by path
+    IN_FLIGHT_PATHS = ("/generate", "/image-to-text", "/img2text")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = metrics.HTTP_IN_FLIGHT.labels(
+            scope["path"] if scope["path"] in self.IN_FLIGHT_PATHS else "other")
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router leaves the matched route in the scope; static files and 404s share one label
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "other"
+            metrics.HTTP_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+            metrics.HTTP_REQUESTS.labels(endpoint, str(status)).inc()
+            in_flight.dec()
+
+
+class TracingMiddleware:
+    """A server span per request, continuing the caller's trace when it sends a traceparent header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        traceparent = next((value.decode("latin-1") for key, value in scope["headers"] if key == b"traceparent"), None)
+        with tracing.start_span(method, tracing.SERVER, {"http.request.method": method, "url.path": scope["path"]},
+                                traceparent=traceparent) as span:
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_error(f"HTTP {message['status']}")
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status if span.recording else send)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    span.set_attribute("http.route", route)
+                    span.update_name(f"{method} {route}")
+
+
+class SlowRequestMiddleware:
+    """Per-stage timings of every request, and stacks of the ones slower than SLOW_REQUEST_SECONDS"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # A profile takes as long as it was asked to
+        if scope["type"] != "http" or scope["path"].startswith("/admin/"):
+            return await self.app(scope, receive, send)
+        status = None
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        record = profiler.begin_request(scope["method"], scope["path"], asyncio.current_task())
+        if record is None:
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            profiler.end_request(record, status)
+
+
+def admin_router() -> APIRouter:
+    """/admin/profile and /admin/slow-requests, for ADMIN_TOKEN holders"""
+    router = APIRouter(prefix="/admin")
+
+    def forbidden():
+        return JSONResponse(status_code=401, content={"error": "Admin token required"})
+
+    @router.get("/profile")
+    async def get_profile(seconds: float = 10, interval: float = profiler.PROFILE_INTERVAL,
+                          authorization: Optional[str] = Header(None)):
+        """Sample this process's stacks for seconds; folded stacks for flamegraph.pl / speedscope"""
+        if not auth.is_admin(authorization):
+            return forbidden()
+        try:
+            sampler = profiler.start_profile(interval)
+        except profiler.ProfilerBusy as e:
+            return JSONResponse(status_code=409, content={"error": str(e)})
+        try:
+            await asyncio.sleep(min(max(seconds, 0), profiler.PROFILE_MAX_SECONDS))
+        finally:
+            folded = profiler.stop_profile(sampler)
+        return Response(folded, media_type="text/plain",
+                        headers={"X-Profile-Samples": str(sampler.samples), "X-Profile-Pid": str(os.getpid())})
+
+    @router.get("/slow-requests")
+    async def get_slow_requests(authorization: Optional[str] = Header(None)):
+        """The last slow requests with their stage timings and stacks"""
+        if not auth.is_admin(authorization):
+            return forbidden()
+        return profiler.slow_requests()
+
+    return router
+
+
+def create_app(default_backend: str = "webui", **app_kwargs) -> FastAPI:
+    """Build the API app around the backend selected by ENGINE_BACKEND (or default_backend)"""
+    backend: Backend = get_backend(default=default_backend)
+    auth.init_database()
+    app = FastAPI(**app_kwargs)
+    app.state.backend = backend
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["*"],
+        max_age=600,  # let browsers reuse preflights when the frontend is on another origin
+    )
+    app.add_middleware(MetricsMiddleware)
+    if profiler.SLOW_REQUEST_SECONDS:
+        app.add_middleware(SlowRequestMiddleware)
+    if tracing.TRACING_ENABLED:
+        app.add_middleware(TracingMiddleware)
+
+    @app.on_event("startup")
+    async def startup():
+        get_quota_manager()
+        await backend.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        await backend.close()
+
+    @app.get("/")
+    def home(request: Request):
+        # Browsers opening / get the page itself when the frontend is served here
+        if frontend is not None and "text/html" in request.headers.get("accept", ""):
+            return frontend.response("/index.html", request.headers)
+        return {"status": "API running successfully", **backend.status()}
+
+    @app.get("/metrics")
+    def get_metrics():
+        """Prometheus scrape endpoint (this process's metrics)"""
+        return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+    @app.post("/generate")
+    async def generate_image(
+        request: Request,
+        prompt: str = Form(...),
+        negative_prompt: str = Form(""),
+        steps: int = Form(30),
+        cfg_scale: float = Form(7.0),
+        width: int = Form(512),
+        height: int = Form(512),
+        sampler_name: str = Form("DPM++ 2M Karras"),
+        seed: int = Form(-1),
+        batch_size: int = Form(1),
+        n_iter: int = Form(1),
+        mode: str = Form("txt2img"),
+        denoising_strength: float = Form(0.75),
+        init_image: Optional[UploadFile] = File(None),
+        response_format: str = Form("json"),
+        thumbnail: int = Form(0),
+        authorization: Optional[str] = Header(None),
+    ):
+        """Generate an image with the configured backend
+
+        response_format "json" (default) returns {"message", "image" (base64), "file", "seed"};
+        "image" returns the raw image bytes. thumbnail > 0 (at most QUOTA_MAX_SIDE)
+        also saves a JPEG thumbnail with that maximum side.
+        """
+        logger.info(f"Received request - mode: {mode}, prompt: {prompt[:50]}...")
+        with stage(GENERATE_STAGE_SECONDS, "upload_read"):
+            init_bytes = await init_image.read() if init_image is not None and mode == "img2img" else None
+        req = GenerationRequest(
+            prompt, negative_prompt, steps, cfg_scale, width, height, sampler_name, seed,
+            batch_size, n_iter, mode, denoising_strength, init_image=init_bytes,
+        )
+        # Session lookups hit SQLite; keep them off the event loop
+        caller = await asyncio.to_thread(user_key, authorization, request.client.host if request.client else None)
+        cost = None
+        try:
+            # Checked before anything is charged or streamed: a bad size can't fail mid-response
+            thumbnail = parse_thumbnail(thumbnail)
+            with stage(GENERATE_STAGE_SECONDS, "admit"):
+                # Charging the quota writes to SQLite
+                cost = await asyncio.to_thread(admit, backend, req, caller)
+            with stage(GENERATE_STAGE_SECONDS, "backend"):
+                result = await backend.generate(req, inline=False)
+            fields = {"message": "Image generated successfully", "seed": result.seed}
+
+            if result.urls:
+                # Stream the remote image to output/ and the client without buffering it
+                url = result.urls[0]
+                img_response = await backend.open_image(url)
+                file_name = output_path(os.path.splitext(url.split("?")[0])[1] or ".png")
+                if response_format == "image":
+                    headers = {"X-File": file_name}
+                    if relayed_length(img_response) is not None:
+                        headers["Content-Length"] = relayed_length(img_response)
+                    return StreamingResponse(
+                        stream_image(img_response, file_name, thumbnail),
+                        media_type=img_response.headers.get("content-type", "image/png"),
+                        headers=headers
+                    )
+                return StreamingResponse(
+                    stream_json(img_response, file_name, fields, thumbnail),
+                    media_type="application/json"
+                )
+
+            file_name = (await asyncio.to_thread(save_images, result))[0]
+            logger.info(f"Image saved to {file_name}")
+            body = {**fields, "image": result.images[0], "file": file_name}
+            if thumbnail:
+                with stage(GENERATE_STAGE_SECONDS, "thumbnail"):
+                    body["thumbnail"] = await asyncio.to_thread(make_thumbnail, file_name, thumbnail)
+            if response_format == "image":
+                return Response(base64.b64decode(result.images[0]), media_type="image/png",
+                                headers={"X-File": file_name})
+            return body
+
+        except EngineError as e:
+            await asyncio.to_thread(refund_on_error, caller, cost, e)
+            return error_response(e)
+        except Exception as e:
+            logger.exception(f"Error generating image: {e}")
+            await asyncio.to_thread(refund_on_error, caller, cost, e)
+            return JSONResponse(status_code=500, content={"error": str(e)})
+
+    async def admit_captions(request: Request, authorization: Optional[str], images: int) -> Tuple[str, float]:
+        """Charge the caller for captioning images; (caller, cost)"""
+        caller = await asyncio.to_thread(user_key, authorization, request.client.host if request.client else None)
+        return caller, await asyncio.to_thread(admit_caption, caller, images)
+
+    async def caption(request: Request, authorization: Optional[str], image: UploadFile, question: Optional[str],
+                      decoding_fields: tuple, stream: bool = False):
+        logger.info(f"Received image-to-text request with question: {(question or '')[:50]}...")
+        caller, cost = None, None
+        try:
+            decoding = DecodingOptions.parse(*decoding_fields)
+            if stream:
+                decoding.check_streamable()
+            with stage(CAPTION_STAGE_SECONDS, "upload_read"):
+                img_bytes = await image.read()
+            caller, cost = await admit_captions(request, authorization, 1)
+            if stream:
+                return StreamingResponse(caption_events(img_bytes, question, decoding, caller, cost),
+                                         media_type="text/event-stream", headers=SSE_HEADERS)
+            with stage(CAPTION_STAGE_SECONDS, "backend"):
+                text = await backend.caption(img_bytes, question, decoding)
+            logger.info(f"Generated text: {text[:100]}...")
+            return {"message": "Text generated successfully", "text": text, "question": question}
+        except EngineError as e:
+            await asyncio.to_thread(refund_on_error, caller, cost, e)
+            return error_response(e)
+        except Exception as e:
+            logger.exception(f"Error in image-to-text: {e}")
+            await asyncio.to_thread(refund_on_error, caller, cost, e)
+            return JSONResponse(status_code=500, content={"error": str(e)})
+
+    async def caption_events(img_bytes: bytes, question: Optional[str], decoding: DecodingOptions,
+                             caller: str, cost: float):
+        # Headers are sent by now: failures become an error event
+        pieces = []
+        try:
+            with stage(CAPTION_STAGE_SECONDS, "backend"):
+                async for piece in backend.caption_stream(img_bytes, question, decoding):
+                    pieces.append(piece)
+                    yield sse({"token": piece})
+            text = "".join(pieces)
+            logger.info(f"Generated text: {text[:100]}...")
+            yield sse({"message": "Text generated successfully", "text": text, "question": question}, "done")
+        except EngineError as e:
+            await asyncio.to_thread(refund_on_error, caller, cost, e)
+            yield sse(e.to_dict(), "error")
+        except Exception as e:
+            logger.exception(f"Error in image-to-text: {e}")
+            await asyncio.to_thread(refund_on_error, caller, cost, e)
+            yield sse({"error": str(e)}, "error")
+
+    @app.post("/image-to-text")
+    async def image_to_text(
+        request: Request,
+        image: UploadFile = File(...),
+        question: str = Form("Describe this image in detail."),
+        max_new_tokens: Optional[str] = Form(None),
+        num_beams: Optional[str] = Form(None),
+        early_stopping: Optional[str] = Form(None),
+        max_length: Optional[str] = Form(None),
+        authorization: Optional[str] = Header(None),
+    ):
+        """Generate text description from an image"""
+        return await caption(request, authorization, image, question,
+                             (max_new_tokens, num_beams, early_stopping, max_length))
+
+    @app.post("/image-to-text/stream")
+    async def image_to_text_stream(
+        request: Request,
+        image: UploadFile = File(...),
+        question: str = Form("Describe this image in detail."),
+        max_new_tokens: Optional[str] = Form(None),
+        num_beams: Optional[str] = Form(None),
+        early_stopping: Optional[str] = Form(None),
+        max_length: Optional[str] = Form(None),
+        authorization: Optional[str] = Header(None),
+    ):
+        """/image-to-text as server-sent events: {"token"} while decoding, then "done" with the text"""
+        return await caption(request, authorization, image, question,
+                             (max_new_tokens, num_beams, early_stopping, max_length), stream=True)
+
+    @app.post("/image-to-text/bulk")
+    async def image_to_text_bulk(
+        request: Request,
+        images: List[UploadFile] = File([]),
+        archive: Optional[UploadFile] = File(None),
+        question: str = Form("Describe this image in detail."),
+        max_new_tokens: Optional[str] = Form(None),
+        num_beams: Optional[str] = Form(None),
+        early_stopping: Optional[str] = Form(None),
+        max_length: Optional[str] = Form(None),
+        authorization: Optional[str] = Header(None),
+    ):
+        """/image-to-text for several "images" files or a zip "archive": JSON lines as batches finish"""
+        try:
+            decoding = DecodingOptions.parse(max_new_tokens, num_beams, early_stopping, max_length)
+            bulk.check_count(len(images))
+            with stage(CAPTION_STAGE_SECONDS, "upload_read"):
+                files = [(image.filename or f"image-{i}", await image.read()) for i, image in enumerate(images)]
+                data = await archive.read(bulk.ARCHIVE_READ_LIMIT) if archive is not None else None
+                uploads = bulk.collect_uploads(files, data)
+            # One request, charged for every image up front; images that get no caption are given back
+            caller, _ = await admit_captions(request, authorization, len(uploads))
+        except EngineError as e:
+            return error_response(e)
+        logger.info(f"Received bulk image-to-text request for {len(uploads)} images")
+        return StreamingResponse(
+            bulk.caption_results(backend, uploads, question, decoding,
+                                 refund=lambda images, e: refund_captions(caller, images, e)),
+            media_type="application/x-ndjson")
+
+    @app.post("/img2text")
+    async def img2text(
+        request: Request,
+        image: UploadFile = File(...),
+        question: Optional[str] = Form(None),
+        max_new_tokens: Optional[str] = Form(None),
+        num_beams: Optional[str] = Form(None),
+        early_stopping: Optional[str] = Form(None),
+        max_length: Optional[str] = Form(None),
+        authorization: Optional[str] = Header(None),
+    ):
+        """Alias of /image-to-text kept for older cloud clients"""
+        return await caption(request, authorization, image, question,
+                             (max_new_tokens, num_beams, early_stopping, max_length))
+
+    # Only when predictions are created with a webhook, and its signatures can be checked
+    if isinstance(backend, ReplicateBackend) and backend.replicate.webhook_url and backend.replicate.webhook_secret:
+        @app.post("/replicate/webhook")
+        async def replicate_webhook(request: Request):
+            """Receive completed predictions pushed by Replicate"""
+            body = await request.body()
+            if not backend.replicate.verify_webhook(request.headers, body):
+                return JSONResponse(status_code=401, content={"error": "Invalid webhook signature"})
+            try:
+                prediction = json.loads(body)
+            except ValueError:
+                return JSONResponse(status_code=400, content={"error": "Invalid JSON body"})
+            if not isinstance(prediction, dict):
+                return JSONResponse(status_code=400, content={"error": "Expected a prediction object"})
+            backend.replicate.resolve_webhook(prediction)
+            return {"success": True}
+
+    app.include_router(auth_router())
+    if auth.ADMIN_TOKEN:
+        app.include_router(admin_router())
+
+    # Same-origin frontend (SERVE_FRONTEND=source|dist); mounted last so API routes win
+    frontend = mount_frontend(app)
+    app.state.frontend = frontend
+    return app
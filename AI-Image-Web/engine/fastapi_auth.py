@@ -0,0 +1,59 @@
+"""
+FastAPI routes for accounts and sessions
+Kept apart from engine.fastapi_app so an auth-only app (auth_api.py) starts
+without importing the backends, httpx and the image pipeline.
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Form, Header, Request
+from fastapi.responses import JSONResponse
+
+from . import auth
+
+
+def reply(result) -> JSONResponse:
+    status, body = result
+    return JSONResponse(status_code=status, content=body)
+
+
+def auth_router() -> APIRouter:
+    """/register, /login, /logout, /verify and /my-images"""
+    router = APIRouter()
+
+    @router.post("/register")
+    async def register(
+        username: str = Form(...),
+        email: str = Form(...),
+        password: str = Form(...),
+        full_name: Optional[str] = Form(None)
+    ):
+        """Register a new user"""
+        return reply(auth.register(username, email, password, full_name))
+
+    @router.post("/login")
+    async def login(
+        request: Request,
+        username: str = Form(...),
+        password: str = Form(...),
+        user_agent: Optional[str] = Header(None)
+    ):
+        """Login a user and return session token"""
+        client_host = request.client.host if request.client else None
+        return reply(auth.login(username, password, user_agent=user_agent, ip_address=client_host))
+
+    @router.post("/logout")
+    async def logout(authorization: Optional[str] = Header(None)):
+        """Logout a user by invalidating their session"""
+        return reply(auth.logout(authorization))
+
+    @router.get("/verify")
+    async def verify_session(authorization: Optional[str] = Header(None)):
+        """Verify if a session token is valid"""
+        return reply(auth.verify(authorization))
+
+    @router.get("/my-images")
+    async def get_my_images(authorization: Optional[str] = Header(None)):
+        """Get the current user's generated images"""
+        return reply(auth.my_images(authorization))
+
+    return router
@@ -0,0 +1,273 @@
+"""
+Flask adapter: the same HTTP surface as the FastAPI adapter for WSGI servers
+Uses the backends' blocking entry points (generate_sync / caption_sync).
+"""
+import base64
+import logging
+import time
+
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+from flask_cors import CORS
+
+import metrics
+import tracing
+from image_relay import make_thumbnail
+from metrics import CAPTION_STAGE_SECONDS, GENERATE_STAGE_SECONDS
+from quota import get_quota_manager, user_key
+from tracing import stage
+from . import auth, bulk
+from .backends import Backend, get_backend
+from .core import (CORS_ORIGINS, SSE_HEADERS, DecodingOptions, EngineError, GenerationRequest, admit, admit_caption,
+                   parse_thumbnail, refund_captions, refund_on_error, save_images, sse)
+
+logger = logging.getLogger(__name__)
+
+
+def error_response(e: EngineError):
+    return jsonify(e.to_dict()), e.status_code, e.headers
+
+
+def reply(result):
+    status, body = result
+    return jsonify(body), status
+
+
+def create_app(default_backend: str = "webui") -> Flask:
+    """Build the Flask app around the backend selected by ENGINE_BACKEND (or default_backend)"""
+    backend: Backend = get_backend(default=default_backend)
+    auth.init_database()
+    get_quota_manager()
+    app = Flask(__name__)
+    CORS(app, origins=CORS_ORIGINS)
+    app.config["backend"] = backend
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_endpoint = request.url_rule.rule if request.url_rule else "other"
+        g.metrics_start = time.perf_counter()
+        metrics.HTTP_IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc=None):
+        endpoint = g.pop("metrics_endpoint", None)
+        if endpoint is None:
+            return
+        metrics.HTTP_SECONDS.labels(endpoint).observe(time.perf_counter() - g.pop("metrics_start"))
+        metrics.HTTP_REQUESTS.labels(endpoint, str(g.pop("metrics_status", 500))).inc()
+        metrics.HTTP_IN_FLIGHT.labels(endpoint).dec()
+
+    if tracing.TRACING_ENABLED:
+        @app.before_request
+        def start_request_span():
+            route = request.url_rule.rule if request.url_rule else None
+            span = tracing.start_span(f"{request.method} {route}" if route else request.method, tracing.SERVER, {
+                "http.request.method": request.method,
+                "url.path": request.path,
+                **({"http.route": route} if route else {}),
+            }, traceparent=request.headers.get("traceparent"))
+            g.trace_span, g.trace_token = span, tracing.attach(span)
+
+        @app.after_request
+        def record_span_status(response):
+            span = g.get("trace_span")
+            if span is not None:
+                span.set_attribute("http.response.status_code", response.status_code)
+                if response.status_code >= 500:
+                    span.set_error(f"HTTP {response.status_code}")
+            return response
+
+        @app.teardown_request
+        def end_request_span(exc=None):
+            span = g.pop("trace_span", None)
+            if span is None:
+                return
+            if exc is not None:
+                span.set_error(f"{type(exc).__name__}: {exc}")
+            tracing.detach(g.pop("trace_token"))
+            span.end()
+
+    @app.route("/")
+    def home():
+        return jsonify({"status": "API running successfully", **backend.status()})
+
+    @app.route("/metrics")
+    def get_metrics():
+        """Prometheus scrape endpoint (this worker's metrics)"""
+        return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+    @app.route("/generate", methods=["POST"])
+    def generate_image():
+        """Generate an image with the configured backend"""
+        form = request.form
+        mode = form.get("mode", "txt2img")
+        init_image = request.files.get("init_image")
+        caller, cost = user_key(request.headers.get("Authorization"), request.remote_addr), None
+        try:
+            with stage(GENERATE_STAGE_SECONDS, "upload_read"):
+                init_bytes = init_image.read() if init_image and init_image.filename and mode == "img2img" else None
+            req = GenerationRequest(
+                prompt=form.get("prompt", ""),
+                negative_prompt=form.get("negative_prompt", ""),
+                steps=int(form.get("steps", 30)),
+                cfg_scale=float(form.get("cfg_scale", 7.0)),
+                width=int(form.get("width", 512)),
+                height=int(form.get("height", 512)),
+                sampler_name=form.get("sampler_name", "DPM++ 2M Karras"),
+                seed=int(form.get("seed", -1)),
+                batch_size=int(form.get("batch_size", 1)),
+                n_iter=int(form.get("n_iter", 1)),
+                mode=mode,
+                denoising_strength=float(form.get("denoising_strength", 0.75)),
+                init_image=init_bytes,
+            )
+            logger.info(f"Received request - mode: {mode}, prompt: {req.prompt[:50]}...")
+            thumbnail = parse_thumbnail(form.get("thumbnail"))
+            with stage(GENERATE_STAGE_SECONDS, "admit"):
+                cost = admit(backend, req, caller)
+            with stage(GENERATE_STAGE_SECONDS, "backend"):
+                result = backend.generate_sync(req)
+
+            file_name = save_images(result)[0]
+            logger.info(f"Image saved to {file_name}")
+            if form.get("response_format") == "image":
+                return Response(base64.b64decode(result.images[0]), mimetype="image/png",
+                                headers={"X-File": file_name})
+            body = {
+                "message": "Image generated successfully",
+                "image": result.images[0],
+                "file": file_name,
+                "seed": result.seed,
+            }
+            if thumbnail:
+                with stage(GENERATE_STAGE_SECONDS, "thumbnail"):
+                    body["thumbnail"] = make_thumbnail(file_name, thumbnail)
+            return jsonify(body)
+
+        except EngineError as e:
+            refund_on_error(caller, cost, e)
+            return error_response(e)
+        except Exception as e:
+            logger.exception(f"Error generating image: {e}")
+            refund_on_error(caller, cost, e)
+            return jsonify({"error": str(e)}), 500
+
+    def caption(question, stream=False):
+        image_file = request.files.get("image")
+        if image_file is None:
+            return jsonify({"error": "No image file provided"}), 400
+        if image_file.filename == "":
+            return jsonify({"error": "No image file selected"}), 400
+        form = request.form
+        logger.info(f"Received image-to-text request with question: {(question or '')[:50]}...")
+        caller, cost = user_key(request.headers.get("Authorization"), request.remote_addr), None
+        try:
+            decoding = DecodingOptions.parse(form.get("max_new_tokens"), form.get("num_beams"),
+                                             form.get("early_stopping"), form.get("max_length"))
+            if stream:
+                decoding.check_streamable()
+            with stage(CAPTION_STAGE_SECONDS, "upload_read"):
+                img_bytes = image_file.read()
+            cost = admit_caption(caller)
+            if stream:
+                return Response(stream_with_context(caption_events(img_bytes, question, decoding, caller, cost)),
+                                mimetype="text/event-stream", headers=SSE_HEADERS)
+            with stage(CAPTION_STAGE_SECONDS, "backend"):
+                text = backend.caption_sync(img_bytes, question, decoding)
+            logger.info(f"Generated text: {text[:100]}...")
+            return jsonify({"message": "Text generated successfully", "text": text, "question": question})
+        except EngineError as e:
+            refund_on_error(caller, cost, e)
+            return error_response(e)
+        except Exception as e:
+            logger.exception(f"Error in image-to-text: {e}")
+            refund_on_error(caller, cost, e)
+            return jsonify({"error": str(e)}), 500
+
+    def caption_events(img_bytes, question, decoding, caller, cost):
+        # Headers are sent by now: failures become an error event
+        pieces = []
+        try:
+            with stage(CAPTION_STAGE_SECONDS, "backend"):
+                for piece in backend.caption_stream_sync(img_bytes, question, decoding):
+                    pieces.append(piece)
+                    yield sse({"token": piece})
+            text = "".join(pieces)
+            logger.info(f"Generated text: {text[:100]}...")
+            yield sse({"message": "Text generated successfully", "text": text, "question": question}, "done")
+        except EngineError as e:
+            refund_on_error(caller, cost, e)
+            yield sse(e.to_dict(), "error")
+        except Exception as e:
+            logger.exception(f"Error in image-to-text: {e}")
+            refund_on_error(caller, cost, e)
+            yield sse({"error": str(e)}, "error")
+
+    @app.route("/image-to-text", methods=["POST"])
+    def image_to_text():
+        """Generate text description from an image"""
+        return caption(request.form.get("question", "Describe this image in detail."))
+
+    @app.route("/image-to-text/stream", methods=["POST"])
+    def image_to_text_stream():
+        """/image-to-text as server-sent events: {"token"} while decoding, then "done" with the text"""
+        return caption(request.form.get("question", "Describe this image in detail."), stream=True)
+
+    @app.route("/image-to-text/bulk", methods=["POST"])
+    def image_to_text_bulk():
+        """/image-to-text for several "images" files or a zip "archive": JSON lines as batches finish"""
+        form = request.form
+        archive = request.files.get("archive")
+        try:
+            decoding = DecodingOptions.parse(form.get("max_new_tokens"), form.get("num_beams"),
+                                             form.get("early_stopping"), form.get("max_length"))
+            images = request.files.getlist("images")
+            bulk.check_count(len(images))
+            with stage(CAPTION_STAGE_SECONDS, "upload_read"):
+                files = [(image.filename or f"image-{i}", image.read()) for i, image in enumerate(images)]
+                data = archive.read(bulk.ARCHIVE_READ_LIMIT) if archive is not None else None
+                uploads = bulk.collect_uploads(files, data)
+            # One request, charged for every image up front; images that get no caption are given back
+            caller = user_key(request.headers.get("Authorization"), request.remote_addr)
+            admit_caption(caller, len(uploads))
+        except EngineError as e:
+            return error_response(e)
+        logger.info(f"Received bulk image-to-text request for {len(uploads)} images")
+        question = form.get("question", "Describe this image in detail.")
+        results = bulk.caption_results_sync(backend, uploads, question, decoding,
+                                            refund=lambda images, e: refund_captions(caller, images, e))
+        return Response(stream_with_context(results), mimetype="application/x-ndjson")
+
+    @app.route("/img2text", methods=["POST"])
+    def img2text():
+        """Alias of /image-to-text kept for older cloud clients"""
+        return caption(request.form.get("question"))
+
+    @app.route("/register", methods=["POST"])
+    def register():
+        form = request.form
+        return reply(auth.register(form.get("username", ""), form.get("email", ""), form.get("password", ""),
+                                   form.get("full_name")))
+
+    @app.route("/login", methods=["POST"])
+    def login():
+        return reply(auth.login(request.form.get("username", ""), request.form.get("password", ""),
+                                user_agent=request.headers.get("User-Agent"), ip_address=request.remote_addr))
+
+    @app.route("/logout", methods=["POST"])
+    def logout():
+        return reply(auth.logout(request.headers.get("Authorization")))
+
+    @app.route("/verify")
+    def verify_session():
+        return reply(auth.verify(request.headers.get("Authorization")))
+
+    @app.route("/my-images")
+    def get_my_images():
+        return reply(auth.my_images(request.headers.get("Authorization")))
+
+    return app
@@ -0,0 +1,30 @@
+"""
+Run engine coroutines from synchronous code (the Flask adapter)
+One event loop per process, on a daemon thread, so pooled async clients
+are shared by every request thread. Started lazily, so a server that
+imports the app before forking (gunicorn preload_app) starts it per worker.
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _loop_pid
+    if _loop is None or _loop_pid != os.getpid():
+        with _lock:
+            if _loop is None or _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="engine-loop", daemon=True).start()
+                _loop, _loop_pid = loop, os.getpid()
+    return _loop
+
+
+def run_sync(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the engine loop and block until it finishes"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result(timeout)
@@ -0,0 +1,74 @@
+"""
+Serve the static frontend from the FastAPI app itself
+With the pages and the API on one origin, the browser makes no CORS
+preflights and config.js gives the page scripts relative API paths.
+
+Enable with SERVE_FRONTEND=source (the files next to this module) or
+SERVE_FRONTEND=dist (the output of build_assets.py).
+"""
+import os
+import logging
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from serve import ROOT, StaticCache, build_response
+
+logger = logging.getLogger(__name__)
+
+SERVE_FRONTEND = os.environ.get("SERVE_FRONTEND", "").lower()
+
+
+def frontend_root(mode=SERVE_FRONTEND):
+    """Directory to serve for a SERVE_FRONTEND mode, or None when disabled"""
+    if mode in ("", "0", "false", "off", "no"):
+        return None
+    if mode == "dist":
+        return os.path.join(ROOT, "dist")
+    return ROOT
+
+
+class FrontendApp:
+    """ASGI app serving cached, precompressed static files with ETags"""
+
+    def __init__(self, root):
+        self.cache = StaticCache(root)
+
+    def response(self, path, headers, method="GET"):
+        """Build the response for a static path (also used for the / route)"""
+        # Only frontend files: the cache resolves nothing else
+        static_file = self.cache.get(path)
+        if static_file is None:
+            return Response("Not Found", status_code=404, media_type="text/plain")
+
+        status, response_headers, body = build_response(static_file, headers)
+        response = Response(body if method != "HEAD" else b"", status_code=status)
+        response.raw_headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response_headers]
+        return response
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            response = Response("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        else:
+            response = self.response(scope["path"], Headers(scope=scope), scope["method"])
+        await response(scope, receive, send)
+
+
+def mount_frontend(app, mode=SERVE_FRONTEND):
+    """
+    Mount the frontend under / after the API routes (routes win on conflicts)
+    Returns the FrontendApp, or None when SERVE_FRONTEND is off
+    """
+    root = frontend_root(mode)
+    if root is None:
+        return None
+    if not os.path.isdir(root):
+        logger.error(f"Frontend directory {root} not found; run build_assets.py first")
+        return None
+
+    frontend = FrontendApp(root)
+    app.mount("/", frontend, name="frontend")
+    logger.info(f"Serving frontend from {root}")
+    return frontend
@@ -0,0 +1,49 @@
+"""
+Production server settings for api_flask.py
+Run: gunicorn -c gunicorn.conf.py api_flask:app
+
+Workers default to gthread: each worker process serves FLASK_THREADS
+requests at once, so a /generate waiting on the WebUI only holds a thread.
+FLASK_WORKER_CLASS=gevent (pip install gevent) suits proxy-only deployments
+with many slow clients; keep gthread when /image-to-text runs BLIP, since
+inference would block the gevent hub.
+
+PRELOAD_BLIP=true loads BLIP in the master before forking so every worker
+shares the weights copy-on-write instead of loading its own copy (CPU only).
+"""
+import multiprocessing
+import os
+import sys
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('API_PORT', 8000)}"
+worker_class = os.environ.get("FLASK_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("WEB_CONCURRENCY", min(4, cpu_count + 1)))
+threads = int(os.environ.get("FLASK_THREADS", 16))
+# gthread: accept no more connections than threads, so a worker whose threads
+# are all busy leaves new (keep-alive) clients to an idle worker
+worker_connections = int(os.environ.get("FLASK_WORKER_CONNECTIONS", threads if worker_class == "gthread" else 1000))
+
+# A generation can take WEBUI_TIMEOUT seconds; leave room before the worker is killed
+timeout = int(float(os.environ.get("WEBUI_TIMEOUT", 120))) + 60
+graceful_timeout = 30
+keepalive = 5
+
+preload_app = os.environ.get("PRELOAD_BLIP", "false").lower() in ("1", "true", "yes")
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    if preload_app and worker_class == "gevent":
+        server.log.warning("PRELOAD_BLIP with gevent imports the app before monkey patching; prefer gthread")
+
+
+def post_fork(server, worker):
+    # Split the cores between workers instead of every worker's torch using all of them
+    if "torch" in sys.modules:
+        import torch
+
+        torch.set_num_threads(max(1, cpu_count // workers))
@@ -0,0 +1,122 @@
+"""
+Streaming relay for generated images
+Pipes a remote image to local storage and the HTTP response chunk by chunk,
+so a request never holds the whole image (or its base64 form) in memory
+"""
+import asyncio
+import base64
+import json
+import os
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+OUTPUT_DIR = "output"
+
+
+class Base64ChunkEncoder:
+    """Incremental base64 encoder that carries leftover bytes between chunks"""
+
+    def __init__(self):
+        self._remainder = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self._remainder + chunk
+        cut = len(data) - len(data) % 3
+        self._remainder = data[cut:]
+        return base64.b64encode(data[:cut])
+
+    def flush(self) -> bytes:
+        data, self._remainder = self._remainder, b""
+        return base64.b64encode(data)
+
+
+def output_path(suffix: str = ".png") -> str:
+    """Pick a timestamped file name under output/"""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    return os.path.join(OUTPUT_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{suffix}")
+
+
+def make_thumbnail(file_path: str, max_side: int) -> str:
+    """Write a JPEG thumbnail next to the image and return its path"""
+    from PIL import Image
+
+    thumb_path = os.path.splitext(file_path)[0] + "_thumb.jpg"
+    with Image.open(file_path) as img:
+        # draft() lets JPEG sources decode at reduced scale
+        img.draft("RGB", (max_side, max_side))
+        img.thumbnail((max_side, max_side))
+        img.convert("RGB").save(thumb_path, "JPEG", quality=85)
+    return thumb_path
+
+
+async def open_image_stream(client: httpx.AsyncClient, url: str) -> httpx.Response:
+    """Start downloading an image; the caller must close the response"""
+    response = await client.send(client.build_request("GET", url), stream=True)
+    if response.status_code != 200:
+        await response.aclose()
+        raise httpx.HTTPStatusError(
+            f"Image download failed: {response.status_code}", request=response.request, response=response
+        )
+    return response
+
+
+def relayed_length(response: httpx.Response) -> Optional[str]:
+    """
+    The upstream Content-Length, when it is also the relayed body's length
+    aiter_bytes() undoes any Content-Encoding, so an encoded body's length doesn't apply.
+    """
+    if response.headers.get("content-encoding", "identity") != "identity":
+        return None
+    return response.headers.get("content-length")
+
+
+async def tee_to_file(response: httpx.Response, file_path: str) -> AsyncIterator[bytes]:
+    """Yield image chunks while writing them to file_path"""
+    part_path = file_path + ".part"
+    try:
+        with open(part_path, "wb") as f:
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                f.write(chunk)
+                yield chunk
+        os.replace(part_path, file_path)
+        logger.info(f"Image saved to {file_path}")
+    finally:
+        await response.aclose()
+        if os.path.exists(part_path):
+            # Client went away or upstream broke mid-stream
+            os.remove(part_path)
+
+
+async def stream_image(response: httpx.Response, file_path: str,
+                       thumbnail: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Relay raw image bytes, then thumbnail the saved copy"""
+    async for chunk in tee_to_file(response, file_path):
+        yield chunk
+    if thumbnail:
+        await asyncio.to_thread(make_thumbnail, file_path, thumbnail)
+
+
+async def stream_json(response: httpx.Response, file_path: str, fields: dict,
+                      thumbnail: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Relay the image as the JSON body the frontend expects
+    ({"message", "image", "file", ...}), base64-encoding chunk by chunk
+    """
+    head = json.dumps({**fields, "file": file_path})
+    yield head[:-1].encode("utf-8") + b', "image": "'
+
+    encoder = Base64ChunkEncoder()
+    async for chunk in tee_to_file(response, file_path):
+        yield encoder.feed(chunk)
+    yield encoder.flush() + b'"'
+
+    if thumbnail:
+        thumb_path = await asyncio.to_thread(make_thumbnail, file_path, thumbnail)
+        yield b', "thumbnail": ' + json.dumps(thumb_path).encode("utf-8")
+    yield b"}"
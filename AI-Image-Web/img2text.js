@@ -1,3 +1,5 @@
+// API_URL and API_HEADERS come from config.js, loaded first by each page
+
 // Image preview functionality
 const inputImage = document.getElementById('input_image');
 const imagePreview = document.getElementById('image-preview');
@@ -22,12 +24,12 @@ clearImageBtn.addEventListener('click', () => {
     previewContainer.style.display = 'none';
 });
 
-// Max length slider
-const maxLengthSlider = document.getElementById('max_length');
-const maxLengthDisplay = document.getElementById('max_length_display');
+// Max new tokens slider
+const maxTokensSlider = document.getElementById('max_new_tokens');
+const maxTokensDisplay = document.getElementById('max_new_tokens_display');
 
-maxLengthSlider.addEventListener('input', (e) => {
-    maxLengthDisplay.textContent = e.target.value;
+maxTokensSlider.addEventListener('input', (e) => {
+    maxTokensDisplay.textContent = e.target.value;
 });
 
 // Quick prompt buttons
@@ -93,11 +95,35 @@ document.getElementById('copy-text').addEventListener('click', () => {
     });
 });
 
+// Read a text/event-stream response, calling onEvent(name, data) for each event
+async function readEvents(res, onEvent) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let end;
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            let name = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event: ')) name = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (data) onEvent(name, JSON.parse(data));
+        }
+    }
+}
+
 // Main analyze function
 document.getElementById('analyze').addEventListener('click', async () => {
     const imageFile = inputImage.files[0];
     const question = questionTextarea.value.trim() || "Describe this image in detail.";
-    const maxLength = maxLengthSlider.value;
+    const maxNewTokens = maxTokensSlider.value;
     
     if (!imageFile) {
         alert('Please upload an image first!');
@@ -109,28 +135,46 @@ document.getElementById('analyze').addEventListener('click', async () => {
     const formData = new FormData();
     formData.append('image', imageFile);
     formData.append('question', question);
-    formData.append('max_length', maxLength);
+    formData.append('max_new_tokens', maxNewTokens);
     
     try {
         console.log('Sending image-to-text request...');
         console.log('Question:', question);
-        console.log('Max length:', maxLength);
+        console.log('Max new tokens:', maxNewTokens);
         
-        const res = await fetch('http://127.0.0.1:8000/image-to-text', {
+        // Tokens are shown as BLIP decodes them
+        const res = await fetch(`${API_URL}/image-to-text/stream`, {
             method: 'POST',
-            body: formData
+            body: formData,
+            headers: API_HEADERS
         });
         
-        const data = await res.json();
-        console.log('Response:', data);
-        
-        if (data.text) {
-            showResult(data.text, data.question);
-        } else if (data.error) {
-            alert('Error: ' + data.error);
+        if (!res.ok || !(res.headers.get('content-type') || '').startsWith('text/event-stream')) {
+            const data = await res.json();
+            alert('Error: ' + (data.error || 'Failed to analyze image.'));
             console.error('API Error:', data.error);
-        } else {
-            alert('Failed to analyze image. No text returned.');
+            return;
+        }
+        
+        let text = '';
+        let finished = false;
+        await readEvents(res, (name, data) => {
+            if (name === 'error') {
+                finished = true;
+                alert('Error: ' + data.error);
+                console.error('API Error:', data.error);
+            } else if (name === 'done') {
+                finished = true;
+                console.log('Response:', data);
+                showResult(data.text, data.question);
+            } else if (data.token) {
+                text += data.token;
+                toggleLoader(false);
+                showResult(text, question);
+            }
+        });
+        if (!finished) {
+            alert('Failed to analyze image. The connection closed early.');
         }
     } catch (e) {
         console.error('Error:', e);
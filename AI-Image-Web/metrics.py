@@ -0,0 +1,237 @@
+"""
+Prometheus-style metrics, served at /metrics in the text exposition format
+Counters, gauges and histograms live in this process; under gunicorn each
+worker reports its own. An update is a dict lookup, a bisect and a couple
+of additions under a lock, a few microseconds per request on the hot path.
+ENGINE_METRICS=false turns every update into a no-op.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+METRICS_ENABLED = os.environ.get("ENGINE_METRICS", "true").lower() not in ("0", "false", "no")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; covers a cache hit (ms) up to a slow WebUI generation (minutes)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REGISTRY: List["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Timer:
+    """Context manager observing its duration into a histogram child"""
+
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: "HistogramChild"):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class CounterChild:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        if METRICS_ENABLED:
+            with self.lock:
+                self.value += amount
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        if METRICS_ENABLED:
+            self.value = value
+
+    def track_inprogress(self):
+        return _InProgress(self)
+
+
+class _InProgress:
+    __slots__ = ("gauge",)
+
+    def __init__(self, gauge: GaugeChild):
+        self.gauge = gauge
+
+    def __enter__(self):
+        self.gauge.inc()
+
+    def __exit__(self, *exc):
+        self.gauge.dec()
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        if METRICS_ENABLED:
+            i = bisect.bisect_left(self.bounds, value)
+            with self.lock:
+                self.counts[i] += 1
+                self.sum += value
+
+    def time(self) -> Timer:
+        return Timer(self)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """The time series for these label values (created on first use)"""
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def samples(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self.children.items()):
+            lines.extend(self.samples(values, child))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def new_child(self):
+        return CounterChild()
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def new_child(self):
+        return GaugeChild()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def new_child(self):
+        return HistogramChild(self.buckets)
+
+    def time(self, *values) -> Timer:
+        return self.labels(*values).time()
+
+    def samples(self, values, child) -> List[str]:
+        with child.lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format_value(bound)
+            labels = _format_labels(self.labelnames, values, 'le="' + le + '"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def timed(histogram: Histogram, *values):
+    """Decorator observing every call's duration"""
+    def decorator(fn):
+        child = histogram.labels(*values)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def render() -> str:
+    """Every metric in the Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------------------------------
+# Application metrics
+# -------------------------------------------------
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by endpoint and status", ("endpoint", "status"))
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency", ("endpoint",))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served", ("endpoint",))
+
+GENERATE_STAGE_SECONDS = Histogram(
+    "generate_stage_seconds",
+    "Time spent in each stage of /generate (upload_read, admit, payload_encode, webui_request, "
+    "response_decode, queue_wait, inference, png_encode, replicate_upload, replicate_predict, download, backend, "
+    "base64_decode, file_write, thumbnail)",
+    ("stage",),
+)
+CAPTION_STAGE_SECONDS = Histogram(
+    "caption_stage_seconds",
+    "Time spent in each stage of /image-to-text (upload_read, blip_wait, blip_preprocess, "
+    "blip_generate, blip_decode, backend)",
+    ("stage",),
+)
+BLIP_FEATURE_CACHE = Counter("blip_feature_cache_total", "BLIP image-feature cache lookups by result (hit, miss)",
+                             ("result",))
+DB_SECONDS = Histogram("db_call_seconds", "Duration of database.py calls", ("operation",))
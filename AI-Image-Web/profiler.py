@@ -0,0 +1,248 @@
+"""
+Sampling profiler and slow-request capture, for stalls that don't show up in logs
+A profile samples every thread's Python stack (sys._current_frames) at a
+fixed interval from a thread of its own and returns the stacks folded, one
+"thread;frame;...;frame count" line per distinct stack: the input of
+flamegraph.pl, inferno and speedscope. Nothing samples between profiles.
+A watchdog thread snapshots every thread's stack, and the request's own
+coroutine stack, once a request has run for SLOW_REQUEST_SECONDS (0 turns
+capture off). When it finishes, it is kept with its per-stage timings in a
+ring buffer of the last SLOW_REQUEST_BUFFER. Both are per process.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", 10))
+SLOW_REQUEST_BUFFER = int(os.environ.get("SLOW_REQUEST_BUFFER", 50))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", 60))
+PROFILE_INTERVAL = 0.01  # 100 Hz
+PROFILE_MIN_INTERVAL = 0.001
+# Frames kept per stack; deeper ones (recursion) are cut at the root end
+MAX_DEPTH = 128
+
+
+class ProfilerBusy(RuntimeError):
+    """Only one profile runs at a time"""
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    # Relative to the sys.path entry it was imported from, like a module path
+    best = ""
+    for entry in sys.path:
+        if entry and filename.startswith(entry.rstrip(os.sep) + os.sep) and len(entry) > len(best):
+            best = entry
+    return filename[len(best):].lstrip(os.sep) if best else filename
+
+
+def _describe(code, lineno) -> str:
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{lineno})"
+
+
+def _frames(frame) -> list:
+    """(code, line) from the root of a thread's stack down to frame"""
+    frames = []
+    while frame is not None and len(frames) < MAX_DEPTH:
+        frames.append((frame.f_code, frame.f_lineno))
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def thread_stacks(skip: Optional[int] = None) -> Dict[str, List[str]]:
+    """Every thread's current stack, root first, by thread name"""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = {}
+    for ident, frame in sys._current_frames().items():
+        if ident != skip:
+            name = names.get(ident, f"thread-{ident}")
+            stacks[name] = [_describe(code, lineno) for code, lineno in _frames(frame)]
+    return stacks
+
+
+def task_stack(task) -> List[str]:
+    """The coroutine chain an asyncio task is suspended in, outermost first"""
+    stack = []
+    coro = task.get_coro() if task is not None else None
+    while coro is not None and len(stack) < MAX_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(_describe(frame.f_code, frame.f_lineno))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+
+# -------------------------------------------------
+# On-demand profiles
+# -------------------------------------------------
+
+_profile_lock = threading.Lock()
+
+
+class Sampler:
+    """Samples every other thread's stack from a daemon thread until stopped"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = max(PROFILE_MIN_INTERVAL, interval)
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def sample(self, skip: Optional[int] = None):
+        """Count every thread's current stack once"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != skip:
+                self.counts[(names.get(ident, f"thread-{ident}"), tuple(_frames(frame)))] += 1
+        self.samples += 1
+
+    def _run(self):
+        own = threading.get_ident()
+        next_at = time.perf_counter()
+        while not self._stop.is_set():
+            self.sample(skip=own)
+            next_at += self.interval
+            # Behind schedule (a long GIL holder): skip the missed samples rather than burst
+            next_at = max(next_at, time.perf_counter())
+            self._stop.wait(next_at - time.perf_counter())
+
+    def stop(self) -> str:
+        """Stop sampling and return the folded stacks"""
+        self._stop.set()
+        self._thread.join()
+        lines = []
+        for (name, frames), count in self.counts.most_common():
+            lines.append(";".join([name.replace(";", ":")] + [_describe(code, lineno) for code, lineno in frames])
+                         + f" {count}")
+        return "\n".join(lines) + "\n"
+
+
+def start_profile(interval: float = PROFILE_INTERVAL) -> Sampler:
+    """Start sampling; call stop_profile(sampler) to get the folded stacks. Raises ProfilerBusy."""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    sampler = Sampler(interval)
+    sampler._thread.start()
+    return sampler
+
+
+def stop_profile(sampler: Sampler) -> str:
+    try:
+        return sampler.stop()
+    finally:
+        _profile_lock.release()
+
+
+# -------------------------------------------------
+# Slow requests
+# -------------------------------------------------
+
+class RequestRecord:
+    """A request in flight, as the watchdog sees it"""
+
+    __slots__ = ("method", "path", "task", "started", "start", "timings", "stacks", "_token")
+
+    def __init__(self, method: str, path: str, task=None):
+        self.method = method
+        self.path = path
+        self.task = task
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.timings: list = []
+        self.stacks: Optional[dict] = None
+
+    def to_dict(self, duration: float, status: Optional[int] = None) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "started": round(self.started, 3),
+            "duration_ms": round(duration * 1000, 1),
+            "stages": [{"stage": name, "ms": round(seconds * 1000, 1)} for name, seconds in self.timings],
+            # Taken SLOW_REQUEST_SECONDS in; None if it finished before the watchdog looked
+            "stacks": self.stacks,
+        }
+
+
+SLOW_REQUESTS: deque = deque(maxlen=SLOW_REQUEST_BUFFER)
+_active: Dict[int, RequestRecord] = {}
+_watchdog_pid: Optional[int] = None
+_watchdog_lock = threading.Lock()
+
+
+def _watch():
+    # Checks a few times per threshold, so a snapshot is taken at most ~25% late
+    tick = min(1.0, max(0.05, SLOW_REQUEST_SECONDS / 4))
+    own = threading.get_ident()
+    while True:
+        time.sleep(tick)
+        now = time.perf_counter()
+        late = [r for r in list(_active.values()) if r.stacks is None and now - r.start >= SLOW_REQUEST_SECONDS]
+        if not late:
+            continue
+        # One snapshot of the threads per tick, however many requests crossed the line together
+        try:
+            threads = thread_stacks(skip=own)
+            for record in late:
+                record.stacks = {"at_ms": round((now - record.start) * 1000, 1), "task": task_stack(record.task),
+                                 "threads": threads}
+        except Exception as e:
+            logger.warning(f"Slow request snapshot failed: {e}")
+
+
+def _start_watchdog():
+    global _watchdog_pid
+    with _watchdog_lock:
+        # Per process: a thread started before fork does not exist in the child
+        if _watchdog_pid != os.getpid():
+            threading.Thread(target=_watch, name="slow-request-watchdog", daemon=True).start()
+            _watchdog_pid = os.getpid()
+
+
+def begin_request(method: str, path: str, task=None) -> Optional[RequestRecord]:
+    """Track a request (task: its asyncio task) and collect its stage timings; None when capture is off"""
+    if not SLOW_REQUEST_SECONDS:
+        return None
+    if _watchdog_pid != os.getpid():
+        _start_watchdog()
+    record = RequestRecord(method, path, task)
+    record._token = tracing.stage_timings.set(record.timings)
+    _active[id(record)] = record
+    return record
+
+
+def end_request(record: Optional[RequestRecord], status: Optional[int] = None):
+    if record is None:
+        return
+    _active.pop(id(record), None)
+    tracing.stage_timings.reset(record._token)
+    duration = time.perf_counter() - record.start
+    if duration >= SLOW_REQUEST_SECONDS:
+        stages = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in record.timings)
+        logger.warning(f"Slow request: {record.method} {record.path} took {duration:.2f}s ({stages or 'no stages'})")
+        SLOW_REQUESTS.append(record.to_dict(duration, status))
+    record.task = None
+
+
+def slow_requests() -> dict:
+    """Slow requests finished (newest first) and still running"""
+    now = time.perf_counter()
+    in_flight = [r.to_dict(now - r.start) for r in list(_active.values()) if now - r.start >= SLOW_REQUEST_SECONDS]
+    return {
+        "threshold_seconds": SLOW_REQUEST_SECONDS,
+        "pid": os.getpid(),
+        "in_flight": in_flight,
+        "finished": list(reversed(SLOW_REQUESTS)),
+    }
@@ -0,0 +1,177 @@
+"""
+Per-user rate limiting and GPU quota accounting
+Token buckets live in SQLite, so every worker process draws from the same
+ones; in memory (per process) only when the database module is unavailable
+"""
+import math
+import os
+import threading
+import time
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import database
+    DB_AVAILABLE = True
+except ImportError:
+    DB_AVAILABLE = False
+
+# Hard per-request limits
+MAX_STEPS = int(os.environ.get("QUOTA_MAX_STEPS", 100))
+MAX_SIDE = int(os.environ.get("QUOTA_MAX_SIDE", 1024))
+MAX_IMAGES = int(os.environ.get("QUOTA_MAX_IMAGES", 4))
+
+# Captioning: new tokens per answer, beams, and their product (decoder passes per answer)
+CAPTION_MAX_NEW_TOKENS = int(os.environ.get("CAPTION_MAX_NEW_TOKENS", 75))
+CAPTION_MAX_BEAMS = int(os.environ.get("CAPTION_MAX_BEAMS", 5))
+CAPTION_MAX_COST = int(os.environ.get("CAPTION_MAX_COST", 200))
+
+# Request rate: burst size and refill per minute
+RATE_BURST = float(os.environ.get("RATE_LIMIT_BURST", 5))
+RATE_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", 10))
+
+# GPU budget in cost units (one unit = one step of one 512x512 image)
+GPU_BURST = float(os.environ.get("GPU_QUOTA_BURST", 1000))
+GPU_PER_HOUR = float(os.environ.get("GPU_QUOTA_PER_HOUR", 3000))
+# GPU budget charged per captioned image
+CAPTION_COST = float(os.environ.get("GPU_QUOTA_CAPTION_COST", 2))
+
+BASE_PIXELS = 512 * 512
+
+
+def estimate_cost(steps: int, width: int, height: int, batch_size: int = 1, n_iter: int = 1) -> float:
+    """Estimate GPU cost as steps x pixels x images, in 512x512-step units"""
+    images = max(1, batch_size) * max(1, n_iter)
+    return max(1, steps) * (width * height / BASE_PIXELS) * images
+
+
+def validate_request(steps: int, width: int, height: int, batch_size: int = 1, n_iter: int = 1) -> Optional[str]:
+    """Check hard per-request limits. Returns an error message or None"""
+    if steps < 1 or steps > MAX_STEPS:
+        return f"steps must be between 1 and {MAX_STEPS}"
+    if width < 64 or height < 64 or width > MAX_SIDE or height > MAX_SIDE:
+        return f"width and height must be between 64 and {MAX_SIDE}"
+    if batch_size < 1 or n_iter < 1 or batch_size * n_iter > MAX_IMAGES:
+        return f"batch_size x n_iter must be between 1 and {MAX_IMAGES}"
+    if estimate_cost(steps, width, height, batch_size, n_iter) > GPU_BURST:
+        return "Request exceeds the per-request GPU budget"
+    return None
+
+
+def validate_thumbnail(max_side: int) -> Optional[str]:
+    """Check a requested thumbnail size (0: none). Returns an error message or None"""
+    if max_side < 0 or max_side > MAX_SIDE:
+        return f"thumbnail must be between 0 and {MAX_SIDE}"
+    return None
+
+
+def validate_caption(max_new_tokens: int, num_beams: int) -> Optional[str]:
+    """Check captioning decoding limits. Returns an error message or None"""
+    if max_new_tokens < 1 or max_new_tokens > CAPTION_MAX_NEW_TOKENS:
+        return f"max_new_tokens must be between 1 and {CAPTION_MAX_NEW_TOKENS}"
+    if num_beams < 1 or num_beams > CAPTION_MAX_BEAMS:
+        return f"num_beams must be between 1 and {CAPTION_MAX_BEAMS}"
+    if max_new_tokens * num_beams > CAPTION_MAX_COST:
+        return f"max_new_tokens x num_beams must be at most {CAPTION_MAX_COST}"
+    return None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, capacity: float, rate: float, tokens: Optional[float] = None, updated_at: Optional[float] = None):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity if tokens is None else tokens
+        self.updated_at = time.time() if updated_at is None else updated_at
+
+    def _refill(self, now: float):
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)"""
+        self._refill(now)
+        if self.tokens >= amount:
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= amount
+
+
+class QuotaManager:
+    """Tracks a request-rate bucket and a GPU-cost bucket per user"""
+
+    def __init__(self, use_database: bool = DB_AVAILABLE):
+        self.use_database = use_database
+        # Fallback buckets: without the database, or while it fails
+        self._lock = threading.Lock()
+        self._requests: Dict[str, TokenBucket] = {}
+        self._gpu: Dict[str, TokenBucket] = {}
+
+    def _buckets(self, user_key: str) -> Tuple[TokenBucket, TokenBucket]:
+        if user_key not in self._requests:
+            self._requests[user_key] = TokenBucket(RATE_BURST, RATE_PER_MINUTE / 60.0)
+        if user_key not in self._gpu:
+            self._gpu[user_key] = TokenBucket(GPU_BURST, GPU_PER_HOUR / 3600.0)
+        return self._requests[user_key], self._gpu[user_key]
+
+    def charge(self, user_key: str, cost: float) -> Tuple[bool, float]:
+        """
+        Charge one request of the given cost to a user
+        Returns: (allowed: bool, retry_after: seconds)
+        """
+        now = time.time()
+        if self.use_database:
+            retry_after = database.take_usage_tokens(
+                user_key, ((1, RATE_BURST, RATE_PER_MINUTE / 60.0), (cost, GPU_BURST, GPU_PER_HOUR / 3600.0)), now
+            )
+            if retry_after is not None:
+                return retry_after <= 0, retry_after
+            logger.error("Quota database unavailable; limiting per process")
+        with self._lock:
+            req_bucket, gpu_bucket = self._buckets(user_key)
+            retry_after = max(req_bucket.wait_time(1, now), gpu_bucket.wait_time(cost, now))
+            if retry_after > 0:
+                return False, retry_after
+
+            req_bucket.take(1)
+            gpu_bucket.take(cost)
+            return True, 0.0
+
+    def refund(self, user_key: str, cost: float):
+        """Give back a charge whose request failed on our side"""
+        if self.use_database and database.return_usage_tokens(user_key, ((1, RATE_BURST), (cost, GPU_BURST))):
+            return
+        with self._lock:
+            req_bucket, gpu_bucket = self._buckets(user_key)
+            req_bucket.tokens = min(req_bucket.capacity, req_bucket.tokens + 1)
+            gpu_bucket.tokens = min(gpu_bucket.capacity, gpu_bucket.tokens + cost)
+
+
+def user_key(authorization: Optional[str], client_host: Optional[str]) -> str:
+    """Identify the caller by session user id, falling back to client IP"""
+    if DB_AVAILABLE and authorization and authorization.startswith("Bearer "):
+        valid, user_data = database.verify_session(authorization.replace("Bearer ", ""))
+        if valid:
+            return f"user:{user_data['id']}"
+    return f"ip:{client_host or 'unknown'}"
+
+
+quota_manager: Optional[QuotaManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_quota_manager() -> QuotaManager:
+    """This process's QuotaManager, built on first use so importing quota touches no database"""
+    global quota_manager
+    with _manager_lock:
+        if quota_manager is None:
+            quota_manager = QuotaManager()
+        return quota_manager
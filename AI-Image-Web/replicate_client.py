@@ -0,0 +1,401 @@
+"""
+Shared Replicate client and prediction tracker
+One pooled httpx.AsyncClient per app; all outstanding predictions are polled
+from a single background loop with jittered exponential backoff and a global
+rate ceiling, or resolved early by Replicate webhooks when configured
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import math
+import os
+import random
+import re
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from quota import TokenBucket
+from tracing import attach, current_span, detach, traced
+
+logger = logging.getLogger(__name__)
+
+REPLICATE_API_URL = os.environ.get("REPLICATE_API_URL", "https://api.replicate.com")
+# Public URL of our /replicate/webhook endpoint and its signing secret; polling only unless both are set
+REPLICATE_WEBHOOK_URL = os.environ.get("REPLICATE_WEBHOOK_URL", "")
+REPLICATE_WEBHOOK_SECRET = os.environ.get("REPLICATE_WEBHOOK_SECRET", "")
+# Signed webhooks older or newer than this (seconds) are rejected as replays
+WEBHOOK_TOLERANCE = 300
+
+TERMINAL_STATUSES = {"succeeded", "failed", "canceled"}
+
+# Polling schedule (seconds)
+MIN_DELAY = 0.25
+MAX_DELAY = 5.0
+STARTING_DELAY = 1.0      # "starting" usually means a cold boot, so back off faster
+BACKOFF = 1.6
+JITTER = 0.2
+# Fallback poll interval while waiting on a webhook. A webhook reaches only the worker that
+# created the prediction with one worker or sticky routing; any other worker drops it, and the
+# request waits for this poll instead
+WEBHOOK_POLL_DELAY = 10.0
+
+# Global ceiling on status polls across all outstanding predictions
+MAX_POLLS_PER_SECOND = float(os.environ.get("REPLICATE_MAX_POLLS_PER_SECOND", 10))
+
+# Uploaded caption images: BLIP sees 384px inputs, Replicate keeps files ~24h
+CAPTION_INPUT_SIZE = 384
+FILE_CACHE_SIZE = 1024
+FILE_CACHE_TTL = 12 * 3600
+
+PROGRESS_RE = re.compile(r"(\d{1,3})%\|")
+
+
+class PredictionTimeout(Exception):
+    """Raised when a prediction does not finish before its deadline"""
+
+
+class InvalidImage(Exception):
+    """Raised when uploaded bytes can't be decoded as an image"""
+
+
+class TrackedPrediction:
+    """An outstanding prediction in the poller registry"""
+
+    def __init__(self, prediction: dict, future: asyncio.Future, registered_at: float):
+        self.prediction = prediction
+        self.future = future
+        self.registered_at = registered_at
+        self.next_poll_at = registered_at
+        self.processing_since: Optional[float] = None
+        self.attempt = 0
+        # The waiting request's span, so polls from the shared loop join its trace
+        self.span = current_span()
+
+    def elapsed(self, now: float) -> float:
+        """Seconds spent in the processing state so far"""
+        return now - self.processing_since if self.processing_since is not None else 0.0
+
+
+def downsize_image(img_bytes: bytes, max_side: int) -> Tuple[bytes, str]:
+    """Shrink an image so its longest side is at most max_side; returns (bytes, mime type), raises InvalidImage"""
+    from PIL import Image, ImageOps
+    import io
+
+    try:
+        img = Image.open(io.BytesIO(img_bytes))
+        mime = Image.MIME.get(img.format, "application/octet-stream")
+        if max(img.size) <= max_side and mime in ("image/jpeg", "image/png"):
+            # Already small enough: send the original bytes with their real type
+            return img_bytes, mime
+
+        img.draft("RGB", (max_side, max_side))
+        # The re-encoded JPEG carries no EXIF, so apply its orientation to the pixels
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((max_side, max_side), Image.BICUBIC)
+    except (OSError, Image.DecompressionBombError) as e:
+        # UnidentifiedImageError and truncated files are OSErrors
+        raise InvalidImage(f"Not a readable image ({type(e).__name__})") from e
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=90)
+    return out.getvalue(), "image/jpeg"
+
+
+def estimate_remaining(prediction: dict, elapsed: float) -> Optional[float]:
+    """Estimate seconds left from the progress bar in the prediction logs"""
+    matches = PROGRESS_RE.findall(prediction.get("logs") or "")
+    if not matches or elapsed <= 0:
+        return None
+    percent = int(matches[-1])
+    if percent <= 0 or percent >= 100:
+        return None
+    return elapsed * (100 - percent) / percent
+
+
+def next_delay(prediction: dict, attempt: int, elapsed: float = 0.0) -> float:
+    """Pick the next poll delay from the prediction status, ETA and attempt count"""
+    if prediction.get("status") == "starting":
+        delay = STARTING_DELAY * BACKOFF ** attempt
+    else:
+        delay = MIN_DELAY * BACKOFF ** attempt
+        eta = estimate_remaining(prediction, elapsed)
+        if eta is not None:
+            # Check back around halfway to the expected finish
+            delay = eta / 2
+    delay = min(MAX_DELAY, max(MIN_DELAY, delay))
+    return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def decode_webhook_secret(secret: str) -> bytes:
+    """The HMAC key in a "whsec_<base64>" signing secret; raises ValueError for anything else"""
+    prefix, _, encoded = secret.partition("_")
+    try:
+        key = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        key = b""
+    if prefix != "whsec" or not key:
+        raise ValueError("REPLICATE_WEBHOOK_SECRET must be whsec_ followed by base64, as Replicate shows it")
+    return key
+
+
+class ReplicateClient:
+    """App-scoped Replicate API client with pooled connections"""
+
+    def __init__(self, api_token: str, base_url: str = REPLICATE_API_URL,
+                 webhook_url: str = REPLICATE_WEBHOOK_URL, webhook_secret: str = REPLICATE_WEBHOOK_SECRET):
+        self.api_token = api_token
+        self.base_url = base_url.rstrip("/")
+        self.webhook_secret = webhook_secret
+        # Decoded once, so a malformed secret fails at startup rather than on every delivery
+        self.webhook_key = decode_webhook_secret(webhook_secret) if webhook_secret else b""
+        if webhook_url and not webhook_secret:
+            logger.warning("REPLICATE_WEBHOOK_URL is set without REPLICATE_WEBHOOK_SECRET; polling only")
+        # Unsigned webhooks can't be trusted, so without a secret there is no webhook at all
+        self.webhook_url = webhook_url if webhook_secret else ""
+        self.client: Optional[httpx.AsyncClient] = None
+        self._pending: Dict[str, TrackedPrediction] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._in_flight = set()
+        # (sha256, max_side) -> (file url, expires at)
+        self._files: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._rate = TokenBucket(MAX_POLLS_PER_SECOND, MAX_POLLS_PER_SECOND)
+
+    async def start(self):
+        """Open the shared connection pool and start the poller"""
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                # Limits belong to the transport; the client ignores its own when given one
+                transport=traced(httpx.AsyncHTTPTransport(
+                    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                )),
+            )
+        self._ensure_poller()
+
+    async def close(self):
+        """Stop the poller and close the shared connection pool"""
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        for task in list(self._in_flight):
+            task.cancel()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _headers(self) -> dict:
+        # Sent per request so the token never reaches output/CDN hosts
+        return {"Authorization": f"Token {self.api_token}"}
+
+    async def create_prediction(self, version: str, input: dict) -> httpx.Response:
+        """Start a prediction; returns the raw response (201 on success)"""
+        body = {"version": version, "input": input}
+        if self.webhook_url:
+            body["webhook"] = self.webhook_url
+            body["webhook_events_filter"] = ["completed"]
+        return await self.client.post(
+            f"{self.base_url}/v1/predictions", headers=self._headers(), json=body
+        )
+
+    async def upload_image(self, img_bytes: bytes, max_side: int = CAPTION_INPUT_SIZE) -> str:
+        """
+        Get a Replicate file reference for an uploaded image
+        The image is downsized to max_side first and uploaded once per content
+        hash; falls back to a small data URI if the files endpoint fails
+        """
+        key = (hashlib.sha256(img_bytes).hexdigest(), max_side)
+        loop = asyncio.get_running_loop()
+        cached = self._files.get(key)
+        if cached is not None and cached[1] > loop.time():
+            self._files.move_to_end(key)
+            return cached[0]
+
+        data, content_type = await asyncio.to_thread(downsize_image, img_bytes, max_side)
+        extension = ".jpg" if content_type == "image/jpeg" else ".png"
+        try:
+            response = await self.client.post(
+                f"{self.base_url}/v1/files",
+                headers=self._headers(),
+                files={"content": (f"{key[0][:16]}{extension}", data, content_type)},
+            )
+            response.raise_for_status()
+            url = response.json()["urls"]["get"]
+        except Exception as e:
+            logger.warning(f"File upload failed, sending inline image instead: {e}")
+            return f"data:{content_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+        self._files[key] = (url, loop.time() + FILE_CACHE_TTL)
+        while len(self._files) > FILE_CACHE_SIZE:
+            self._files.popitem(last=False)
+        return url
+
+    async def get_prediction(self, prediction_id: str) -> dict:
+        """Fetch the current state of a prediction"""
+        response = await self.client.get(
+            f"{self.base_url}/v1/predictions/{prediction_id}", headers=self._headers()
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def wait_for_prediction(self, prediction: dict, timeout: float) -> dict:
+        """
+        Wait until a prediction reaches a terminal status
+        Raises PredictionTimeout if it is still running after `timeout` seconds
+        """
+        if prediction.get("status") in TERMINAL_STATUSES:
+            return prediction
+
+        loop = asyncio.get_running_loop()
+        self._ensure_poller()
+
+        prediction_id = prediction["id"]
+        tracked = self._pending.get(prediction_id)
+        if tracked is None:
+            tracked = TrackedPrediction(prediction, loop.create_future(), loop.time())
+            tracked.next_poll_at = loop.time() + self._delay_for(tracked)
+            self._pending[prediction_id] = tracked
+            self._wakeup.set()
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(tracked.future), timeout)
+        except asyncio.TimeoutError:
+            raise PredictionTimeout(prediction_id)
+        finally:
+            self._pending.pop(prediction_id, None)
+
+    def _delay_for(self, tracked: "TrackedPrediction") -> float:
+        if self.webhook_url:
+            # Webhook is the fast path; polling is only a slow safety net
+            return WEBHOOK_POLL_DELAY
+        return next_delay(tracked.prediction, tracked.attempt, tracked.elapsed(asyncio.get_running_loop().time()))
+
+    def _ensure_poller(self):
+        if self._poller is None or self._poller.done():
+            self._wakeup = asyncio.Event()
+            self._poller = asyncio.get_running_loop().create_task(self._poll_loop())
+
+    async def _poll_loop(self):
+        """Poll every outstanding prediction from one loop under a global rate ceiling"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await self._poll_due(loop)
+            except Exception as e:
+                # The loop serves every waiting request; never let one bad pass end it
+                logger.exception(f"Replicate poller error: {e}")
+                await asyncio.sleep(MIN_DELAY)
+
+    async def _poll_due(self, loop: asyncio.AbstractEventLoop):
+        """One pass: start polls for the predictions that are due, or sleep until one is"""
+        now = loop.time()
+        due = sorted(
+            (t for t in self._pending.values() if t.next_poll_at <= now),
+            key=lambda t: t.next_poll_at,
+        )
+
+        if not due:
+            wake_at = min([now + 60] + [t.next_poll_at for t in self._pending.values()])
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0.0, wake_at - now))
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        # Spend at most the tokens the global bucket has right now
+        wait = self._rate.wait_time(1, time.time())
+        if wait > 0:
+            await asyncio.sleep(wait)
+            return
+        batch = due[:int(self._rate.tokens)]
+        self._rate.take(len(batch))
+
+        for tracked in batch:
+            # Not due again until this poll reschedules it
+            tracked.next_poll_at = math.inf
+            task = loop.create_task(self._poll_one(tracked))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _poll_one(self, tracked: "TrackedPrediction"):
+        try:
+            await self._update(tracked)
+        except Exception as e:
+            # Keep this prediction on the schedule; its request would otherwise wait out its timeout
+            logger.exception(f"Updating prediction {tracked.prediction.get('id')} failed: {e}")
+            tracked.attempt += 1
+            tracked.next_poll_at = asyncio.get_running_loop().time() + MAX_DELAY
+            self._wakeup.set()
+
+    async def _update(self, tracked: "TrackedPrediction"):
+        """Fetch one prediction, then resolve its request or schedule its next poll"""
+        loop = asyncio.get_running_loop()
+        prediction_id = tracked.prediction["id"]
+        token = attach(tracked.span)
+        try:
+            prediction = await self.get_prediction(prediction_id)
+        except Exception as e:
+            logger.warning(f"Polling prediction {prediction_id} failed: {e}")
+            prediction = tracked.prediction
+        finally:
+            detach(token)
+
+        if prediction.get("status") in TERMINAL_STATUSES:
+            if not tracked.future.done():
+                tracked.future.set_result(prediction)
+            self._pending.pop(prediction_id, None)
+            return
+
+        now = loop.time()
+        if prediction.get("status") == "processing" and tracked.processing_since is None:
+            tracked.processing_since = now
+        tracked.prediction = prediction
+        tracked.attempt += 1
+        tracked.next_poll_at = now + self._delay_for(tracked)
+        self._wakeup.set()
+
+    def verify_webhook(self, headers, body: bytes) -> bool:
+        """Check the webhook-signature header against REPLICATE_WEBHOOK_SECRET, and that it is recent"""
+        if not self.webhook_secret:
+            return False
+
+        webhook_id = headers.get("webhook-id", "")
+        timestamp = headers.get("webhook-timestamp", "")
+        signatures = headers.get("webhook-signature", "")
+        if not (webhook_id and timestamp and signatures):
+            return False
+        try:
+            if abs(time.time() - int(timestamp)) > WEBHOOK_TOLERANCE:
+                return False
+        except ValueError:
+            return False
+
+        signed = f"{webhook_id}.{timestamp}.".encode("utf-8") + body
+        expected = base64.b64encode(hmac.new(self.webhook_key, signed, hashlib.sha256).digest()).decode("utf-8")
+
+        for signature in signatures.split():
+            _, _, value = signature.partition(",")
+            if hmac.compare_digest(value, expected):
+                return True
+        return False
+
+    def resolve_webhook(self, prediction: dict) -> bool:
+        """Hand a completed prediction from a webhook to its waiting request"""
+        if prediction.get("status") not in TERMINAL_STATUSES:
+            return False
+        tracked = self._pending.get(prediction.get("id"))
+        if tracked is None or tracked.future.done():
+            # Not ours (other worker or already polled); the poller will catch it
+            return False
+        tracked.future.set_result(prediction)
+        return True
@@ -40,6 +40,14 @@ CREATE TABLE IF NOT EXISTS generated_images (
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
+-- Usage Counters Table (rate limit and GPU quota buckets, shared by every worker process)
+CREATE TABLE IF NOT EXISTS usage_counters (
+    user_key VARCHAR(100) PRIMARY KEY,
+    request_tokens REAL NOT NULL,
+    gpu_tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+
 -- Indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
@@ -1,25 +1,289 @@
 #!/usr/bin/env python3
 """
-Simple static server for the project folder.
+Static server for the project folder.
 Run: python serve.py 5500
 Then open http://localhost:5500/index.html
+
+Files are served from memory by a threaded server with precompressed
+gzip/brotli variants, strong ETags (304 on revalidation), long-lived
+Cache-Control for fingerprinted assets (name.<hash>.ext) and byte ranges.
+Only frontend file types are served, never users.db or the Python modules.
+Use --dist to serve the output of build_assets.py, and --simple for the
+old single-threaded SimpleHTTPRequestHandler.
 """
+import gzip
+import hashlib
 import http.server
+import mimetypes
+import os
+import re
 import socketserver
 import sys
+import threading
+import urllib.parse
+from email.utils import formatdate
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+MIN_COMPRESS_SIZE = 1024
+MAX_CACHED_FILE = 8 * 1024 * 1024
+FINGERPRINT_RE = re.compile(r"\.[0-9a-f]{8,}\.[A-Za-z0-9]+$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# The source directory also holds users.db and the Python modules; only the frontend is served
+STATIC_EXTENSIONS = {
+    ".html", ".css", ".js", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp", ".woff", ".woff2",
+}
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+class StaticFile:
+    """A file loaded into memory with its compressed variants"""
+
+    def __init__(self, path):
+        stat = os.stat(path)
+        self.path = path
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type == "application/javascript":
+            self.content_type += "; charset=utf-8"
+        self.cache_control = IMMUTABLE if FINGERPRINT_RE.search(path) else REVALIDATE
+
+        self.body = None
+        self.variants = {}
+        if self.size > MAX_CACHED_FILE:
+            # Too big to keep in memory; ETag from size and mtime, read per request
+            self.etag = f'"{int(self.mtime):x}-{self.size:x}"'
+            return
+
+        with open(path, "rb") as f:
+            self.body = f.read()
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:20]}"'
+
+        if self.size >= MIN_COMPRESS_SIZE and self.content_type.startswith(COMPRESSIBLE_TYPES):
+            self.variants["gzip"] = self._variant(path + ".gz", lambda b: gzip.compress(b, 9))
+            # Without the brotli module only an up-to-date .br from the build step can be served
+            compress_br = (lambda b: brotli.compress(b, quality=11)) if brotli is not None else None
+            self.variants["br"] = self._variant(path + ".br", compress_br)
+            # Drop variants that are missing or don't actually save bytes
+            self.variants = {k: v for k, v in self.variants.items() if v is not None and len(v) < self.size}
+
+    def _variant(self, precompressed_path, compress):
+        # Prefer a precompressed file from the build step when it is up to date
+        if os.path.exists(precompressed_path) and os.stat(precompressed_path).st_mtime >= self.mtime:
+            with open(precompressed_path, "rb") as f:
+                return f.read()
+        return compress(self.body) if compress is not None else None
+
+    def read(self, start, end):
+        """Return bytes [start, end] inclusive"""
+        if self.body is not None:
+            return self.body[start:end + 1]
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+
+class StaticCache:
+    """Path -> StaticFile, reloaded when the file's mtime changes"""
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, url_path):
+        """Map a URL path (query and %-escapes allowed) to a frontend file under root, or None"""
+        path = urllib.parse.unquote(url_path.split("?", 1)[0].split("#", 1)[0])
+        if "\0" in path:
+            return None
+        path = os.path.realpath(os.path.join(self.root, path.lstrip("/")))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            return None
+        if os.path.isdir(path):
+            path = os.path.join(path, "index.html")
+        if os.path.splitext(path)[1].lower() not in STATIC_EXTENSIONS:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def get(self, url_path):
+        path = self.resolve(url_path)
+        if path is None:
+            return None
+        cached = self._files.get(path)
+        if cached is not None and cached.mtime == os.stat(path).st_mtime:
+            return cached
+        with self._lock:
+            static_file = StaticFile(path)
+            self._files[path] = static_file
+        return static_file
+
+
+def accepted_encodings(header):
+    """Parse Accept-Encoding into the set of codings with a non-zero q"""
+    codings = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if name:
+            codings.add(name.strip().lower())
+    return codings
+
+
+def common_headers(static_file, etag):
+    headers = [
+        ("ETag", etag),
+        ("Last-Modified", static_file.last_modified),
+        ("Cache-Control", static_file.cache_control),
+        ("Accept-Ranges", "bytes"),
+    ]
+    if static_file.variants:
+        headers.append(("Vary", "Accept-Encoding"))
+    return headers
+
+
+def parse_range(static_file, etag, headers):
+    """Return (start, end), None for a full response, or "invalid" for 416"""
+    header = headers.get("Range")
+    if not header or static_file.size == 0:
+        return None
+    if_range = headers.get("If-Range")
+    if if_range and if_range.strip() not in (etag, static_file.last_modified):
+        return None
+
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple or malformed ranges: fall back to the full body
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start = max(0, static_file.size - int(last))
+        end = static_file.size - 1
+    else:
+        start = int(first)
+        end = min(int(last), static_file.size - 1) if last else static_file.size - 1
+    if start >= static_file.size or start > end:
+        return "invalid"
+    return start, end
+
+
+def build_response(static_file, headers):
+    """
+    Pick the representation of a file for a GET request
+    headers: case-insensitive request headers with .get()
+    Returns: (status, response headers, body)
+    """
+    encoding = None
+    if static_file.variants:
+        accepted = accepted_encodings(headers.get("Accept-Encoding"))
+        for name in ("br", "gzip"):
+            if name in static_file.variants and name in accepted:
+                encoding = name
+                break
+    etag = static_file.etag if encoding is None else f'{static_file.etag[:-1]}-{encoding}"'
+
+    if_none_match = headers.get("If-None-Match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return 304, common_headers(static_file, etag), b""
+
+    body_range = None
+    if encoding is None:
+        body_range = parse_range(static_file, etag, headers)
+        if body_range == "invalid":
+            return 416, [("Content-Range", f"bytes */{static_file.size}"), ("Content-Length", "0")], b""
+
+    if encoding is not None:
+        body = static_file.variants[encoding]
+    elif body_range is not None:
+        body = static_file.read(*body_range)
+    else:
+        body = static_file.read(0, static_file.size - 1) if static_file.size else b""
+
+    response_headers = common_headers(static_file, etag) + [
+        ("Content-Type", static_file.content_type),
+        ("Content-Length", str(len(body))),
+    ]
+    if encoding is not None:
+        response_headers.append(("Content-Encoding", encoding))
+    if body_range is not None:
+        response_headers.append(("Content-Range", f"bytes {body_range[0]}-{body_range[1]}/{static_file.size}"))
+        return 206, response_headers, body
+    return 200, response_headers, body
+
+
+class StaticHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "AIImageStatic/1.0"
+    # Headers and body are separate writes; avoid Nagle + delayed-ACK stalls on keep-alive
+    disable_nagle_algorithm = True
+    cache = None
+
+    def do_GET(self):
+        self.serve(head_only=False)
+
+    def do_HEAD(self):
+        self.serve(head_only=True)
+
+    def serve(self, head_only):
+        static_file = self.cache.get(self.path)
+        if static_file is None:
+            self.send_error(404, "File not found")
+            return
+
+        status, headers, body = build_response(static_file, self.headers)
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if body and not head_only:
+            self.wfile.write(body)
+
+
+class StaticServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(port, root=ROOT, simple=False, host=""):
+    """Create the static server (production mode unless simple=True)"""
+    if simple:
+        handler = lambda *args, **kwargs: http.server.SimpleHTTPRequestHandler(*args, directory=root, **kwargs)
+        return socketserver.TCPServer((host, port), handler)
+
+    handler = type("Handler", (StaticHandler,), {"cache": StaticCache(root)})
+    return StaticServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    simple = "--simple" in sys.argv
+    root = os.path.join(ROOT, "dist") if "--dist" in sys.argv else ROOT
+
+    PORT = 5500
+    if args:
+        try:
+            PORT = int(args[0])
+        except Exception:
+            pass
 
-PORT = 5500
-if len(sys.argv) > 1:
-    try:
-        PORT = int(sys.argv[1])
-    except Exception:
-        pass
-
-Handler = http.server.SimpleHTTPRequestHandler
-with socketserver.TCPServer(("", PORT), Handler) as httpd:
-    print(f"Serving HTTP on 0.0.0.0 port {PORT} (http://localhost:{PORT}/) ...")
-    try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        print('\nShutting down')
-        httpd.server_close()
+    with make_server(PORT, root=root, simple=simple) as httpd:
+        mode = "simple" if simple else "threaded, cached"
+        print(f"Serving HTTP ({mode}) on 0.0.0.0 port {PORT} (http://localhost:{PORT}/) ...")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print('\nShutting down')
+            httpd.server_close()
@@ -0,0 +1,23 @@
+"""
+Shared test setup: the app's flat modules on sys.path and a throwaway database
+Run: python -m pytest AI-Image-Web/tests
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+if "DATABASE_PATH" not in os.environ:
+    _db_dir = tempfile.mkdtemp(prefix="ai-image-web-tests-")
+    atexit.register(shutil.rmtree, _db_dir, ignore_errors=True)
+    os.environ["DATABASE_PATH"] = os.path.join(_db_dir, "users.db")
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
@@ -0,0 +1,97 @@
+"""
+Model artifact keys: a Hub model's artifact follows its local commit; the Hub is asked only to rebuild
+"""
+import shutil
+import types
+
+import pytest
+from huggingface_hub import HfApi, constants
+
+from engine import artifacts
+
+COMMIT_A = "a" * 40
+COMMIT_B = "b" * 40
+
+
+@pytest.fixture
+def hub_cache(tmp_path, monkeypatch):
+    cache = tmp_path / "hub"
+    monkeypatch.setattr(constants, "HF_HUB_CACHE", str(cache))
+    return cache
+
+
+def write_ref(hub_cache, repo_id, commit):
+    ref = hub_cache / f"models--{repo_id.replace('/', '--')}" / "refs" / "main"
+    ref.parent.mkdir(parents=True, exist_ok=True)
+    ref.write_text(commit)
+
+
+def test_key_changes_with_the_revision():
+    key_a = artifacts.artifact_key("org/model", "float32", COMMIT_A)
+    assert key_a == artifacts.artifact_key("org/model", "float32", COMMIT_A)
+    assert key_a != artifacts.artifact_key("org/model", "float32", COMMIT_B)
+    assert key_a.startswith("org--model-")
+
+
+def test_revision_comes_from_the_hub(hub_cache, monkeypatch):
+    monkeypatch.setattr(constants, "HF_HUB_OFFLINE", False)
+    monkeypatch.setattr(HfApi, "model_info", lambda self, repo_id, **kwargs: types.SimpleNamespace(sha=COMMIT_B))
+    write_ref(hub_cache, "org/model", COMMIT_A)
+    assert artifacts.hub_revision("org/model") == COMMIT_B
+
+
+def test_revision_falls_back_to_the_local_cache(hub_cache, monkeypatch):
+    def unreachable(self, repo_id, **kwargs):
+        raise OSError("no network")
+    monkeypatch.setattr(constants, "HF_HUB_OFFLINE", False)
+    monkeypatch.setattr(HfApi, "model_info", unreachable)
+    write_ref(hub_cache, "org/model", COMMIT_A)
+    assert artifacts.hub_revision("org/model") == COMMIT_A
+    assert artifacts.hub_revision("org/other") == ""
+
+
+def test_offline_never_asks_the_hub(hub_cache, monkeypatch):
+    monkeypatch.setattr(constants, "HF_HUB_OFFLINE", True)
+    monkeypatch.setattr(HfApi, "model_info", lambda *args, **kwargs: pytest.fail("asked the Hub"))
+    write_ref(hub_cache, "org/model", COMMIT_A)
+    assert artifacts.hub_revision("org/model") == COMMIT_A
+
+
+def test_a_new_commit_rebuilds_the_artifact(hub_cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, "MODEL_ARTIFACTS", True)
+    monkeypatch.setattr(artifacts, "MODEL_CACHE_DIR", str(tmp_path / "models"))
+    revision = {"sha": COMMIT_A}
+    monkeypatch.setattr(artifacts, "hub_revision", lambda repo_id: revision["sha"])
+    conversions = []
+
+    def load_original():
+        # from_pretrained leaves the commit it downloaded in the local cache
+        conversions.append(revision["sha"])
+        write_ref(hub_cache, "org/model", revision["sha"])
+        return {"safety_checker": None}
+
+    assert artifacts.load_components("org/model", "float32", load_original) == {"safety_checker": None}
+    artifacts.load_components("org/model", "float32", load_original)
+    revision["sha"] = COMMIT_B
+    # The local artifact still loads: a new commit is only picked up when it has to be rebuilt
+    artifacts.load_components("org/model", "float32", load_original)
+    assert conversions == [COMMIT_A]
+    for directory in artifacts._artifacts():
+        shutil.rmtree(directory)
+    artifacts.load_components("org/model", "float32", load_original)
+    assert conversions == [COMMIT_A, COMMIT_B]
+
+
+def test_a_built_artifact_loads_without_asking_the_hub(hub_cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, "MODEL_ARTIFACTS", True)
+    monkeypatch.setattr(artifacts, "MODEL_CACHE_DIR", str(tmp_path / "models"))
+    asked = []
+    monkeypatch.setattr(artifacts, "hub_revision", lambda repo_id: asked.append(repo_id) or COMMIT_A)
+    write_ref(hub_cache, "org/model", COMMIT_A)
+
+    artifacts.load_components("org/model", "float32", lambda: {"safety_checker": None})
+    assert asked == ["org/model"]
+    artifacts.load_components("org/model", "float32", lambda: pytest.fail("converted again"))
+    assert asked == ["org/model"]
+    manifests = [artifacts.read_manifest(d) for d in artifacts._artifacts()]
+    assert [m["revision"] for m in manifests] == [COMMIT_A]
@@ -0,0 +1,47 @@
+"""
+build_assets.py: script bundles, shared CSS only when it costs no request, and the request-count check
+"""
+import re
+
+import build_assets
+
+BIG_RULE = "a{color:red}"
+PAGE_RULES = ["b{margin:%dpx}" % i for i in range(400)]
+
+
+def test_pages_never_gain_requests(tmp_path):
+    report = build_assets.build(out_dir=str(tmp_path / "dist"))
+    assert build_assets.check_requests(report) == []
+    for page in build_assets.PAGES:
+        built = (tmp_path / "dist" / page).read_text(encoding="utf-8")
+        # config.js travels inside the page's bundle, never as a request of its own
+        assert not re.search(r'src="(assets/)?config\.[0-9a-f]+\.js"', built)
+        assert 'src="assets/config+' in built
+
+
+def test_adjacent_scripts_loaded_alike_are_bundled():
+    html = ('<script src="config.js" defer></script>\n<script src="control.js" defer></script>'
+            '<script src="late.js"></script><p></p><script src="other.js"></script>')
+    bundled, bundles = build_assets.bundle_scripts(html)
+    assert bundles == {"config+control.js": ["config.js", "control.js"]}
+    assert bundled == ('<script src="config+control.js" defer></script>'
+                       '<script src="late.js"></script><p></p><script src="other.js"></script>')
+
+
+def test_shared_css_is_skipped_when_it_adds_a_request():
+    # The remainders stay too big to inline: sharing would add a stylesheet request per page
+    sheets = {"a.css": [BIG_RULE * 50] + PAGE_RULES, "b.css": [BIG_RULE * 50] + PAGE_RULES[::-1]}
+    assert build_assets.extract_shared(sheets) == ((), [])
+
+
+def test_shared_css_is_used_when_the_remainders_inline():
+    shared = [BIG_RULE * 200]
+    sheets = {"a.css": shared + ["p{margin:0}"], "b.css": shared + ["p{padding:0}"]}
+    assert build_assets.extract_shared(sheets) == (("a.css", "b.css"), shared)
+
+
+def test_check_requests_names_the_pages_that_got_worse():
+    report = {"a.html": {"requests_before": 3, "requests_after": 4},
+              "b.html": {"requests_before": 3, "requests_after": 2},
+              "_shared": {}}
+    assert build_assets.check_requests(report) == ["a.html"]
@@ -0,0 +1,120 @@
+"""
+/image-to-text/bulk: summary counts, and the quota charged per image, against a fake captioning backend
+"""
+import io
+import json
+
+import pytest
+
+import database
+import quota
+from engine import backends, bulk
+from engine.core import DecodingOptions, EngineError
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeCaptioner(backends.Backend):
+    """Captions b"bad" with an error and b"crash" with an exception; anything else as its length"""
+
+    name = "fake"
+
+    async def caption(self, img_bytes, question=None, decoding=None):
+        if img_bytes == b"crash":
+            raise RuntimeError("model fell over")
+        if img_bytes == b"bad":
+            raise EngineError("Not a readable image", 400)
+        return f"{len(img_bytes)} bytes"
+
+
+@pytest.fixture
+def app_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "users.db"))
+    monkeypatch.setattr(quota, "quota_manager", None)
+    monkeypatch.setitem(backends.BACKENDS, "fake", FakeCaptioner)
+    return "fake"
+
+
+def lines(body: str) -> list:
+    return [json.loads(line) for line in body.splitlines()]
+
+
+async def test_summary_counts_only_captioned_images():
+    uploads = [("a.png", b"aaa"), ("b.png", b"bad"), ("c.png", b"cc")]
+    records = lines("".join([line async for line in
+                             bulk.caption_results(FakeCaptioner(), uploads, None, DecodingOptions())]))
+    assert records[:3] == [{"file": "a.png", "text": "3 bytes"}, {"file": "b.png", "error": "Not a readable image"},
+                           {"file": "c.png", "text": "2 bytes"}]
+    assert records[3]["images"] == 2 and records[3]["errors"] == 1
+
+
+def test_refunds_cover_only_images_without_a_caption(monkeypatch):
+    monkeypatch.setattr(bulk.captioning, "BLIP_BATCH_SIZE", 2)
+    uploads = [("a.png", b"aaa"), ("b.png", b"bad"), ("c.png", b"cc"), ("d.png", b"crash"), ("e.png", b"e")]
+    refunds = []
+    records = lines("".join(bulk.caption_results_sync(FakeCaptioner(), uploads, None, DecodingOptions(),
+                                                      refund=lambda images, e: refunds.append((images, str(e))))))
+    assert records[-1] == {"error": "model fell over"}
+    # b.png on its own; then the failed batch and the one never started, but not the first batch's caption
+    assert refunds == [(1, "None"), (3, "model fell over")]
+
+
+def test_too_many_files_or_too_big_an_archive_is_a_413(monkeypatch):
+    with pytest.raises(EngineError) as e:
+        bulk.check_count(bulk.BULK_MAX_IMAGES + 1)
+    assert e.value.status_code == 413
+    monkeypatch.setattr(bulk, "ARCHIVE_READ_LIMIT", 10)
+    with pytest.raises(EngineError) as e:
+        bulk.collect_uploads([], b"x" * 10)
+    assert e.value.status_code == 413
+
+
+def test_fastapi_bulk_is_charged_per_image(app_backend, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from engine.fastapi_app import create_app
+
+    # Room for three captions, then one more
+    monkeypatch.setattr(quota, "GPU_BURST", 4 * quota.CAPTION_COST)
+    files = [("images", (f"{i}.png", b"img")) for i in range(3)]
+    with TestClient(create_app(app_backend)) as client:
+        first = client.post("/image-to-text/bulk", files=files)
+        second = client.post("/image-to-text/bulk", files=files)
+        single = client.post("/image-to-text", files={"image": ("a.png", b"img")})
+        over = client.post("/image-to-text", files={"image": ("a.png", b"img")})
+    assert first.status_code == 200 and lines(first.text)[-1]["images"] == 3
+    assert second.status_code == 429
+    assert single.status_code == 200
+    assert over.status_code == 429
+
+
+def test_fastapi_bulk_refunds_unreadable_images(app_backend, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from engine.fastapi_app import create_app
+
+    monkeypatch.setattr(quota, "GPU_BURST", 3 * quota.CAPTION_COST)
+    with TestClient(create_app(app_backend)) as client:
+        first = client.post("/image-to-text/bulk", files=[("images", ("a.png", b"bad")), ("images", ("b.png", b"bad")),
+                                                          ("images", ("c.png", b"img"))])
+        # Two of the three charged images were given back
+        second = client.post("/image-to-text/bulk", files=[("images", (f"{i}.png", b"img")) for i in range(2)])
+        too_many = client.post("/image-to-text/bulk",
+                               files=[("images", (f"{i}.png", b"img")) for i in range(bulk.BULK_MAX_IMAGES + 1)])
+    assert first.status_code == 200 and lines(first.text)[-1]["errors"] == 2
+    assert second.status_code == 200
+    assert too_many.status_code == 413
+
+
+def test_flask_bulk_refunds_a_failed_request(app_backend, monkeypatch):
+    from engine.flask_app import create_app
+
+    monkeypatch.setattr(quota, "GPU_BURST", 2 * quota.CAPTION_COST)
+    client = create_app(app_backend).test_client()
+    crashed = client.post("/image-to-text/bulk",
+                          data={"images": [(io.BytesIO(b"crash"), "a.png"), (io.BytesIO(b"img"), "b.png")]})
+    assert lines(crashed.get_data(as_text=True)) == [{"error": "model fell over"}]
+    # The failed request's two images were refunded
+    again = client.post("/image-to-text/bulk",
+                        data={"images": [(io.BytesIO(b"img"), "a.png"), (io.BytesIO(b"img"), "b.png")]})
+    assert again.status_code == 200 and lines(again.get_data(as_text=True))[-1]["images"] == 2
@@ -0,0 +1,40 @@
+"""
+CORS: only the configured frontend origins may call the API with credentials
+"""
+import pytest
+
+import database
+import quota
+from engine import backends
+
+PREFLIGHT = {"Access-Control-Request-Method": "POST", "Access-Control-Request-Headers": "authorization"}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    from engine.fastapi_app import create_app
+
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "users.db"))
+    monkeypatch.setattr(quota, "quota_manager", None)
+    monkeypatch.setitem(backends.BACKENDS, "unreachable", lambda: backends.WebUIBackend("http://127.0.0.1:9"))
+    return create_app("unreachable")
+
+
+def test_frontend_origin_is_allowed(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        response = client.options("/generate", headers={"Origin": "http://localhost:5500", **PREFLIGHT})
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "http://localhost:5500"
+    assert response.headers["access-control-allow-credentials"] == "true"
+
+
+def test_other_origins_are_refused(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        preflight = client.options("/generate", headers={"Origin": "https://evil.example", **PREFLIGHT})
+        simple = client.get("/", headers={"Origin": "https://evil.example"})
+    assert preflight.status_code == 400
+    assert "access-control-allow-origin" not in simple.headers
@@ -0,0 +1,98 @@
+"""
+DiffusersBackend's request handling around a fake pipeline: sizes, per-iteration seeds, the queue and init images
+"""
+import io
+import types
+
+import pytest
+from PIL import Image
+
+from engine import diffusers_backend
+from engine.core import EngineError, GenerationRequest
+from engine.diffusers_backend import DiffusersBackend
+
+pytest.importorskip("torch")
+pytestmark = pytest.mark.anyio
+
+
+class FakePipeline:
+    """Records each call's size and generator seed; returns blank images"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, width, height, generator, num_images_per_prompt, **kwargs):
+        self.calls.append({"size": (width, height), "seed": generator.initial_seed()})
+        return type("Output", (), {"images": [Image.new("RGB", (width, height))] * num_images_per_prompt})()
+
+
+@pytest.fixture
+async def backend(monkeypatch):
+    backend = DiffusersBackend(device="cpu")
+
+    def load():
+        backend.txt2img = FakePipeline()
+    monkeypatch.setattr(backend, "load", load)
+    yield backend
+    await backend.close()
+
+
+async def test_sizes_round_down_to_multiples_of_8(backend):
+    result = await backend.generate(GenerationRequest("a cat", steps=1, width=517, height=300, seed=1))
+    assert backend.txt2img.calls[0]["size"] == (512, 296)
+    assert len(result.images) == 1
+
+
+async def test_each_iteration_starts_batch_size_seeds_later(backend):
+    result = await backend.generate(GenerationRequest("a cat", steps=1, seed=100, batch_size=2, n_iter=3))
+    assert [call["seed"] for call in backend.txt2img.calls] == [100, 102, 104]
+    assert result.seed == 100 and len(result.images) == 6
+
+
+class RecordingSpan:
+    def __init__(self, name):
+        self.name, self.error, self.ended = name, None, False
+
+    def set_error(self, message):
+        self.error = message
+
+    def end(self):
+        self.ended = True
+
+
+def test_a_rejected_job_ends_its_queue_wait_span(monkeypatch):
+    spans = []
+
+    def start_span(name):
+        spans.append(RecordingSpan(name))
+        return spans[-1]
+    monkeypatch.setattr(diffusers_backend.tracing, "start_span", start_span)
+    backend = DiffusersBackend(device="cpu", queue_size=1)
+    # No inference thread: the first job stays queued
+    monkeypatch.setattr(backend, "_ensure_worker", lambda: None)
+    backend.submit(GenerationRequest("a cat", steps=1))
+    with pytest.raises(EngineError) as e:
+        backend.submit(GenerationRequest("a cat", steps=1))
+    assert e.value.status_code == 503
+    assert [(span.ended, span.error) for span in spans] == [(False, None), (True, "queue full")]
+
+
+def test_init_images_follow_their_exif_orientation():
+    import torch
+
+    seen = []
+    backend = DiffusersBackend(device="cpu")
+    backend.img2img = types.SimpleNamespace(
+        image_processor=types.SimpleNamespace(preprocess=lambda image: seen.append(image) or torch.zeros(1)),
+        vae=types.SimpleNamespace(dtype=torch.float32, encode=lambda pixels: types.SimpleNamespace(latent_dist="dist")))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+    out = io.BytesIO()
+    # Stored wide with a red left edge; displayed tall with the red edge on top
+    img = Image.new("RGB", (80, 40), "white")
+    img.paste((255, 0, 0), (0, 0, 8, 40))
+    img.save(out, "JPEG", exif=exif)
+    assert backend.init_latent_dist(GenerationRequest("a cat", width=40, height=80, mode="img2img",
+                                                      init_image=out.getvalue())) == "dist"
+    assert seen[0].size == (40, 80)
+    assert seen[0].getpixel((20, 2))[1] < 100 and seen[0].getpixel((20, 78))[1] > 200
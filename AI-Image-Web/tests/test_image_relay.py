@@ -0,0 +1,120 @@
+"""
+image_relay: a large upstream image is relayed chunk by chunk, never held whole
+"""
+import base64
+import gzip
+import json
+
+import httpx
+import pytest
+
+import image_relay
+from engine.core import EngineError, parse_thumbnail
+
+pytestmark = pytest.mark.anyio
+
+UPSTREAM_CHUNK = 16 * 1024
+UPSTREAM_SIZE = 16 * 2 ** 20
+
+
+class LargeBody(httpx.AsyncByteStream):
+    """UPSTREAM_SIZE bytes produced on demand; `sent` counts what has left the fake server"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def __aiter__(self):
+        while self.sent < UPSTREAM_SIZE:
+            self.sent += UPSTREAM_CHUNK
+            yield bytes([self.sent // UPSTREAM_CHUNK % 256]) * UPSTREAM_CHUNK
+
+
+async def open_large_image(body: LargeBody, headers: dict = None) -> httpx.Response:
+    def upstream(request):
+        return httpx.Response(200, headers=headers or {"content-length": str(UPSTREAM_SIZE)}, stream=body)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    return await image_relay.open_image_stream(client, "https://replicate.delivery/out.png")
+
+
+async def test_stream_json_never_buffers_the_whole_image(tmp_path):
+    body = LargeBody()
+    response = await open_large_image(body)
+    file_path = str(tmp_path / "out.png")
+    relayed, ahead = 0, 0
+    out = []
+    async for chunk in image_relay.stream_json(response, file_path, {"message": "ok"}):
+        relayed += len(chunk)
+        # Base64 chunks are 4/3 of what came in; upstream stays at most a chunk or two ahead
+        ahead = max(ahead, body.sent - relayed * 3 // 4)
+        out.append(chunk)
+    assert body.sent == UPSTREAM_SIZE
+    assert ahead <= 2 * image_relay.CHUNK_SIZE
+    assert max(len(chunk) for chunk in out) <= image_relay.CHUNK_SIZE * 4 // 3 + 4
+
+    # The pieces still add up to the JSON document the frontend parses
+    document = json.loads(b"".join(out))
+    assert len(base64.b64decode(document["image"])) == UPSTREAM_SIZE
+    assert document["file"] == file_path
+    with open(file_path, "rb") as f:
+        assert f.seek(0, 2) == UPSTREAM_SIZE
+
+
+async def test_stream_image_never_buffers_the_whole_image(tmp_path):
+    body = LargeBody()
+    response = await open_large_image(body)
+    relayed, ahead = 0, 0
+    async for chunk in image_relay.stream_image(response, str(tmp_path / "out.png")):
+        relayed += len(chunk)
+        ahead = max(ahead, body.sent - relayed)
+    assert relayed == UPSTREAM_SIZE
+    assert ahead <= 2 * image_relay.CHUNK_SIZE
+
+
+async def test_content_length_is_relayed_only_for_unencoded_bodies():
+    plain = await open_large_image(LargeBody())
+    assert image_relay.relayed_length(plain) == str(UPSTREAM_SIZE)
+    await plain.aclose()
+
+    def gzipped(request):
+        data = gzip.compress(b"\x89PNG" + b"\0" * 1000)
+        return httpx.Response(200, headers={"content-encoding": "gzip", "content-length": str(len(data))},
+                              content=data)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(gzipped))
+    encoded = await image_relay.open_image_stream(client, "https://replicate.delivery/out.png")
+    assert image_relay.relayed_length(encoded) is None
+    # What the relay sends is the decoded image, not the gzip body the header measured
+    assert len(b"".join([chunk async for chunk in encoded.aiter_bytes()])) == 1004
+    await encoded.aclose()
+
+
+@pytest.mark.parametrize("value", [-5, "-1", "abc", 100000])
+def test_bad_thumbnail_sizes_are_rejected(value):
+    with pytest.raises(EngineError) as e:
+        parse_thumbnail(value)
+    assert e.value.status_code == 400
+
+
+def test_thumbnail_sizes():
+    assert parse_thumbnail(None) == 0
+    assert parse_thumbnail("") == 0
+    assert parse_thumbnail("256") == 256
+
+
+def test_generate_rejects_a_bad_thumbnail_before_the_backend(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import database
+    import quota
+    from engine import backends
+    from engine.fastapi_app import create_app
+
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "users.db"))
+    monkeypatch.setattr(quota, "quota_manager", None)
+    # Reaching the backend would be a 503: nothing listens on the discard port
+    monkeypatch.setitem(backends.BACKENDS, "unreachable", lambda: backends.WebUIBackend("http://127.0.0.1:9"))
+    with TestClient(create_app("unreachable")) as client:
+        response = client.post("/generate", data={"prompt": "a cat", "thumbnail": -5})
+    assert response.status_code == 400
+    assert response.json() == {"error": f"thumbnail must be between 0 and {quota.MAX_SIDE}"}
@@ -0,0 +1,167 @@
+"""
+QuotaManager: SQLite-backed buckets shared between processes, and the in-memory fallback
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+import pytest
+
+import database
+import quota
+from quota import QuotaManager
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "users.db")
+    monkeypatch.setattr(database, "DATABASE_PATH", path)
+    return path
+
+
+@pytest.mark.parametrize("use_database", [True, False])
+def test_burst_then_retry_after(db_path, monkeypatch, use_database):
+    monkeypatch.setattr(quota, "RATE_BURST", 3)
+    manager = QuotaManager(use_database)
+    assert [manager.charge("ip:1", 1)[0] for _ in range(4)] == [True, True, True, False]
+    allowed, retry_after = manager.charge("ip:1", 1)
+    assert not allowed
+    # One token refills in 60 / RATE_PER_MINUTE seconds
+    assert 0 < retry_after <= 60 / quota.RATE_PER_MINUTE
+    assert manager.charge("ip:2", 1)[0]
+
+
+@pytest.mark.parametrize("use_database", [True, False])
+def test_gpu_budget(db_path, monkeypatch, use_database):
+    monkeypatch.setattr(quota, "GPU_BURST", 100)
+    manager = QuotaManager(use_database)
+    assert manager.charge("ip:1", 60)[0]
+    allowed, retry_after = manager.charge("ip:1", 60)
+    assert not allowed
+    assert retry_after == pytest.approx(20 / (quota.GPU_PER_HOUR / 3600), rel=0.01)
+    assert manager.charge("ip:1", 40)[0]
+
+
+def test_buckets_persist_across_managers(db_path, monkeypatch):
+    monkeypatch.setattr(quota, "RATE_BURST", 2)
+    QuotaManager().charge("ip:1", 1)
+    QuotaManager().charge("ip:1", 1)
+    assert not QuotaManager().charge("ip:1", 1)[0]
+
+
+def test_falls_back_to_memory_when_the_database_fails(tmp_path, monkeypatch):
+    # A directory can't be opened as a database
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path))
+    monkeypatch.setattr(quota, "RATE_BURST", 1)
+    manager = QuotaManager()
+    assert manager.charge("ip:1", 1) == (True, 0.0)
+    assert not manager.charge("ip:1", 1)[0]
+
+
+def _charge_many(args):
+    path, count = args
+    database.DATABASE_PATH = path
+    manager = QuotaManager()
+    return sum(manager.charge("ip:shared", 1)[0] for _ in range(count))
+
+
+def test_worker_processes_share_one_limit(db_path, monkeypatch):
+    # No refill during the test, so exactly the burst gets through
+    monkeypatch.setenv("RATE_LIMIT_BURST", "10")
+    monkeypatch.setenv("RATE_LIMIT_PER_MINUTE", "0")
+    here = os.path.dirname(os.path.abspath(__file__))
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join([here, os.path.dirname(here), os.environ.get("PYTHONPATH", "")]))
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        allowed = pool.map(_charge_many, [(db_path, 10)] * 4)
+    assert sum(allowed) == 10
+
+
+def test_import_touches_no_database(tmp_path):
+    path = tmp_path / "users.db"
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", "import quota, engine.core"], cwd=app_dir, check=True,
+                   env={**os.environ, "DATABASE_PATH": str(path)})
+    assert not path.exists()
+
+
+@pytest.mark.parametrize("use_database", [True, False])
+def test_refund_returns_the_charge(db_path, monkeypatch, use_database):
+    monkeypatch.setattr(quota, "RATE_BURST", 1)
+    monkeypatch.setattr(quota, "GPU_BURST", 100)
+    manager = QuotaManager(use_database)
+    assert manager.charge("ip:1", 100)[0]
+    assert not manager.charge("ip:1", 100)[0]
+    manager.refund("ip:1", 100)
+    assert manager.charge("ip:1", 100)[0]
+
+
+def test_refund_on_error_only_for_server_failures(db_path, monkeypatch):
+    from engine.core import EngineError, refund_on_error
+
+    manager = QuotaManager()
+    monkeypatch.setattr(quota, "quota_manager", manager)
+    refunds = []
+    monkeypatch.setattr(manager, "refund", lambda caller, cost: refunds.append((caller, cost)))
+    refund_on_error("ip:1", 10.0, EngineError("WebUI unreachable", 503))
+    refund_on_error("ip:1", 10.0, RuntimeError("bug"))
+    refund_on_error("ip:1", 10.0, EngineError("Generation timed out", 408))
+    refund_on_error("ip:1", None, EngineError("Rate limit or GPU quota exceeded", 429))
+    assert refunds == [("ip:1", 10.0), ("ip:1", 10.0)]
+
+
+def test_backend_failures_do_not_use_up_the_burst(db_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from engine import backends
+    from engine.fastapi_app import create_app
+
+    # Nothing listens on the discard port, so every generation fails with a 503
+    monkeypatch.setitem(backends.BACKENDS, "unreachable", lambda: backends.WebUIBackend("http://127.0.0.1:9"))
+    monkeypatch.setattr(quota, "quota_manager", None)
+    with TestClient(create_app("unreachable")) as client:
+        statuses = [client.post("/generate", data={"prompt": "a cat", "steps": 10}).status_code
+                    for _ in range(int(quota.RATE_BURST) + 3)]
+    assert set(statuses) == {503}
+
+
+@pytest.mark.anyio
+async def test_replicate_rejections_are_refunded(db_path, monkeypatch):
+    import httpx
+
+    from engine.backends import ReplicateBackend
+    from engine.core import EngineError, GenerationRequest, refund_on_error
+
+    backend = ReplicateBackend(api_token="token")
+    backend.replicate.client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(402, json={"detail": "Billing required"})))
+    try:
+        with pytest.raises(EngineError) as e:
+            await backend.generate(GenerationRequest("a cat", steps=10))
+    finally:
+        await backend.replicate.close()
+    assert e.value.status_code == 502
+    assert e.value.extra["upstream_status"] == 402
+
+    manager = QuotaManager()
+    monkeypatch.setattr(quota, "quota_manager", manager)
+    refunds = []
+    monkeypatch.setattr(manager, "refund", lambda caller, cost: refunds.append((caller, cost)))
+    refund_on_error("ip:1", 10.0, e.value)
+    assert refunds == [("ip:1", 10.0)]
+
+
+def test_iterations_a_backend_does_not_run_are_rejected_before_charging(db_path, monkeypatch):
+    from engine.backends import ReplicateBackend
+    from engine.core import EngineError, GenerationRequest, admit
+
+    manager = QuotaManager()
+    monkeypatch.setattr(quota, "quota_manager", manager)
+    charges = []
+    monkeypatch.setattr(manager, "charge", lambda caller, cost: charges.append(cost) or (True, 0.0))
+    backend = ReplicateBackend(api_token="token")
+    with pytest.raises(EngineError) as e:
+        admit(backend, GenerationRequest("a cat", steps=10, batch_size=2, n_iter=3), "ip:1")
+    assert e.value.status_code == 400 and charges == []
+    cost = admit(backend, GenerationRequest("a cat", steps=10, batch_size=2), "ip:1")
+    assert charges == [cost] == [quota.estimate_cost(10, 512, 512, 2)]
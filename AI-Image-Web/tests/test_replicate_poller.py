@@ -0,0 +1,203 @@
+"""
+ReplicateClient's shared poller against a fake Replicate API (httpx.MockTransport), and webhook signatures
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import time
+
+import httpx
+import pytest
+
+import replicate_client
+from quota import TokenBucket
+from replicate_client import PredictionTimeout, ReplicateClient, next_delay
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeReplicate:
+    """Answers GET /v1/predictions/{id} from a scripted list of statuses per prediction"""
+
+    def __init__(self, statuses: dict):
+        self.statuses = {pid: list(s) for pid, s in statuses.items()}
+        self.polls = {pid: [] for pid in statuses}
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        pid = request.url.path.rsplit("/", 1)[-1]
+        self.polls[pid].append(asyncio.get_running_loop().time())
+        remaining = self.statuses[pid]
+        status = remaining.pop(0) if len(remaining) > 1 else remaining[0]
+        body = {"id": pid, "status": status}
+        if status == "succeeded":
+            body["output"] = [f"https://replicate.delivery/{pid}.png"]
+        elif status == "failed":
+            body["error"] = "out of memory"
+        return httpx.Response(200, json=body)
+
+
+@pytest.fixture
+def fast_schedule(monkeypatch):
+    """Deterministic millisecond-scale backoff so tests run quickly"""
+    monkeypatch.setattr(replicate_client, "MIN_DELAY", 0.01)
+    monkeypatch.setattr(replicate_client, "STARTING_DELAY", 0.01)
+    monkeypatch.setattr(replicate_client, "MAX_DELAY", 0.08)
+    monkeypatch.setattr(replicate_client, "BACKOFF", 2.0)
+    monkeypatch.setattr(replicate_client, "JITTER", 0.0)
+
+
+def make_client(fake: FakeReplicate) -> ReplicateClient:
+    client = ReplicateClient("token", base_url="https://api.test", webhook_url="", webhook_secret="")
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(fake))
+    client._rate = TokenBucket(1000, 1000)
+    return client
+
+
+def test_next_delay_backs_off_to_the_ceiling(fast_schedule):
+    processing = {"status": "processing"}
+    delays = [next_delay(processing, attempt) for attempt in range(6)]
+    assert delays == [0.01, 0.02, 0.04, 0.08, 0.08, 0.08]
+
+
+def test_next_delay_follows_the_progress_eta(monkeypatch):
+    monkeypatch.setattr(replicate_client, "JITTER", 0.0)
+    # 25% done after 1 s: about 3 s left, so check back in 1.5 s
+    prediction = {"status": "processing", "logs": " 25%|██▌       | 5/20"}
+    assert next_delay(prediction, attempt=0, elapsed=1.0) == pytest.approx(1.5)
+
+
+def test_next_delay_jitter_stays_in_bounds():
+    delays = [next_delay({"status": "processing"}, 0) for _ in range(200)]
+    low = replicate_client.MIN_DELAY * (1 - replicate_client.JITTER)
+    high = replicate_client.MIN_DELAY * (1 + replicate_client.JITTER)
+    assert all(low <= d <= high for d in delays)
+    assert len(set(delays)) > 1
+
+
+async def test_polls_back_off_until_success(fast_schedule):
+    fake = FakeReplicate({"p1": ["processing"] * 5 + ["succeeded"]})
+    client = make_client(fake)
+    try:
+        result = await client.wait_for_prediction({"id": "p1", "status": "starting"}, timeout=5)
+    finally:
+        await client.close()
+
+    assert result["status"] == "succeeded"
+    assert result["output"] == ["https://replicate.delivery/p1.png"]
+    assert client._pending == {}
+    gaps = [b - a for a, b in zip(fake.polls["p1"], fake.polls["p1"][1:])]
+    # 0.02, 0.04, then capped at 0.08; never sooner than scheduled, never far past the ceiling
+    for gap, expected in zip(gaps, [0.02, 0.04, 0.08, 0.08, 0.08]):
+        assert expected * 0.9 <= gap < expected + 0.05
+
+
+async def test_failed_prediction_is_returned(fast_schedule):
+    fake = FakeReplicate({"p1": ["processing", "failed"]})
+    client = make_client(fake)
+    try:
+        result = await client.wait_for_prediction({"id": "p1", "status": "starting"}, timeout=5)
+    finally:
+        await client.close()
+
+    assert result["status"] == "failed"
+    assert result["error"] == "out of memory"
+    assert len(fake.polls["p1"]) == 2
+
+
+async def test_timeout_raises_and_forgets_the_prediction(fast_schedule):
+    fake = FakeReplicate({"p1": ["processing"]})
+    client = make_client(fake)
+    try:
+        with pytest.raises(PredictionTimeout):
+            await client.wait_for_prediction({"id": "p1", "status": "starting"}, timeout=0.2)
+        assert client._pending == {}
+        polls = len(fake.polls["p1"])
+        await asyncio.sleep(0.2)
+        assert len(fake.polls["p1"]) == polls
+    finally:
+        await client.close()
+
+
+async def test_predictions_share_one_poller(fast_schedule):
+    fake = FakeReplicate({
+        "a": ["processing", "succeeded"],
+        "b": ["processing"] * 4 + ["succeeded"],
+        "c": ["processing"] * 2 + ["failed"],
+    })
+    client = make_client(fake)
+    try:
+        waits = [asyncio.create_task(client.wait_for_prediction({"id": pid, "status": "starting"}, timeout=5))
+                 for pid in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        poller = client._poller
+        results = await asyncio.gather(*waits)
+        assert client._poller is poller and not poller.done()
+    finally:
+        await client.close()
+
+    assert [r["status"] for r in results] == ["succeeded", "succeeded", "failed"]
+    assert {pid: len(times) for pid, times in fake.polls.items()} == {"a": 2, "b": 5, "c": 3}
+
+
+async def test_poller_survives_an_error_in_one_prediction(fast_schedule, monkeypatch):
+    fake = FakeReplicate({"bad": ["processing"] * 3 + ["succeeded"], "good": ["processing", "succeeded"]})
+    client = make_client(fake)
+    monkeypatch.setattr(replicate_client, "MAX_DELAY", 0.05)
+    delay_for = client._delay_for
+
+    def broken_for_one(tracked):
+        if tracked.prediction["id"] == "bad" and tracked.attempt == 1:
+            raise RuntimeError("bad schedule")
+        return delay_for(tracked)
+
+    monkeypatch.setattr(client, "_delay_for", broken_for_one)
+    try:
+        results = await asyncio.gather(
+            client.wait_for_prediction({"id": "bad", "status": "starting"}, timeout=5),
+            client.wait_for_prediction({"id": "good", "status": "starting"}, timeout=5),
+        )
+    finally:
+        await client.close()
+
+    assert [r["status"] for r in results] == ["succeeded", "succeeded"]
+
+
+async def test_poller_survives_an_error_in_the_loop(fast_schedule, monkeypatch):
+    fake = FakeReplicate({"p1": ["processing", "succeeded"]})
+    client = make_client(fake)
+    poll_due = client._poll_due
+    calls = []
+
+    async def fails_once(loop):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        await poll_due(loop)
+
+    monkeypatch.setattr(client, "_poll_due", fails_once)
+    try:
+        result = await client.wait_for_prediction({"id": "p1", "status": "starting"}, timeout=5)
+    finally:
+        await client.close()
+
+    assert result["status"] == "succeeded"
+    assert len(calls) > 1
+
+
+@pytest.mark.parametrize("secret", ["not-a-secret", "whsec_not base64!", "whsec_", "key_" + "A" * 24])
+def test_a_malformed_webhook_secret_fails_at_startup(secret):
+    with pytest.raises(ValueError):
+        ReplicateClient("token", webhook_url="https://app.test/replicate/webhook", webhook_secret=secret)
+
+
+def test_webhooks_signed_with_the_secret_are_verified():
+    key = b"0123456789abcdef0123456789abcdef"
+    client = ReplicateClient("token", webhook_url="https://app.test/replicate/webhook",
+                             webhook_secret="whsec_" + base64.b64encode(key).decode("ascii"))
+    body, timestamp = b'{"id": "p1", "status": "succeeded"}', str(int(time.time()))
+    signature = base64.b64encode(hmac.new(key, b"msg_1." + timestamp.encode("ascii") + b"." + body,
+                                          hashlib.sha256).digest()).decode("ascii")
+    headers = {"webhook-id": "msg_1", "webhook-timestamp": timestamp, "webhook-signature": f"v1,{signature}"}
+    assert client.verify_webhook(headers, body)
+    assert not client.verify_webhook(headers, body + b" ")
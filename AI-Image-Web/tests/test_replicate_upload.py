@@ -0,0 +1,94 @@
+"""
+Caption and init image uploads to Replicate: downsizing, formats and EXIF, unreadable input
+"""
+import io
+
+import httpx
+import pytest
+from PIL import Image
+
+from engine.backends import ReplicateBackend
+from engine.core import EngineError
+from replicate_client import InvalidImage, ReplicateClient, downsize_image
+
+pytestmark = pytest.mark.anyio
+
+
+def encode(img: Image.Image, fmt: str, **params) -> bytes:
+    out = io.BytesIO()
+    img.save(out, fmt, **params)
+    return out.getvalue()
+
+
+def decode(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data))
+
+
+def test_large_images_are_downsized_to_jpeg():
+    data, mime = downsize_image(encode(Image.new("RGBA", (1600, 800), (255, 0, 0, 128)), "PNG"), 384)
+    assert mime == "image/jpeg"
+    img = decode(data)
+    assert img.format == "JPEG" and img.mode == "RGB" and img.size == (384, 192)
+
+
+@pytest.mark.parametrize("fmt, mime", [("JPEG", "image/jpeg"), ("PNG", "image/png")])
+def test_small_jpeg_and_png_are_sent_as_they_are(fmt, mime):
+    original = encode(Image.new("RGB", (200, 100), "blue"), fmt)
+    assert downsize_image(original, 384) == (original, mime)
+
+
+@pytest.mark.parametrize("fmt", ["WEBP", "GIF", "BMP"])
+def test_other_formats_become_jpeg(fmt):
+    data, mime = downsize_image(encode(Image.new("RGB", (200, 100), "green"), fmt), 384)
+    assert mime == "image/jpeg"
+    assert decode(data).size == (200, 100)
+
+
+def test_exif_orientation_is_applied_before_the_exif_is_dropped():
+    img = Image.new("RGB", (800, 400), "white")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+    data, _ = downsize_image(encode(img, "JPEG", exif=exif), 200)
+    out = decode(data)
+    assert out.size == (100, 200)
+    assert out.getexif().get(0x0112) is None
+
+
+@pytest.mark.parametrize("data", [b"", b"not an image", encode(Image.new("RGB", (800, 800)), "PNG")[:200]])
+def test_unreadable_images_raise_invalid_image(data):
+    with pytest.raises(InvalidImage):
+        downsize_image(data, 384)
+
+
+async def test_unreadable_caption_images_are_a_400():
+    uploads = []
+    backend = ReplicateBackend(api_token="token")
+    backend.replicate.client = httpx.AsyncClient(transport=httpx.MockTransport(uploads.append))
+    try:
+        with pytest.raises(EngineError) as e:
+            await backend.caption(b"not an image")
+    finally:
+        await backend.replicate.close()
+    assert e.value.status_code == 400
+    assert e.value.message == "Not a readable image (UnidentifiedImageError)"
+    assert uploads == []
+
+
+async def test_uploads_are_cached_per_content():
+    uploads = []
+
+    def files_endpoint(request):
+        uploads.append(request)
+        return httpx.Response(201, json={"urls": {"get": f"https://api.test/v1/files/{len(uploads)}"}})
+
+    client = ReplicateClient("token", base_url="https://api.test", webhook_url="", webhook_secret="")
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(files_endpoint))
+    image = encode(Image.new("RGB", (1000, 1000), "red"), "PNG")
+    try:
+        first = await client.upload_image(image)
+        second = await client.upload_image(image)
+    finally:
+        await client.close()
+    assert first == second == "https://api.test/v1/files/1"
+    assert len(uploads) == 1
+    assert b'filename="' in uploads[0].content and b"image/jpeg" in uploads[0].content
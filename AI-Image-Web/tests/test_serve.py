@@ -0,0 +1,65 @@
+"""
+serve.py: which URL paths resolve to files, and brotli variants without the brotli module
+"""
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import serve
+
+PAGE = b"<!doctype html><title>x</title>" + b"<p>hello</p>" * 200
+
+
+@pytest.fixture
+def root(tmp_path):
+    (tmp_path / "index.html").write_bytes(PAGE)
+    (tmp_path / "my page.html").write_bytes(PAGE)
+    (tmp_path / "users.db").write_bytes(b"SQLite format 3\0")
+    (tmp_path / "quota.py").write_text("SECRET = 1\n")
+    return tmp_path
+
+
+def test_resolves_frontend_files_with_queries_and_escapes(root):
+    cache = serve.StaticCache(str(root))
+    assert cache.resolve("/index.html?v=3") == os.path.join(cache.root, "index.html")
+    assert cache.resolve("/my%20page.html#top") == os.path.join(cache.root, "my page.html")
+    assert cache.resolve("/") == os.path.join(cache.root, "index.html")
+
+
+@pytest.mark.parametrize("path", ["/users.db", "/quota.py", "/quota.py?x=.html", "/%2e%2e/etc/passwd",
+                                  "/index.html%00.js", "/missing.html"])
+def test_refuses_everything_else(root, path):
+    assert serve.StaticCache(str(root)).get(path) is None
+
+
+def test_stale_br_without_brotli_is_not_served(root, monkeypatch):
+    monkeypatch.setattr(serve, "brotli", None)
+    br_path = root / "index.html.br"
+    br_path.write_bytes(b"old")
+    os.utime(br_path, (0, 0))
+    assert set(serve.StaticFile(str(root / "index.html")).variants) == {"gzip"}
+
+
+def test_fresh_br_without_brotli_is_served(root, monkeypatch):
+    monkeypatch.setattr(serve, "brotli", None)
+    (root / "index.html.br").write_bytes(b"precompressed")
+    assert serve.StaticFile(str(root / "index.html")).variants["br"] == b"precompressed"
+
+
+def test_server_answers_queries_and_hides_the_database(root, monkeypatch):
+    monkeypatch.setattr(serve.StaticHandler, "log_message", lambda self, *args: None)
+    httpd = serve.make_server(0, root=str(root), host="127.0.0.1")
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{base}/my%20page.html?v=1") as response:
+            assert response.read() == PAGE
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"{base}/users.db")
+        assert e.value.code == 404
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
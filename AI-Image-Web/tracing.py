@@ -0,0 +1,394 @@
+"""
+OpenTelemetry-compatible request tracing
+Spans follow W3C trace context: an incoming traceparent header continues the
+caller's trace, and requests to the WebUI and Replicate carry ours. Finished
+spans are batched on a daemon thread and exported as OTLP/HTTP JSON, to a
+collector (TRACE_EXPORTER=otlp) or appended to a JSON lines file
+(TRACE_EXPORTER=file). TRACE_SAMPLE_RATIO is the share of new traces that
+get recorded; at 0 (the default) tracing is off, every span is a shared
+no-op and HTTP clients are not wrapped.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATIO = min(1.0, max(0.0, float(os.environ.get("TRACE_SAMPLE_RATIO", 0))))
+TRACING_ENABLED = TRACE_SAMPLE_RATIO > 0
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "otlp").lower()  # otlp | file | none
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or (
+    os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/") + "/v1/traces")
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "ai-image-web")
+TRACE_EXPORT_INTERVAL = float(os.environ.get("TRACE_EXPORT_INTERVAL", 5))
+TRACE_BATCH_SIZE = 512
+# Finished spans waiting for export; the oldest are dropped if the exporter falls behind
+TRACE_BUFFER_SIZE = 8192
+
+# OTLP span kinds and status code
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+
+_SAMPLE_BOUND = int(TRACE_SAMPLE_RATIO * (1 << 64))
+_TRACEPARENT_RE = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+# (stage, seconds) of the current request's stages, when something collects them (profiler.py)
+stage_timings: contextvars.ContextVar = contextvars.ContextVar("stage_timings", default=None)
+
+
+class Span:
+    """A recorded span; entering it makes it the parent of spans started inside"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind", "attributes", "error",
+                 "start_ns", "end_ns", "_token")
+    recording = True
+
+    def __init__(self, name: str, trace_id: int, parent_id: Optional[int], kind: int, attributes: Optional[dict]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64) or 1
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.error = message
+
+    def update_name(self, name: str):
+        self.name = name
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id:032x}-{self.span_id:016x}-01"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            _exporter.add(self)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and self.error is None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        self.end()
+
+
+class NonRecordingSpan:
+    """A span that is not sampled; spans started inside it are not recorded either"""
+
+    __slots__ = ("_token",)
+    recording = False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def update_name(self, name: str):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+
+
+class _NoopSpan(NonRecordingSpan):
+    """Returned when tracing is off or the trace is unsampled; leaves the current span alone"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace id, parent span id, sampled) from a W3C traceparent header, or None"""
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if match is None:
+        return None
+    trace_id, span_id = int(match.group(1), 16), int(match.group(2), 16)
+    if not trace_id or not span_id:
+        return None
+    return trace_id, span_id, bool(int(match.group(3), 16) & 1)
+
+
+def start_span(name: str, kind: int = INTERNAL, attributes: Optional[dict] = None,
+               traceparent: Optional[str] = None):
+    """
+    Start a span under the current one; without one, continue the trace in
+    traceparent (if sampled there) or start a new trace (if sampled here)
+    """
+    if not TRACING_ENABLED:
+        return NOOP
+    parent = _current.get()
+    if parent is not None:
+        if not parent.recording:
+            return NOOP
+        return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+    remote = parse_traceparent(traceparent)
+    if remote is not None:
+        trace_id, parent_id, sampled = remote
+        return Span(name, trace_id, parent_id, kind, attributes) if sampled else NonRecordingSpan()
+
+    trace_id = random.getrandbits(128) or 1
+    # Decided from the trace id, like OpenTelemetry's TraceIdRatioBased sampler
+    if trace_id & 0xFFFFFFFFFFFFFFFF >= _SAMPLE_BOUND:
+        return NonRecordingSpan()
+    return Span(name, trace_id, None, kind, attributes)
+
+
+def current_span():
+    return _current.get()
+
+
+def attach(span):
+    """Make span current (e.g. a request's span in a worker thread or task); returns a token for detach"""
+    return _current.set(span)
+
+
+def detach(token):
+    _current.reset(token)
+
+
+def inject(headers):
+    """Add the current span's traceparent to outgoing headers (dict or httpx.Headers)"""
+    span = _current.get()
+    if span is not None and span.recording:
+        headers["traceparent"] = span.traceparent()
+    return headers
+
+
+class _Stage:
+    __slots__ = ("name", "child", "span", "start")
+
+    def __init__(self, name, child, span):
+        self.name = name
+        self.child = child
+        self.span = span
+
+    def __enter__(self):
+        self.span.__enter__()
+        self.start = time.perf_counter()
+        return self.span
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.child.observe(elapsed)
+        timings = stage_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        self.span.__exit__(*exc)
+
+
+def stage(histogram, name: str, attributes: Optional[dict] = None) -> _Stage:
+    """
+    Time a request stage into histogram (labelled name), the request's
+    stage_timings if collected and, when traced, a span of the same name
+    """
+    return _Stage(name, histogram.labels(name), start_span(name, attributes=attributes))
+
+
+# -------------------------------------------------
+# Outgoing HTTP requests
+# -------------------------------------------------
+
+def _client_span(request: httpx.Request):
+    return start_span(f"{request.method} {request.url.path}", CLIENT, {
+        "http.request.method": request.method,
+        # Without the query string: result URLs may carry signatures
+        "url.full": str(request.url.copy_with(query=None)),
+        "server.address": request.url.host,
+    })
+
+
+def _record_response(span, response: httpx.Response):
+    span.set_attribute("http.response.status_code", response.status_code)
+    if response.status_code >= 400:
+        span.set_error(f"HTTP {response.status_code}")
+
+
+class TracedTransport(httpx.BaseTransport):
+    """A client span per request, with its traceparent sent along"""
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with _client_span(request) as span:
+            inject(request.headers)
+            response = self.transport.handle_request(request)
+            _record_response(span, response)
+            return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncTracedTransport(httpx.AsyncBaseTransport):
+    """Async TracedTransport"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with _client_span(request) as span:
+            inject(request.headers)
+            response = await self.transport.handle_async_request(request)
+            _record_response(span, response)
+            return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def traced(transport):
+    """Wrap an httpx transport for tracing (returned unchanged when tracing is off)"""
+    if not TRACING_ENABLED:
+        return transport
+    if isinstance(transport, httpx.AsyncBaseTransport):
+        return AsyncTracedTransport(transport)
+    return TracedTransport(transport)
+
+
+# -------------------------------------------------
+# Export
+# -------------------------------------------------
+
+def _value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: Dict) -> List[dict]:
+    return [{"key": key, "value": _value(value)} for key, value in attributes.items()]
+
+
+def encode(spans: List[Span]) -> dict:
+    """An OTLP/JSON ExportTraceServiceRequest for a batch of finished spans"""
+    encoded = []
+    for span in spans:
+        item = {
+            "traceId": f"{span.trace_id:032x}",
+            "spanId": f"{span.span_id:016x}",
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _attributes(span.attributes),
+        }
+        if span.parent_id:
+            item["parentSpanId"] = f"{span.parent_id:016x}"
+        if span.error is not None:
+            item["status"] = {"code": STATUS_ERROR, "message": span.error}
+        encoded.append(item)
+    resource = {"service.name": SERVICE_NAME, "process.pid": os.getpid()}
+    return {"resourceSpans": [{
+        "resource": {"attributes": _attributes(resource)},
+        "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": encoded}],
+    }]}
+
+
+class SpanExporter:
+    """Buffers finished spans and ships them in batches from a daemon thread (one per process)"""
+
+    def __init__(self, exporter: str = TRACE_EXPORTER, endpoint: str = OTLP_ENDPOINT, path: str = TRACE_FILE):
+        self.exporter = exporter
+        self.endpoint = endpoint
+        self.path = path
+        self.spans: deque = deque(maxlen=TRACE_BUFFER_SIZE)
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def add(self, span: Span):
+        if self.exporter not in ("otlp", "file"):
+            return
+        if self._pid != os.getpid():
+            self._start()
+        self.spans.append(span)
+        if len(self.spans) >= TRACE_BATCH_SIZE:
+            self.wakeup.set()
+
+    def _start(self):
+        # Per process: a thread started before fork does not exist in the child,
+        # and the parent's export lock may have been copied while held
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self.spans.clear()
+                self.lock = threading.Lock()
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(TRACE_EXPORT_INTERVAL)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Export everything buffered so far"""
+        with self.lock:
+            while self.spans:
+                batch = []
+                while self.spans and len(batch) < TRACE_BATCH_SIZE:
+                    batch.append(self.spans.popleft())
+                try:
+                    self.export(batch)
+                except Exception as e:
+                    logger.warning(f"Trace export failed, dropped {len(batch)} spans: {e}")
+
+    def export(self, spans: List[Span]):
+        body = encode(spans)
+        if self.exporter == "file":
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(body, separators=(",", ":")) + "\n")
+        else:
+            httpx.post(self.endpoint, json=body, timeout=10.0).raise_for_status()
+
+
+_exporter = SpanExporter()
+if TRACING_ENABLED:
+    atexit.register(_exporter.flush)
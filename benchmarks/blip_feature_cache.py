@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /image-to-text latency for repeat questions with and without the BLIP feature cache
+Run: python benchmarks/blip_feature_cache.py [--images DIR] [--questions 4] [--rounds 2] [--max-new-tokens 30]
+
+Asks --questions questions (the first one a plain caption request) about
+each image in a fixed local set (default: the PNGs in qus/), through
+engine.captioning.caption_image as the API does, once with the feature
+cache off and once on, interleaved per round. Reports the mean latency of
+the first request per image (always a miss) and of the later ones (hits
+when the cache is on), the cache's bytes per image, and whether both runs
+answered identically.
+Default model: the BLIP-large-sized build of benchmarks/tiny_blip.py (see its notes on the captions).
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "AI-Image-Web"))
+sys.path.insert(0, HERE)
+
+from tiny_blip import build  # noqa: E402
+
+QUESTIONS = [None, "what is in the picture?", "what color is the background?", "how many people are there?",
+             "is there any text?", "where was this taken?"]
+
+
+def run(captioning, images, questions, decoding):
+    """Answers, and seconds for first and later questions per image; the cache is empty at the start"""
+    captioning.feature_cache.entries.clear()
+    captioning.feature_cache.size = 0
+    answers, first, later = [], [], []
+    for img_bytes in images:
+        for i, question in enumerate(questions):
+            start = time.perf_counter()
+            answers.append(captioning.caption_image(img_bytes, question, decoding))
+            (later if i else first).append(time.perf_counter() - start)
+    return answers, first, later
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", default=os.path.join(HERE, "..", "qus"), help="directory of images")
+    parser.add_argument("--questions", type=int, default=4, help=f"per image, at most {len(QUESTIONS)}")
+    parser.add_argument("--rounds", type=int, default=2, help="per mode, interleaved")
+    parser.add_argument("--max-new-tokens", type=int, default=30)
+    parser.add_argument("--model", default=None, help="Hub id or directory (default: build the tiny model)")
+    args = parser.parse_args()
+
+    os.environ["BLIP_MODEL"] = args.model or build(full_vision=True, full_text_decoder=True)
+    os.environ.setdefault("BLIP_FEATURE_CACHE_MB", "256")  # room for the whole image set
+    from engine import captioning
+    from engine.core import DecodingOptions
+
+    paths = sorted(p for p in glob.glob(os.path.join(args.images, "*"))
+                   if p.lower().endswith((".png", ".jpg", ".jpeg", ".webp")))
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    questions = QUESTIONS[:args.questions]
+    decoding = DecodingOptions(args.max_new_tokens)
+    max_bytes = captioning.feature_cache.max_bytes
+    captioning.load_blip_model()
+    captioning.caption_image(images[0], None, decoding)  # warm-up
+
+    results = {mode: {"first": [], "later": []} for mode in ("off", "on")}
+    answers = {}
+    for _ in range(args.rounds):
+        for mode in ("off", "on"):
+            captioning.feature_cache.max_bytes = max_bytes if mode == "on" else 0
+            answers[mode], first, later = run(captioning, images, questions, decoding)
+            results[mode]["first"].extend(first)
+            results[mode]["later"].extend(later)
+    stats = captioning.feature_cache.stats()
+
+    off, on = (statistics.mean(results[m]["later"]) for m in ("off", "on"))
+    print(json.dumps({
+        "model": os.environ["BLIP_MODEL"],
+        "images": len(images),
+        "questions_per_image": len(questions),
+        **{f"{mode}_{kind}_mean_s": round(statistics.mean(results[mode][kind]), 3)
+           for mode in ("off", "on") for kind in ("first", "later")},
+        "later_speedup": round(off / on, 2),
+        "cache_bytes_per_image": stats["bytes"] // max(1, stats["images"]),
+        "identical_answers": answers["off"] == answers["on"],
+    }, indent=2))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark: BLIP caption latency and agreement with fp32 for each BLIP_PRECISION
+Run: python benchmarks/blip_precision.py [--images DIR] [--model DIR] [--modes fp32,bf16-vision,...] [--max-length 30]
+
+Captions a fixed set of local images (default: the PNGs in qus/) on the
+CPU once per mode of engine.captioning.apply_precision, with a fresh copy of
+the model each time. Reports the mean latency per image, the speed-up over
+fp32, how many captions are identical to fp32's and their mean word-level
+similarity to them (difflib ratio, 1.0 = same words in the same order),
+plus every caption.
+Default model: the BLIP-large-sized build of benchmarks/tiny_blip.py (see its notes on the captions).
+"""
+import argparse
+import difflib
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "AI-Image-Web"))
+sys.path.insert(0, HERE)
+
+import torch  # noqa: E402
+from PIL import Image  # noqa: E402
+from transformers import BlipForConditionalGeneration, BlipProcessor  # noqa: E402
+
+from engine.captioning import PRECISIONS, apply_precision  # noqa: E402
+from tiny_blip import build  # noqa: E402
+
+
+def caption_all(model, processor, images, max_length):
+    """Captions and per-image seconds, after one warm-up caption"""
+    def caption(img):
+        with torch.no_grad():
+            ids = model.generate(**processor(img, return_tensors="pt"), max_length=max_length)
+        return processor.decode(ids[0], skip_special_tokens=True)
+
+    caption(images[0])
+    captions, seconds = [], []
+    for img in images:
+        start = time.perf_counter()
+        captions.append(caption(img))
+        seconds.append(time.perf_counter() - start)
+    return captions, seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", default=os.path.join(HERE, "..", "qus"), help="directory of images")
+    parser.add_argument("--model", default=None, help="Hub id or directory (default: build the tiny model)")
+    parser.add_argument("--modes", default=",".join(PRECISIONS), help="comma-separated; fp32 always runs")
+    parser.add_argument("--max-length", type=int, default=30)
+    args = parser.parse_args()
+
+    model_id = args.model or build(full_vision=True, full_text_decoder=True)
+    paths = sorted(p for p in glob.glob(os.path.join(args.images, "*"))
+                   if p.lower().endswith((".png", ".jpg", ".jpeg", ".webp")))
+    images = [Image.open(p).convert("RGB") for p in paths]
+    processor = BlipProcessor.from_pretrained(model_id)
+    modes = ["fp32"] + [m for m in args.modes.split(",") if m and m != "fp32"]
+
+    results, baseline = {}, None
+    for mode in modes:
+        model = BlipForConditionalGeneration.from_pretrained(model_id).eval()
+        apply_precision(model, mode)
+        captions, seconds = caption_all(model, processor, images, args.max_length)
+        del model
+        baseline = baseline or captions
+        results[mode] = {
+            "mean_s": round(statistics.mean(seconds), 3),
+            "speedup": round(results["fp32"]["mean_s"] / statistics.mean(seconds), 2) if results else 1.0,
+            "identical": f"{sum(a == b for a, b in zip(captions, baseline))}/{len(captions)}",
+            "similarity": round(statistics.mean(difflib.SequenceMatcher(None, a.split(), b.split()).ratio()
+                                                for a, b in zip(captions, baseline)), 3),
+            "captions": captions,
+        }
+
+    print(json.dumps({"model": model_id, "images": [os.path.basename(p) for p in paths],
+                      "threads": torch.get_num_threads(), "modes": results}, indent=2))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark: captioning throughput (images/s), one image per call vs engine.bulk batches
+Run: python benchmarks/bulk_captioning.py [--images DIR] [--copies 2] [--batch-sizes 1,4,8] [--workers 2] [--max-new-tokens 20]
+
+Captions a fixed local image set (default: the PNGs in qus/, each copied
+--copies times into a temporary folder) on the CPU in each case: one
+engine.captioning.caption_image call per image, as one /image-to-text
+request each does, and engine.bulk.caption_folder, as the CLI runs, for
+every --batch-sizes value with decoding in this process and, when --workers
+is set, in that many decoding processes. The model is loaded first and not
+counted. Reports images/s, the speed-up over one image per call and whether
+every case captioned identically, as JSON.
+Default model: the BLIP-large-sized build of benchmarks/tiny_blip.py (see its notes on the captions).
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "AI-Image-Web"))
+sys.path.insert(0, HERE)
+
+from tiny_blip import build  # noqa: E402
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", default=os.path.join(HERE, "..", "qus"), help="directory of images")
+    parser.add_argument("--copies", type=int, default=2, help="of each image in the folder")
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--workers", type=int, default=0, help="also run with this many decoding processes")
+    parser.add_argument("--max-new-tokens", type=int, default=20)
+    parser.add_argument("--model", default=None, help="Hub id or directory (default: build the tiny model)")
+    args = parser.parse_args()
+
+    os.environ["BLIP_MODEL"] = args.model or build(full_vision=True, full_text_decoder=True)
+    os.environ["BLIP_FEATURE_CACHE_MB"] = "0"  # copies of an image would hit it
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    from engine import bulk, captioning
+    from engine.core import DecodingOptions
+
+    folder = tempfile.mkdtemp(prefix="bulk-captioning-")
+    for path in sorted(glob.glob(os.path.join(args.images, "*"))):
+        if path.lower().endswith(bulk.IMAGE_EXTENSIONS):
+            for i in range(args.copies):
+                shutil.copy(path, os.path.join(folder, f"{i}-{os.path.basename(path)}"))
+    names = bulk.find_images(folder)
+    decoding = DecodingOptions(args.max_new_tokens)
+    captioning.load_blip_model()
+    with open(os.path.join(folder, names[0]), "rb") as f:
+        captioning.caption_image(f.read(), None, decoding)  # warm-up
+
+    results, captions = {}, {}
+    start = time.perf_counter()
+    texts = []
+    for name in names:
+        with open(os.path.join(folder, name), "rb") as f:
+            texts.append(captioning.caption_image(f.read(), None, decoding))
+    results["one per call"] = len(names) / (time.perf_counter() - start)
+    captions["one per call"] = texts
+
+    cases = [(f"bulk batch={b}", int(b), 0) for b in args.batch_sizes.split(",")]
+    if args.workers:
+        cases += [(f"bulk batch={b} workers={args.workers}", int(b), args.workers) for b in args.batch_sizes.split(",")]
+    for label, batch_size, workers in cases:
+        out = os.path.join(folder, "captions.jsonl")
+        stats = bulk.caption_folder(folder, out, None, decoding, batch_size, workers)
+        with open(out) as f:
+            records = {r["file"]: r.get("text") for r in map(json.loads, f)}
+        os.remove(out)
+        results[label] = stats["images_per_second"]
+        captions[label] = [records[name] for name in names]
+    shutil.rmtree(folder)
+
+    baseline = results["one per call"]
+    print(json.dumps({
+        "model": os.environ["BLIP_MODEL"],
+        "images": len(names),
+        "max_new_tokens": args.max_new_tokens,
+        "cpus": os.cpu_count(),
+        "cases": {label: {"images_per_second": round(rate, 3), "speedup": round(rate / baseline, 2)}
+                  for label, rate in results.items()},
+        "identical_captions": all(c == captions["one per call"] for c in captions.values()),
+    }, indent=2))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /image-to-text time to first token and total latency, blocking vs streamed
+Run: python benchmarks/caption_streaming.py [--rounds 3] [--tokens 20,40,75] [--beams 3] [--model DIR]
+
+Runs api.py (uvicorn, in a subprocess, BLIP on the CPU with the feature
+cache off) and, per round, captions one image from qus/ in each case:
+POST /image-to-text for every --tokens cap with greedy decoding and with
+--beams beams (within CAPTION_MAX_COST), and POST /image-to-text/stream for
+every cap. Reports the mean time to the first text (for blocking calls, the
+whole response) and to the complete answer, as JSON.
+Default model: the BLIP-large-sized build of benchmarks/tiny_blip.py (see its notes on the captions).
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "AI-Image-Web")
+sys.path.insert(0, HERE)
+sys.path.insert(0, APP_DIR)
+
+from flask_concurrency import free_port  # noqa: E402
+from quota import CAPTION_MAX_COST  # noqa: E402
+from tiny_blip import build  # noqa: E402
+
+
+def blocking(url, image, form):
+    start = time.perf_counter()
+    res = requests.post(f"{url}/image-to-text", data=form, files={"image": ("image.png", image)}, timeout=600)
+    res.raise_for_status()
+    total = time.perf_counter() - start
+    return total, total
+
+
+def streamed(url, image, form):
+    start = time.perf_counter()
+    first = None
+    with requests.post(f"{url}/image-to-text/stream", data=form, files={"image": ("image.png", image)},
+                       stream=True, timeout=600) as res:
+        res.raise_for_status()
+        event = None
+        for line in res.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                if event == "error":
+                    raise RuntimeError(line)
+                if first is None:
+                    first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=3, help="each case once per round, interleaved")
+    parser.add_argument("--tokens", default="20,40,75", help="max_new_tokens caps")
+    parser.add_argument("--beams", type=int, default=3)
+    parser.add_argument("--question", default="what is in the picture?")
+    parser.add_argument("--model", default=None, help="Hub id or directory (default: build the tiny model)")
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONPATH": APP_DIR, "BLIP_MODEL": args.model or build(full_vision=True,
+                                                                                    full_text_decoder=True),
+           "BLIP_FEATURE_CACHE_MB": "0", "CUDA_VISIBLE_DEVICES": ""}
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "api:app", "--port", str(port),
+                               "--log-level", "warning"], cwd=tempfile.mkdtemp(), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(600):
+            try:
+                requests.get(url, timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.1)
+        images = []
+        for path in sorted(glob.glob(os.path.join(HERE, "..", "qus", "*.png"))):
+            with open(path, "rb") as f:
+                images.append(f.read())
+
+        cases = []
+        for tokens in (int(t) for t in args.tokens.split(",")):
+            cases.append((f"blocking greedy {tokens}", blocking, {"max_new_tokens": tokens}))
+            if tokens * args.beams <= CAPTION_MAX_COST:
+                cases.append((f"blocking beams={args.beams} {tokens}", blocking,
+                              {"max_new_tokens": tokens, "num_beams": args.beams}))
+            cases.append((f"stream greedy {tokens}", streamed, {"max_new_tokens": tokens}))
+        blocking(url, images[0], {"max_new_tokens": 5})  # load BLIP
+
+        times = {name: ([], []) for name, _, _ in cases}
+        for i in range(args.rounds):
+            image = images[i % len(images)]
+            for name, call, form in cases:
+                first, total = call(url, image, {"question": args.question, **form})
+                times[name][0].append(first)
+                times[name][1].append(total)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    print(json.dumps({
+        "model": env["BLIP_MODEL"],
+        "rounds": args.rounds,
+        "cases": {name: {"first_token_s": round(statistics.mean(first), 3),
+                         "total_s": round(statistics.mean(total), 3)} for name, (first, total) in times.items()},
+    }, indent=2))
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Fake Stable Diffusion WebUI and Replicate servers for benchmarks
+Run: python benchmarks/fakes.py webui|replicate [--port 0] [--latency 1.0] [--jitter 0.1] [--image-side 512]
+
+Both answer just enough of the real API for the apps to work end to end,
+after --latency seconds (+/- --jitter as a fraction, from a seeded RNG so
+runs repeat) with --image-side square noise PNGs, which don't compress
+away, so payloads are realistically sized.
+  webui     - /sdapi/v1/txt2img and /sdapi/v1/img2img (STABLE_URL)
+  replicate - predictions (polled until --latency has passed), /v1/files
+              uploads and the output files (REPLICATE_API_URL)
+Run standalone, a server prints its URL and serves until interrupted.
+"""
+import argparse
+import base64
+import http.server
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from PIL import Image
+
+
+def noise_png(side=512, seed=0):
+    """PNG bytes of random pixels"""
+    pixels = random.Random(seed).randbytes(side * side * 3)
+    buf = io.BytesIO()
+    Image.frombytes("RGB", (side, side), pixels).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class FakeServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, handler, port=0, latency=1.0, jitter=0.1, image_side=512, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.png = noise_png(image_side, seed)
+        self.png_base64 = base64.b64encode(self.png).decode("ascii")
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        super().__init__(("127.0.0.1", port), handler)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def delay(self):
+        with self.lock:
+            self.requests += 1
+            return self.latency * (1 + self.random.uniform(-self.jitter, self.jitter))
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FakeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; avoid Nagle + delayed-ACK stalls
+    disable_nagle_algorithm = True
+
+    def body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def reply(self, body, status=200, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class WebUIHandler(FakeHandler):
+    """AUTOMATIC1111 WebUI: one image per batch_size * n_iter"""
+
+    def do_GET(self):
+        self.reply({"ok": True})
+
+    def do_POST(self):
+        if self.path not in ("/sdapi/v1/txt2img", "/sdapi/v1/img2img"):
+            return self.reply({"detail": "Not Found"}, 404)
+        payload = json.loads(self.body())
+        time.sleep(self.server.delay())
+        count = payload.get("batch_size", 1) * payload.get("n_iter", 1)
+        seed = payload.get("seed", -1)
+        info = json.dumps({"seed": seed if seed != -1 else 1234})
+        self.reply({"images": [self.server.png_base64] * count, "info": info})
+
+
+class FakeWebUI(FakeServer):
+    def __init__(self, **kwargs):
+        super().__init__(WebUIHandler, **kwargs)
+
+
+class ReplicateHandler(FakeHandler):
+    """Replicate predictions API: predictions finish --latency seconds after creation"""
+
+    PREDICTION_RE = re.compile(r"^/v1/predictions/([0-9a-f]+)$")
+
+    def do_GET(self):
+        match = self.PREDICTION_RE.match(self.path)
+        if match:
+            return self.reply(self.server.prediction(match.group(1)))
+        if self.path.startswith("/files/"):
+            return self.reply(self.server.png, content_type="image/png")
+        self.reply({"ok": True})
+
+    def do_POST(self):
+        body = self.body()
+        if self.path == "/v1/predictions":
+            return self.reply(self.server.create(json.loads(body)["input"]), 201)
+        if self.path == "/v1/files":
+            return self.reply({"id": uuid.uuid4().hex, "urls": {"get": f"{self.server.url}/files/upload"}}, 201)
+        self.reply({"detail": "Not Found"}, 404)
+
+
+class FakeReplicate(FakeServer):
+    def __init__(self, **kwargs):
+        super().__init__(ReplicateHandler, **kwargs)
+        self.predictions = {}
+
+    def create(self, inputs):
+        prediction_id = uuid.uuid4().hex
+        self.predictions[prediction_id] = (time.monotonic(), self.delay(), inputs)
+        return {"id": prediction_id, "status": "starting"}
+
+    def prediction(self, prediction_id):
+        created, duration, inputs = self.predictions[prediction_id]
+        elapsed = time.monotonic() - created
+        if elapsed < duration:
+            # The progress bar the client estimates its next poll from
+            return {"id": prediction_id, "status": "processing", "logs": f"{int(100 * elapsed / duration)}%|###"}
+        if "prompt" in inputs:
+            output = [f"{self.url}/files/out.png"] * inputs.get("num_outputs", 1)
+        else:
+            output = "Caption: a photo of a benchmark"
+        return {"id": prediction_id, "status": "succeeded", "output": output, "seed": inputs.get("seed") or 1234}
+
+
+FAKES = {"webui": FakeWebUI, "replicate": FakeReplicate}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("kind", choices=sorted(FAKES))
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per generation")
+    parser.add_argument("--jitter", type=float, default=0.1, help="latency spread as a fraction")
+    parser.add_argument("--image-side", type=int, default=512, help="output image size in pixels")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FAKES[args.kind](port=args.port, latency=args.latency, jitter=args.jitter,
+                              image_side=args.image_side, seed=args.seed)
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Benchmark: api_flask.py on the Werkzeug dev server vs gunicorn
+Run: python benchmarks/flask_concurrency.py [--clients 32] [--requests 256] [--delay 0.5]
+
+A stub Stable Diffusion WebUI answers /sdapi/v1/txt2img after --delay
+seconds with an --image-side square PNG (512 by default). Both servers proxy /generate to it under
+concurrent clients; throughput, latency percentiles, errors and the number
+of TCP connections the WebUI had to accept are printed as JSON.
+"""
+import argparse
+import base64
+import http.server
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AI-Image-Web")
+
+
+def noise_png(side=512):
+    """A PNG that doesn't compress away, so payloads are realistically sized"""
+    img = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+class StubWebUI(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, delay, image_side):
+        self.delay = delay
+        self.body = json.dumps({"images": [noise_png(image_side)]}).encode("utf-8")
+        self.connections = 0
+        self.lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), StubHandler)
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; avoid Nagle + delayed-ACK stalls
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api(mode, port, stable_url, workers, threads, workdir):
+    env = {
+        **os.environ,
+        "STABLE_URL": stable_url,
+        "PYTHONPATH": APP_DIR,
+        "WEB_CONCURRENCY": str(workers),
+        "FLASK_THREADS": str(threads),
+        "WEBUI_POOL_SIZE": str(threads),
+        # Every client shares one IP; keep the per-user quota out of the measurement
+        "RATE_LIMIT_BURST": "1e9",
+        "RATE_LIMIT_PER_MINUTE": "1e9",
+        "GPU_QUOTA_BURST": "1e12",
+        "GPU_QUOTA_PER_HOUR": "1e12",
+    }
+    if mode == "dev":
+        cmd = [sys.executable, "-c",
+               f"import api_flask; api_flask.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    else:
+        cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(APP_DIR, "gunicorn.conf.py"),
+               "--bind", f"127.0.0.1:{port}", "--access-logfile", "/dev/null", "api_flask:app"]
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_client(port, count):
+    latencies, errors = [], 0
+    session = requests.Session()
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            res = session.post(f"http://127.0.0.1:{port}/generate", data={"prompt": "benchmark"}, timeout=120)
+            if not res.ok or "error" in res.json():
+                errors += 1
+        except requests.RequestException:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, errors
+
+
+def bench(mode, args, workdir):
+    stub = StubWebUI(args.delay, args.image_side)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    port = free_port()
+    proc = start_api(mode, port, f"http://127.0.0.1:{stub.server_address[1]}", args.workers, args.threads, workdir)
+    stub.connections = 0  # ignore anything before the measured run
+
+    per_client = max(1, args.requests // args.clients)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        results = list(pool.map(lambda _: run_client(port, per_client), range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    proc.terminate()
+    proc.wait(timeout=30)
+    stub.shutdown()
+    stub.server_close()
+
+    latencies = [l for r in results for l in r[0]]
+    return {
+        "requests": len(latencies),
+        "errors": sum(r[1] for r in results),
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "webui_connections": stub.connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--delay", type=float, default=0.5, help="stub WebUI seconds per generation")
+    parser.add_argument("--image-side", type=int, default=512, help="stub WebUI image size in pixels")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=16, help="gunicorn threads per worker")
+    args = parser.parse_args()
+
+    report = {"ideal_rps": round(args.clients / args.delay, 2)}
+    with tempfile.TemporaryDirectory() as workdir:
+        # /generate saves into ./output; keep that out of the repository
+        for mode in ("dev", "gunicorn"):
+            report[mode] = bench(mode, args, workdir)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
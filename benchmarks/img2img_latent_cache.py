@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark: an img2img strength sweep over one image, with and without the init-latent cache
+Run: python benchmarks/img2img_latent_cache.py [--strengths 0.3,0.45,0.6,0.75,0.9] [--steps 10] [--side 512]
+
+Sweeps denoising strength over one uploaded photo, the way users iterate,
+through both img2img paths that encode init images locally:
+  space  - huggingface-space/app.py's pipeline call (latent_cache.py)
+  engine - api.py's in-process diffusers backend (DIFFUSERS_LATENT_CACHE)
+Each runs once re-encoding the image every request and once with the cache.
+The default model is the tiny pipeline with an SD 1.5-sized VAE
+(benchmarks/tiny_model.py --full-vae), so encoding costs what it does on
+the real model. Also checks that cached runs produce identical images.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "huggingface-space"))
+sys.path.insert(0, os.path.join(HERE, "..", "AI-Image-Web"))
+sys.path.insert(0, HERE)
+
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+from diffusers import StableDiffusionImg2ImgPipeline  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from latent_cache import InitLatentCache  # noqa: E402
+from tiny_model import build  # noqa: E402
+
+PROMPT = "the same scene as a watercolor painting"
+
+
+def photo(side):
+    """A smooth synthetic 'photo' as JPEG bytes (the kind of upload img2img gets)"""
+    x = np.linspace(0, 1, side * 2)
+    gradient = np.stack([np.outer(x, x), np.outer(x[::-1], x), np.outer(x, x[::-1])], axis=-1)
+    buf = io.BytesIO()
+    Image.fromarray((gradient * 255).astype("uint8")).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def sweep_space(pipe, upload, strengths, steps, side, cache=None):
+    latencies, images = [], []
+    for strength in strengths:
+        start = time.perf_counter()
+        init_image = Image.open(io.BytesIO(upload))
+        generator = torch.Generator("cpu").manual_seed(0)
+        if cache is None:
+            image = init_image.convert("RGB").resize((side, side))
+        else:
+            image = cache.encode(pipe, init_image, (side, side), generator)
+        with torch.inference_mode():
+            result = pipe(PROMPT, image=image, strength=strength, num_inference_steps=steps,
+                          generator=generator, output_type="np")
+        latencies.append(time.perf_counter() - start)
+        images.append(result.images[0])
+    return latencies, images
+
+
+def sweep_engine(model_dir, upload, strengths, steps, side, cache_size):
+    from engine.core import GenerationRequest
+    from engine.diffusers_backend import DiffusersBackend
+
+    backend = DiffusersBackend(model_id=model_dir, device="cpu", latent_cache_size=cache_size)
+    backend.generate_sync(GenerationRequest(prompt=PROMPT, steps=1, width=64, height=64, seed=0))  # load
+    latencies, images = [], []
+    for strength in strengths:
+        req = GenerationRequest(prompt=PROMPT, steps=steps, width=side, height=side, seed=0, mode="img2img",
+                                denoising_strength=strength, init_image=upload)
+        start = time.perf_counter()
+        result = backend.generate_sync(req)
+        latencies.append(time.perf_counter() - start)
+        images.append(base64.b64decode(result.images[0]))
+    asyncio.run(backend.close())
+    return latencies, images
+
+
+def summary(uncached, cached, same):
+    return {
+        "uncached_mean_s": round(statistics.mean(uncached), 3),
+        "cached_mean_s": round(statistics.mean(cached), 3),
+        # The first cached request still encodes; the rest of the sweep reuses it
+        "cached_followups_mean_s": round(statistics.mean(cached[1:]), 3),
+        "saved_per_followup_s": round(statistics.mean(uncached[1:]) - statistics.mean(cached[1:]), 3),
+        "identical_images": same,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--strengths", default="0.3,0.45,0.6,0.75,0.9")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--side", type=int, default=512)
+    parser.add_argument("--model", default=None, help="pipeline directory or Hub id")
+    args = parser.parse_args()
+    strengths = [float(s) for s in args.strengths.split(",")]
+    model_dir = args.model or build(full_vae=True)
+    upload = photo(args.side)
+
+    pipe = StableDiffusionImg2ImgPipeline.from_pretrained(model_dir, safety_checker=None)
+    pipe.set_progress_bar_config(disable=True)
+    sweep_space(pipe, upload, [0.75], 4, 64)  # warm-up
+    uncached, plain = sweep_space(pipe, upload, strengths, args.steps, args.side)
+    cached, reused = sweep_space(pipe, upload, strengths, args.steps, args.side, InitLatentCache())
+    results = {"strengths": strengths,
+               "space": summary(uncached, cached, all(np.array_equal(a, b) for a, b in zip(plain, reused)))}
+    del pipe
+
+    uncached, plain = sweep_engine(model_dir, upload, strengths, args.steps, args.side, 0)
+    cached, reused = sweep_engine(model_dir, upload, strengths, args.steps, args.side, 16)
+    results["engine"] = summary(uncached, cached, plain == reused)
+    print(json.dumps(results, indent=2))
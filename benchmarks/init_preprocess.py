@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark: img2img init-image preprocessing, forced 512x512 vs huggingface-space/preprocess.py
+Run: python benchmarks/init_preprocess.py [--max-width 512] [--max-height 512] [--steps 10] [--no-generate]
+
+For uploads of a few typical shapes (a small PNG, a 1024px JPEG, 12 MP
+phone photos in landscape and portrait), times decoding + resizing the old
+way (full decode, resize to 512x512) and the new way (draft decode,
+reduce, aspect-preserving size inside the max width x height box), then the img2img
+generation each output size costs on the tiny local pipeline
+(benchmarks/tiny_model.py).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "huggingface-space"))
+sys.path.insert(0, HERE)
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageOps  # noqa: E402
+
+from preprocess import init_size, load_init_image  # noqa: E402
+
+UPLOADS = [("small.png", (320, 240)), ("medium.jpg", (1024, 768)),
+           ("phone.jpg", (4032, 3024)), ("phone_portrait.jpg", (3024, 4032))]
+
+
+def make_upload(path, size):
+    """A smooth synthetic photo, so JPEG sizes are realistic"""
+    width, height = size
+    x, y = np.linspace(0, 1, width), np.linspace(0, 1, height)
+    pixels = np.stack([np.outer(y, x), np.outer(y[::-1], x), np.outer(y, x[::-1])], axis=-1)
+    Image.fromarray((pixels * 255).astype("uint8")).save(path, quality=90)
+
+
+def old_preprocess(path):
+    # What the Space did: Gradio decoded the whole upload, then a forced resize
+    image = ImageOps.exif_transpose(Image.open(path)).convert("RGB")
+    return image.resize((512, 512))
+
+
+def best_time(fn, runs=5):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-width", type=int, default=512)
+    parser.add_argument("--max-height", type=int, default=512)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--no-generate", action="store_true", help="only time preprocessing")
+    args = parser.parse_args()
+
+    pipe = None
+    if not args.no_generate:
+        import torch
+        from diffusers import StableDiffusionImg2ImgPipeline
+        from tiny_model import build
+
+        pipe = StableDiffusionImg2ImgPipeline.from_pretrained(build(), safety_checker=None)
+        pipe.set_progress_bar_config(disable=True)
+
+    def generate(image):
+        start = time.perf_counter()
+        with torch.inference_mode():
+            pipe("a watercolor painting", image=image, strength=0.75, num_inference_steps=args.steps,
+                 generator=torch.Generator("cpu").manual_seed(0))
+        return round(time.perf_counter() - start, 3)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, size in UPLOADS:
+            path = os.path.join(tmp, name)
+            make_upload(path, size)
+            old_s, old_image = best_time(lambda: old_preprocess(path))
+            new_s, new_image = best_time(lambda: load_init_image(path, init_size(path, args.max_width, args.max_height)))
+            row = {
+                "upload": f"{name} {size[0]}x{size[1]}",
+                "old_size": "x".join(map(str, old_image.size)),
+                "new_size": "x".join(map(str, new_image.size)),
+                "old_preprocess_ms": round(old_s * 1000, 1),
+                "new_preprocess_ms": round(new_s * 1000, 1),
+            }
+            if pipe is not None:
+                row["old_generate_s"] = generate(old_image)
+                row["new_generate_s"] = generate(new_image)
+            results.append(row)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Benchmark: api.py proxying to a WebUI process vs the in-process diffusers backend
+Run: python benchmarks/inprocess_backend.py [--requests 8] [--steps 10] [--side 256]
+
+Both modes run the same tiny local pipeline (benchmarks/tiny_model.py) on
+the CPU. In proxy mode a minimal WebUI stand-in serves /sdapi/v1/txt2img
+from its own process and api.py relays to it (ENGINE_BACKEND=webui); in
+in-process mode api.py runs the pipeline itself (ENGINE_BACKEND=diffusers).
+Prints end-to-end /generate latency and the resident/peak memory of every
+process involved as JSON.
+"""
+import argparse
+import base64
+import http.server
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "AI-Image-Web")
+
+
+class WebUIHandler(http.server.BaseHTTPRequestHandler):
+    """Just enough of the WebUI API: txt2img on a diffusers pipeline"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    pipe = None
+
+    def do_GET(self):
+        self.reply({"ok": True})
+
+    def do_POST(self):
+        import torch
+
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        seed = payload.get("seed", -1)
+        generator = torch.Generator("cpu").manual_seed(seed if seed != -1 else 0)
+        with torch.inference_mode():
+            result = self.pipe(payload["prompt"], negative_prompt=payload.get("negative_prompt") or None,
+                               num_inference_steps=payload["steps"], guidance_scale=payload["cfg_scale"],
+                               width=payload["width"], height=payload["height"], generator=generator)
+        images = []
+        for image in result.images:
+            buf = io.BytesIO()
+            image.save(buf, format="PNG")
+            images.append(base64.b64encode(buf.getvalue()).decode("ascii"))
+        self.reply({"images": images, "info": json.dumps({"seed": seed})})
+
+    def reply(self, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_webui(port, model_dir):
+    from diffusers import StableDiffusionPipeline
+
+    WebUIHandler.pipe = StableDiffusionPipeline.from_pretrained(model_dir, safety_checker=None)
+    WebUIHandler.pipe.set_progress_bar_config(disable=True)
+    http.server.HTTPServer(("127.0.0.1", port), WebUIHandler).serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, proc, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with {proc.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start")
+
+
+def memory(pid):
+    """Resident and peak resident set size of a process in MiB"""
+    stats = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                stats[key] = int(value.split()[0]) / 1024
+    return {"rss_mib": round(stats["VmRSS"], 1), "peak_mib": round(stats["VmHWM"], 1)}
+
+
+def bench(mode, args, model_dir, workdir):
+    env = {
+        **os.environ,
+        "PYTHONPATH": APP_DIR,
+        "RATE_LIMIT_BURST": "1e9",
+        "RATE_LIMIT_PER_MINUTE": "1e9",
+        "GPU_QUOTA_BURST": "1e12",
+        "GPU_QUOTA_PER_HOUR": "1e12",
+    }
+    procs = {}
+    try:
+        if mode == "proxy":
+            webui_port = free_port()
+            procs["webui"] = subprocess.Popen([sys.executable, __file__, "--serve-webui", str(webui_port),
+                                               "--model", model_dir], env=env, stderr=subprocess.DEVNULL)
+            wait_for(f"http://127.0.0.1:{webui_port}/", procs["webui"])
+            env.update(ENGINE_BACKEND="webui", STABLE_URL=f"http://127.0.0.1:{webui_port}")
+        else:
+            env.update(ENGINE_BACKEND="diffusers", DIFFUSERS_MODEL=model_dir, DIFFUSERS_DEVICE="cpu")
+
+        port = free_port()
+        procs["api"] = subprocess.Popen([sys.executable, "-m", "uvicorn", "api:app", "--port", str(port),
+                                         "--log-level", "warning"], cwd=workdir, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wait_for(f"http://127.0.0.1:{port}/", procs["api"])
+
+        form = {"prompt": "a lighthouse at dusk", "steps": args.steps, "width": args.side,
+                "height": args.side, "seed": 1}
+        session = requests.Session()
+        session.post(f"http://127.0.0.1:{port}/generate", data=form, timeout=300).raise_for_status()  # warm-up
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            res = session.post(f"http://127.0.0.1:{port}/generate", data=form, timeout=300)
+            latencies.append(time.perf_counter() - start)
+            res.raise_for_status()
+
+        mem = {name: memory(proc.pid) for name, proc in procs.items()}
+        return {
+            "mode": mode,
+            "requests": args.requests,
+            "mean_s": round(statistics.mean(latencies), 3),
+            "min_s": round(min(latencies), 3),
+            "max_s": round(max(latencies), 3),
+            "memory": mem,
+            "total_rss_mib": round(sum(m["rss_mib"] for m in mem.values()), 1),
+            "total_peak_mib": round(sum(m["peak_mib"] for m in mem.values()), 1),
+        }
+    finally:
+        for proc in procs.values():
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--side", type=int, default=256, help="image width and height")
+    parser.add_argument("--model", default=None, help="pipeline directory (default: build the tiny model)")
+    parser.add_argument("--serve-webui", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_webui:
+        serve_webui(args.serve_webui, args.model)
+        sys.exit(0)
+
+    sys.path.insert(0, HERE)
+    from tiny_model import build
+
+    model_dir = args.model or build()
+    with tempfile.TemporaryDirectory() as workdir:  # api.py writes output/ here
+        results = [bench(mode, args, model_dir, workdir) for mode in ("proxy", "in-process")]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cost of the /metrics instrumentation on api.py's hot path
+Run: python benchmarks/metrics_overhead.py [--batches 40] [--batch-size 50] [--image-side 64]
+
+api.py (uvicorn, in this process) proxies /generate to the stub WebUI from
+flask_concurrency.py with no delay and small images, so our own per-request
+work is as large a share as it gets. Metrics are switched on and off
+between interleaved batches inside the one server process; comparing
+separate processes instead drowns the difference in process-to-process
+variance. Also times the exact metric updates one /generate does
+(middleware + 7 stage timers) against the mean latency.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "AI-Image-Web")
+sys.path.insert(0, HERE)
+sys.path.insert(0, APP_DIR)
+
+from flask_concurrency import StubWebUI, free_port, percentile  # noqa: E402
+
+
+def run(port, count):
+    session = requests.Session()
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        session.post(f"http://127.0.0.1:{port}/generate", data={"prompt": "benchmark"}).raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def instrumentation_us(metrics):
+    """The metric updates of one proxied /generate, timed in isolation"""
+    stages = ("upload_read", "admit", "backend", "webui_request", "response_decode", "base64_decode", "file_write")
+
+    def one_request():
+        in_flight = metrics.HTTP_IN_FLIGHT.labels("/generate")
+        in_flight.inc()
+        start = time.perf_counter()
+        for stage in stages:
+            with metrics.GENERATE_STAGE_SECONDS.time(stage):
+                pass
+        metrics.HTTP_SECONDS.labels("/generate").observe(time.perf_counter() - start)
+        metrics.HTTP_REQUESTS.labels("/generate", "200").inc()
+        in_flight.dec()
+
+    return min(timeit.repeat(one_request, number=20000, repeat=3)) / 20000 * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batches", type=int, default=40, help="per mode, interleaved")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--image-side", type=int, default=64)
+    args = parser.parse_args()
+
+    stub = StubWebUI(0, args.image_side)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    os.environ["STABLE_URL"] = f"http://127.0.0.1:{stub.server_address[1]}"
+    # One client; keep the per-user quota out of the measurement
+    os.environ.update(RATE_LIMIT_BURST="1e9", RATE_LIMIT_PER_MINUTE="1e9",
+                      GPU_QUOTA_BURST="1e12", GPU_QUOTA_PER_HOUR="1e12")
+
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)  # api.py writes output/ here
+    import uvicorn
+
+    import api
+    import metrics
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    run(port, 100)  # warm-up
+
+    latencies = {True: [], False: []}
+    for i in range(args.batches * 2):
+        metrics.METRICS_ENABLED = i % 2 == 0
+        latencies[metrics.METRICS_ENABLED].extend(run(port, args.batch_size))
+    metrics.METRICS_ENABLED = True
+    server.should_exit = True
+    stub.shutdown()
+
+    per_request_us = instrumentation_us(metrics)
+    off, on = statistics.mean(latencies[False]), statistics.mean(latencies[True])
+    print(json.dumps({
+        "requests_per_mode": len(latencies[True]),
+        "metrics_off_mean_ms": round(off * 1000, 3),
+        "metrics_on_mean_ms": round(on * 1000, 3),
+        "metrics_off_p50_ms": round(percentile(latencies[False], 50) * 1000, 3),
+        "metrics_on_p50_ms": round(percentile(latencies[True], 50) * 1000, 3),
+        "end_to_end_difference_pct": round((on - off) / off * 100, 2),
+        "instrumentation_us_per_request": round(per_request_us, 2),
+        "instrumentation_pct_of_request": round(per_request_us / (off * 1e6) * 100, 3),
+    }, indent=2))
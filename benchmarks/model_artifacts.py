@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark: BLIP load time and memory with from_pretrained vs model artifacts
+Run: python benchmarks/model_artifacts.py [--max-workers 3] [--rounds 3] [--full-vision] [--full-text-decoder]
+
+Starts 1..--max-workers worker processes at once, as a server with several
+workers does, each loading the tiny BLIP model (benchmarks/tiny_blip.py)
+through engine.captioning and captioning one image, which touches every
+weight. Loads either with from_pretrained (MODEL_ARTIFACTS=false) or from
+an artifact cache that was converted once beforehand (convert_s). Prints,
+per mode and worker count, the mean load time per worker, and the total
+resident (rss) and proportional (pss: shared pages split between the
+processes mapping them) memory of all workers while they run, as JSON.
+Rounds are interleaved between the modes; memory is the last round's.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "AI-Image-Web")
+sys.path.insert(0, HERE)
+
+MODES = ("from_pretrained", "artifacts")
+
+
+def worker():
+    """Load BLIP, caption once, report, then stay alive until stdin closes"""
+    import io
+
+    from PIL import Image
+    from transformers import BlipForConditionalGeneration, BlipProcessor  # noqa: F401 (import time isn't load time)
+
+    from engine import artifacts, captioning  # noqa: F401
+    from engine.core import DecodingOptions
+
+    start = time.perf_counter()
+    captioning.load_blip_model()
+    load = time.perf_counter() - start
+    buf = io.BytesIO()
+    Image.new("RGB", (384, 384), (90, 140, 200)).save(buf, format="PNG")
+    start = time.perf_counter()
+    captioning.caption_image(buf.getvalue(), decoding=DecodingOptions(20))
+    print(json.dumps({"load_s": load, "caption_s": time.perf_counter() - start}), flush=True)
+    sys.stdin.read()
+
+
+def smaps(pid):
+    """Rss and Pss of a process in MiB"""
+    stats = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                stats[key] = int(value.split()[0]) / 1024
+    return stats
+
+
+def start_workers(mode, count, model_dir, cache_dir):
+    env = {**os.environ, "PYTHONPATH": APP_DIR, "BLIP_MODEL": model_dir, "MODEL_CACHE_DIR": cache_dir,
+           "MODEL_ARTIFACTS": "true" if mode == "artifacts" else "false", "CUDA_VISIBLE_DEVICES": ""}
+    procs = [subprocess.Popen([sys.executable, __file__, "--worker"], env=env, stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+             for _ in range(count)]
+    reports = []
+    for proc in procs:
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError(f"worker {proc.pid} exited with {proc.wait()}")
+        reports.append(json.loads(line))
+    return procs, reports
+
+
+def stop_workers(procs):
+    for proc in procs:
+        proc.stdin.close()
+    for proc in procs:
+        proc.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-workers", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=3, help="per mode and worker count, interleaved")
+    parser.add_argument("--full-vision", action="store_true", help="BLIP-large-sized image encoder")
+    parser.add_argument("--full-text-decoder", action="store_true", help="BLIP-large-sized text decoder")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker()
+        sys.exit()
+
+    from tiny_blip import build
+
+    model_dir = build(full_vision=args.full_vision, full_text_decoder=args.full_text_decoder)
+    cache_dir = tempfile.mkdtemp(prefix="model-artifacts-")
+    start = time.perf_counter()
+    stop_workers(start_workers("artifacts", 1, model_dir, cache_dir)[0])
+    convert = time.perf_counter() - start
+
+    results = []
+    for count in range(1, args.max_workers + 1):
+        loads = {mode: [] for mode in MODES}
+        captions = {mode: [] for mode in MODES}
+        memory = {}
+        for _ in range(args.rounds):
+            for mode in MODES:
+                procs, reports = start_workers(mode, count, model_dir, cache_dir)
+                try:
+                    memory[mode] = [smaps(proc.pid) for proc in procs]
+                finally:
+                    stop_workers(procs)
+                loads[mode].extend(r["load_s"] for r in reports)
+                captions[mode].extend(r["caption_s"] for r in reports)
+        for mode in MODES:
+            results.append({
+                "mode": mode,
+                "workers": count,
+                "load_s": round(statistics.mean(loads[mode]), 3),
+                "first_caption_s": round(statistics.mean(captions[mode]), 3),
+                "total_rss_mib": round(sum(m["Rss"] for m in memory[mode]), 1),
+                "total_pss_mib": round(sum(m["Pss"] for m in memory[mode]), 1),
+            })
+    shutil.rmtree(cache_dir)
+
+    weights = sum(os.path.getsize(os.path.join(model_dir, name)) for name in os.listdir(model_dir)
+                  if name.endswith(".safetensors"))
+    print(json.dumps({"model": model_dir, "weights_mib": round(weights / 2 ** 20, 1),
+                      "convert_s": round(convert, 3), "results": results}, indent=2))
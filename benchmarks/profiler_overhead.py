@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cost of slow-request capture and of a running profile (AI-Image-Web/profiler.py)
+Run: python benchmarks/profiler_overhead.py [--batches 40] [--batch-size 50] [--image-side 64]
+
+api.py (uvicorn, in this process) proxies /generate to the stub WebUI from
+flask_concurrency.py with no delay, for interleaved batches in three modes:
+capture off (SLOW_REQUEST_SECONDS=0), capture on (the default; no request
+is slow enough to be snapshotted) and capture on while a 100 Hz profile
+runs, as during a call to /admin/profile. Also times, in isolation, one
+request's tracking and one profiler sample / watchdog snapshot of this
+process's threads (while the server ran, "threads" of them).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "AI-Image-Web")
+sys.path.insert(0, HERE)
+sys.path.insert(0, APP_DIR)
+
+from flask_concurrency import StubWebUI, free_port, percentile  # noqa: E402
+from tracing_overhead import run  # noqa: E402
+
+MODES = ("off", "capture", "profiling")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batches", type=int, default=40, help="per mode, interleaved")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--image-side", type=int, default=64)
+    args = parser.parse_args()
+
+    stub = StubWebUI(0, args.image_side)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    os.environ.update(
+        STABLE_URL=f"http://127.0.0.1:{stub.server_address[1]}",
+        # One client; keep the per-user quota out of the measurement
+        RATE_LIMIT_BURST="1e9", RATE_LIMIT_PER_MINUTE="1e9", GPU_QUOTA_BURST="1e12", GPU_QUOTA_PER_HOUR="1e12",
+    )
+    os.chdir(tempfile.mkdtemp())  # api.py writes output/ here
+    import uvicorn
+
+    import api
+    import profiler
+
+    threshold = profiler.SLOW_REQUEST_SECONDS
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    run(port, 100)  # warm-up
+
+    latencies = {mode: [] for mode in MODES}
+    samples = 0
+    for i in range(args.batches * len(MODES)):
+        mode = MODES[i % len(MODES)]
+        profiler.SLOW_REQUEST_SECONDS = 0 if mode == "off" else threshold
+        sampler = profiler.start_profile() if mode == "profiling" else None
+        latencies[mode].extend(run(port, args.batch_size))
+        if sampler is not None:
+            profiler.stop_profile(sampler)
+            samples += sampler.samples
+    threads = threading.active_count()
+    server.should_exit = True
+    stub.shutdown()
+
+    def track_us():
+        def one_request():
+            profiler.end_request(profiler.begin_request("POST", "/generate"), 200)
+        return min(timeit.repeat(one_request, number=5000, repeat=3)) / 5000 * 1e6
+
+    def sample_us():
+        sampler = profiler.Sampler()
+        return min(timeit.repeat(sampler.sample, number=500, repeat=3)) / 500 * 1e6
+
+    means = {mode: statistics.mean(values) for mode, values in latencies.items()}
+    print(json.dumps({
+        "requests_per_mode": len(latencies["off"]),
+        "profile_samples": samples,
+        "threads": threads,
+        **{f"{mode}_mean_ms": round(means[mode] * 1000, 3) for mode in MODES},
+        **{f"{mode}_p50_ms": round(percentile(latencies[mode], 50) * 1000, 3) for mode in MODES},
+        "capture_difference_pct": round((means["capture"] - means["off"]) / means["off"] * 100, 2),
+        "profiling_difference_pct": round((means["profiling"] - means["off"]) / means["off"] * 100, 2),
+        "tracking_us_per_request": round(track_us(), 2),
+        "sample_us": round(sample_us(), 2),
+        "snapshot_us": round(min(timeit.repeat(profiler.thread_stacks, number=200, repeat=3)) / 200 * 1e6, 2),
+    }, indent=2))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark: seconds per image for every sampler in huggingface-space/schedulers.py
+Run: python benchmarks/sampler_speed.py [--steps 25] [--images 3] [--side 256] [--model DIR]
+
+Runs the pipeline at --steps with each sampler, then the fast preset at its
+own step count, swapping schedulers on one loaded pipeline the way app.py
+does. Uses the tiny local model (benchmarks/tiny_model.py) unless --model is
+given; with it only the timings mean anything, not the images.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "huggingface-space"))
+sys.path.insert(0, HERE)
+
+import torch  # noqa: E402
+from diffusers import StableDiffusionPipeline  # noqa: E402
+
+from schedulers import available_samplers, configure, prepare  # noqa: E402
+from tiny_model import build  # noqa: E402
+
+
+def seconds_per_image(pipe, steps, guidance_scale, images, side):
+    timings = []
+    for i in range(images + 1):
+        start = time.perf_counter()
+        with torch.inference_mode():
+            pipe("a lighthouse at dusk", negative_prompt="blurry, bad quality", num_inference_steps=steps,
+                 guidance_scale=guidance_scale, width=side, height=side,
+                 generator=torch.Generator("cpu").manual_seed(i))
+        timings.append(time.perf_counter() - start)
+    return min(timings[1:])  # the first run of each sampler is warm-up
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--steps", type=int, default=25)
+    parser.add_argument("--images", type=int, default=3, help="timed images per sampler")
+    parser.add_argument("--side", type=int, default=256)
+    parser.add_argument("--cfg", type=float, default=7.5)
+    parser.add_argument("--model", default=None, help="pipeline directory or Hub id (default: the tiny model)")
+    args = parser.parse_args()
+
+    pipe = StableDiffusionPipeline.from_pretrained(args.model or build(), safety_checker=None)
+    pipe.set_progress_bar_config(disable=True)
+    prepare(pipe)
+
+    results = []
+    for sampler in available_samplers(pipe):
+        steps, cfg = configure(pipe, sampler, args.steps, args.cfg)
+        results.append({"sampler": sampler, "steps": steps,
+                        "s_per_image": round(seconds_per_image(pipe, steps, cfg, args.images, args.side), 3)})
+    steps, cfg = configure(pipe, None, args.steps, args.cfg, fast=True)
+    fast = {"sampler": f"fast ({pipe.scheduler.__class__.__name__})", "steps": steps,
+            "s_per_image": round(seconds_per_image(pipe, steps, cfg, args.images, args.side), 3)}
+    results.append(fast)
+    baseline = next(r for r in results if r["sampler"] == "DPM++ 2M Karras")
+    fast["speedup_vs_dpmpp_2m_karras"] = round(baseline["s_per_image"] / fast["s_per_image"], 2)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark: serve.py production mode vs the old SimpleHTTPRequestHandler
+Run: python benchmarks/static_server.py [--clients 32] [--requests 2000]
+
+Fetches the frontend pages and assets from both servers with concurrent
+clients (optionally with one stalled client holding a connection open)
+and prints throughput, latency percentiles and bytes on the wire as JSON.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AI-Image-Web"))
+
+import serve
+
+# Keep per-request access logs out of the report
+serve.StaticHandler.log_message = lambda self, *args: None
+
+STALL_TIMEOUT = 10
+
+PATHS = [
+    "/index.html", "/index-styles.css", "/config.js", "/control.js",
+    "/img2img.html", "/img2img-styles.css",
+    "/img2text.html", "/img2text-styles.css", "/img2text.js",
+    "/login.html", "/auth-styles.css", "/auth.js",
+]
+
+
+def start_server(simple):
+    httpd = serve.make_server(0, simple=simple, host="127.0.0.1")
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, httpd.server_address[1]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_client(port, count, offset, revalidate):
+    latencies, wire_bytes = [], 0
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    etags = {}
+    for i in range(count):
+        path = PATHS[(offset + i) % len(PATHS)]
+        headers = {"Accept-Encoding": "gzip, br"}
+        if revalidate and path in etags:
+            headers["If-None-Match"] = etags[path]
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError):
+            # The simple server closes every connection; reconnect
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        if response.getheader("Connection", "").lower() == "close" or response.version == 10:
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        latencies.append(time.perf_counter() - start)
+        wire_bytes += len(body)
+        if response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+    conn.close()
+    return latencies, wire_bytes
+
+
+def bench(simple, clients, requests, revalidate, stall):
+    httpd, port = start_server(simple)
+    stalled = None
+    if stall:
+        # A slow client that sends half a request line and then waits
+        stalled = socket.create_connection(("127.0.0.1", port))
+        stalled.sendall(b"GET /index.html HT")
+        time.sleep(0.1)
+
+    per_client = max(1, requests // clients)
+    pool = ThreadPoolExecutor(clients)
+    start = time.perf_counter()
+    futures = [pool.submit(run_client, port, per_client, i, revalidate) for i in range(clients)]
+    try:
+        results = [f.result(timeout=STALL_TIMEOUT if stall else 120) for f in futures]
+    except Exception:
+        results = None
+    elapsed = time.perf_counter() - start
+
+    if stalled is not None:
+        # Releasing the stalled connection lets a blocked server drain the rest
+        stalled.close()
+    pool.shutdown(wait=True)
+    httpd.shutdown()
+    httpd.server_close()
+
+    if results is None:
+        return {"blocked": True, "error": f"clients still waiting after {STALL_TIMEOUT}s"}
+    latencies = [l for r in results for l in r[0]]
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "body_bytes": sum(r[1] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    report = {}
+    for name, simple in (("simple", True), ("production", False)):
+        report[name] = {
+            "cold": bench(simple, args.clients, args.requests, revalidate=False, stall=False),
+            "revalidate": bench(simple, args.clients, args.requests, revalidate=True, stall=False),
+            "stalled_client": bench(simple, args.clients, min(args.requests, 200), revalidate=False, stall=True),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: load scenarios against the whole service, as JSON to compare between commits
+Run: python benchmarks/suite.py [--scenarios auth,mixed] [--clients 8] [--duration 20] [--out results.json]
+     python benchmarks/suite.py --compare base.json new.json [--threshold 10]
+
+Each scenario starts one API app in a subprocess with a fresh working
+directory and SQLite database, and with the per-user quota lifted. Its
+WebUI or Replicate is fakes.py in a process of its own (--latency,
+--image-side). --clients closed-loop clients then send a seeded, weighted
+mix of requests for --warmup + --duration seconds. Captioning runs the tiny
+BLIP from tiny_blip.py and the in-process backend the tiny pipeline from
+tiny_model.py, so nothing is downloaded and no GPU is needed. Scenarios
+whose dependencies are missing are reported as skipped.
+
+Each scenario reports requests, errors, RPS, p50/p95/p99 latency and the
+peak RSS of all the server's processes (Linux), overall and per operation,
+plus the server's startup time (until it first answers). The import-*
+scenarios audit cold start instead: `python -X importtime -c "import app"`
+--import-runs times for each entry point, reporting the median import and
+process wall times and the heaviest packages it pulls in.
+Results are tagged with the commit they ran on. --compare prints every
+change between two result files, and exits 1 if RPS, a latency percentile
+or peak RSS got worse by more than --threshold percent.
+"""
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "AI-Image-Web")
+SPACE_DIR = os.path.join(HERE, "..", "huggingface-space")
+sys.path.insert(0, HERE)
+
+from flask_concurrency import free_port, percentile  # noqa: E402
+
+PASSWORD = "benchmark-password"
+PROMPTS = ["a lighthouse at dusk", "a watercolor fox in the snow", "portrait of an astronaut, studio lighting",
+           "a busy market street in the rain", "isometric city block, night"]
+AUTH_MIX = {"verify": 60, "my_images": 20, "login": 20}
+MIXED = {"verify": 40, "login": 10, "my_images": 10, "txt2img": 25, "img2img": 5, "caption": 10}
+
+# app: the ASGI/WSGI app to serve; fake: fakes.py server it talks to; env: extra server environment;
+# needs: modules it can't run without; import: entry module to time the import of instead (from path)
+SCENARIOS = {
+    "import-api": {"import": "api"},
+    "import-api_cloud": {"import": "api_cloud"},
+    "import-api_flask": {"import": "api_flask", "needs": ["flask", "flask_cors"]},
+    "import-auth_api": {"import": "auth_api"},
+    "import-space": {"import": "app", "path": SPACE_DIR, "needs": ["gradio", "diffusers"]},
+    "auth": {"app": "api:app", "mix": AUTH_MIX},
+    "generate-webui": {"app": "api:app", "fake": "webui", "mix": {"txt2img": 90, "img2img": 10}},
+    "generate-replicate": {"app": "api_cloud:app", "fake": "replicate", "mix": {"txt2img": 80, "caption": 20}},
+    "caption": {"app": "api:app", "blip": True, "mix": {"caption": 100}, "needs": ["transformers"]},
+    "mixed": {"app": "api:app", "fake": "webui", "blip": True, "mix": MIXED, "needs": ["transformers"]},
+    "mixed-flask": {"app": "api_flask:app", "server": "gunicorn", "fake": "webui", "blip": True, "mix": MIXED,
+                    "env": {"PRELOAD_BLIP": "true"}, "needs": ["transformers", "gunicorn"]},
+    "generate-inprocess": {"app": "api:app", "diffusers": True, "mix": {"txt2img": 100},
+                           "needs": ["diffusers", "transformers"]},
+}
+
+
+# -------------------------------------------------
+# Operations (each returns whether the request succeeded)
+# -------------------------------------------------
+
+def upload_jpeg(side):
+    """A smooth synthetic photo, so JPEG sizes are realistic"""
+    image = Image.radial_gradient("L").resize((side, side * 3 // 4)).convert("RGB")
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+class Client:
+    def __init__(self, base_url, index, args, upload):
+        self.base_url = base_url
+        self.args = args
+        self.upload = upload
+        self.session = requests.Session()
+        self.random = random.Random(args.seed * 1000 + index)
+        self.username = f"bench{index}"
+        self.headers = {}
+
+    def register(self):
+        self.session.post(f"{self.base_url}/register", data={
+            "username": self.username, "email": f"{self.username}@example.com", "password": PASSWORD,
+        }, timeout=30)
+        self.login()
+
+    def ok(self, res) -> bool:
+        return res.status_code == 200
+
+    def login(self):
+        res = self.session.post(f"{self.base_url}/login", data={"username": self.username, "password": PASSWORD},
+                                timeout=30)
+        if res.ok:
+            self.headers = {"Authorization": f"Bearer {res.json()['user']['session_token']}"}
+        return self.ok(res)
+
+    def verify(self):
+        return self.ok(self.session.get(f"{self.base_url}/verify", headers=self.headers, timeout=30))
+
+    def my_images(self):
+        return self.ok(self.session.get(f"{self.base_url}/my-images", headers=self.headers, timeout=30))
+
+    def generate(self, **extra):
+        form = {"prompt": self.random.choice(PROMPTS), "steps": self.args.steps, "width": self.args.side,
+                "height": self.args.side, "seed": self.random.randrange(2 ** 31), **extra.pop("form", {})}
+        res = self.session.post(f"{self.base_url}/generate", data=form, headers=self.headers, timeout=300, **extra)
+        return self.ok(res) and "error" not in res.json()
+
+    def txt2img(self):
+        return self.generate()
+
+    def img2img(self):
+        return self.generate(form={"mode": "img2img", "denoising_strength": 0.6},
+                             files={"init_image": ("init.jpg", self.upload, "image/jpeg")})
+
+    def caption(self):
+        res = self.session.post(f"{self.base_url}/image-to-text", headers=self.headers, timeout=300,
+                                data={"question": "Describe this image in detail.", "max_length": 20},
+                                files={"image": ("photo.jpg", self.upload, "image/jpeg")})
+        return self.ok(res)
+
+    def run(self, mix, measure_from, stop_at, records):
+        ops, weights = zip(*mix.items())
+        while True:
+            op = self.random.choices(ops, weights)[0]
+            start = time.perf_counter()
+            if start >= stop_at:
+                return
+            try:
+                ok = getattr(self, op)()
+            except (requests.RequestException, ValueError):
+                ok = False
+            end = time.perf_counter()
+            if start >= measure_from:
+                records.append((op, end - start, ok, end))
+
+
+# -------------------------------------------------
+# Processes
+# -------------------------------------------------
+
+def wait_for(url, proc, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with {proc.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.02)
+    raise RuntimeError(f"{url} did not start")
+
+
+def start_fake(kind, args):
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, "fakes.py"), kind, "--latency", str(args.latency),
+                             "--image-side", str(args.image_side), "--seed", str(args.seed)],
+                            stdout=subprocess.PIPE, text=True)
+    return proc, proc.stdout.readline().strip()
+
+
+def process_tree(pid):
+    """pid and all its descendants"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, todo = [], [pid]
+    while todo:
+        tree.append(todo.pop())
+        todo.extend(children.get(tree[-1], []))
+    return tree
+
+
+def peak_rss_mib(pid):
+    """Sum of peak resident set sizes (VmHWM) over a process tree"""
+    total = 0
+    for member in process_tree(pid):
+        try:
+            with open(f"/proc/{member}/status") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        except (OSError, StopIteration):
+            pass
+    return round(total / 1024, 1)
+
+
+def server_command(scenario, port, args):
+    if scenario.get("server") == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "-c", os.path.join(APP_DIR, "gunicorn.conf.py"),
+                "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers),
+                "--access-logfile", "/dev/null", scenario["app"]]
+    return [sys.executable, "-m", "uvicorn", scenario["app"], "--port", str(port), "--log-level", "warning"]
+
+
+# -------------------------------------------------
+# Scenarios
+# -------------------------------------------------
+
+def summarize(records, elapsed):
+    latencies = [r[1] for r in records]
+    return {
+        "requests": len(records),
+        "errors": sum(1 for r in records if not r[2]),
+        "rps": round(len(records) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def prime(clients, mix, workers):
+    """
+    Every operation from all clients at once, a few rounds, so lazily loaded
+    models (BLIP, pipelines) are loaded in every worker process before timing
+    """
+    for op in mix:
+        for _ in range(2 * workers):
+            threads = [threading.Thread(target=getattr(client, op)) for client in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+
+def parse_importtime(stderr):
+    """(module, self us, cumulative us) of every import python -X importtime reported"""
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "self [us]" not in line:
+            self_us, cumulative, name = line[len("import time:"):].split("|")
+            rows.append((name.strip(), int(self_us), int(cumulative)))
+    return rows
+
+
+def run_import(scenario, args):
+    """Cold start of one entry module, each run in a fresh interpreter"""
+    module = scenario["import"]
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {**os.environ, "PYTHONPATH": scenario.get("path", APP_DIR),
+               "DATABASE_PATH": os.path.join(workdir, "users.db")}
+        for _ in range(args.import_runs):
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=workdir,
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            wall = time.perf_counter() - start
+            if proc.returncode != 0:
+                return {"skipped": proc.stderr.strip().splitlines()[-1]}
+            rows = parse_importtime(proc.stderr)
+            total = next(cumulative for name, _, cumulative in reversed(rows) if name == module)
+            runs.append((total, wall, rows))
+    runs.sort(key=lambda run: run[0])
+    total, _, rows = runs[len(runs) // 2]
+    # Heaviest packages it pulls in, by the cumulative time of their first (outermost) import
+    packages = {}
+    for name, _, cumulative in rows:
+        package = name.split(".")[0]
+        if package != module:
+            packages[package] = max(packages.get(package, 0), cumulative)
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:10]
+    return {
+        "module": module,
+        "runs": len(runs),
+        "import_ms": round(total / 1000, 1),
+        "wall_ms": round(statistics.median(run[1] for run in runs) * 1000, 1),
+        "modules_imported": len(rows),
+        "heaviest": {package: round(us / 1000, 1) for package, us in heaviest},
+    }
+
+
+def run_scenario(name, args):
+    scenario = SCENARIOS[name]
+    missing = [module for module in scenario.get("needs", []) if importlib.util.find_spec(module) is None]
+    if missing:
+        return {"skipped": f"not installed: {', '.join(missing)}"}
+    if "import" in scenario:
+        return run_import(scenario, args)
+
+    procs = []
+    with tempfile.TemporaryDirectory() as workdir:  # output/ and users.db
+        env = {
+            **os.environ,
+            "PYTHONPATH": APP_DIR,
+            "DATABASE_PATH": os.path.join(workdir, "users.db"),
+            "RATE_LIMIT_BURST": "1e9",
+            "RATE_LIMIT_PER_MINUTE": "1e9",
+            "GPU_QUOTA_BURST": "1e12",
+            "GPU_QUOTA_PER_HOUR": "1e12",
+            "WEB_CONCURRENCY": str(args.workers),
+            **scenario.get("env", {}),
+        }
+        try:
+            if scenario.get("fake") == "webui":
+                proc, url = start_fake("webui", args)
+                procs.append(proc)
+                env.update(STABLE_URL=url)
+            elif scenario.get("fake") == "replicate":
+                proc, url = start_fake("replicate", args)
+                procs.append(proc)
+                env.update(REPLICATE_API_URL=url, REPLICATE_API_TOKEN="benchmark")
+            if scenario.get("blip"):
+                from tiny_blip import build as build_blip
+
+                env.update(BLIP_MODEL=build_blip())
+            if scenario.get("diffusers"):
+                from tiny_model import build as build_pipeline
+
+                env.update(ENGINE_BACKEND="diffusers", DIFFUSERS_MODEL=build_pipeline(), DIFFUSERS_DEVICE="cpu")
+
+            port = free_port()
+            started = time.perf_counter()
+            server = subprocess.Popen(server_command(scenario, port, args), cwd=workdir, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            procs.append(server)
+            base_url = f"http://127.0.0.1:{port}"
+            wait_for(f"{base_url}/", server)
+            startup = time.perf_counter() - started
+
+            upload = upload_jpeg(args.upload_side)
+            clients = [Client(base_url, i, args, upload) for i in range(args.clients)]
+            for client in clients:
+                client.register()
+            prime(clients, scenario["mix"], args.workers)
+
+            records = []
+            start = time.perf_counter()
+            measure_from, stop_at = start + args.warmup, start + args.warmup + args.duration
+            threads = [threading.Thread(target=c.run, args=(scenario["mix"], measure_from, stop_at, records))
+                       for c in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            peak = peak_rss_mib(server.pid)
+        finally:
+            for proc in reversed(procs):
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    if not records:
+        return {"skipped": "no request finished inside the measured window"}
+    elapsed = max(r[3] for r in records) - measure_from
+    result = {"app": scenario["app"], "server": scenario.get("server", "uvicorn"), **summarize(records, elapsed),
+              "peak_rss_mib": peak, "startup_ms": round(startup * 1000, 1), "ops": {}}
+    for op in scenario["mix"]:
+        op_records = [r for r in records if r[0] == op]
+        if op_records:
+            result["ops"][op] = summarize(op_records, elapsed)
+    return result
+
+
+def git_revision():
+    def git(*cmd):
+        return subprocess.run(["git", *cmd], cwd=HERE, capture_output=True, text=True).stdout.strip()
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+# -------------------------------------------------
+# Comparison
+# -------------------------------------------------
+
+# Metric -> whether a higher value is better
+COMPARED = {"rps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False, "peak_rss_mib": False,
+            "startup_ms": False, "import_ms": False, "wall_ms": False}
+
+
+def compare(base, new, threshold):
+    """Change of every compared number between two result files; returns (report, regressions)"""
+    report, regressions = {}, []
+    for name, before in base["scenarios"].items():
+        after = new["scenarios"].get(name)
+        if after is None or "skipped" in before or "skipped" in after:
+            continue
+        rows = report[name] = {}
+        for key, higher_is_better in COMPARED.items():
+            if not before.get(key) or key not in after:
+                continue
+            change = (after[key] - before[key]) / before[key] * 100
+            rows[key] = {"base": before[key], "new": after[key], "change_pct": round(change, 1)}
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{name}.{key}")
+    return {"base": base["meta"].get("commit"), "new": new["meta"].get("commit"), "threshold_pct": threshold,
+            "scenarios": report, "regressions": regressions}, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--clients", type=int, default=8, help="concurrent closed-loop clients")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds of load first")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake WebUI/Replicate seconds per generation")
+    parser.add_argument("--image-side", type=int, default=512, help="fake output image size in pixels")
+    parser.add_argument("--upload-side", type=int, default=1024, help="img2img/caption upload width in pixels")
+    parser.add_argument("--steps", type=int, default=4, help="steps per generation (in-process backend)")
+    parser.add_argument("--side", type=int, default=128, help="requested image size (in-process backend)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--import-runs", type=int, default=7, help="fresh interpreters per import-* scenario")
+    parser.add_argument("--out", help="also write the results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=10, help="--compare: regression threshold in percent")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            report, regressions = compare(json.load(f), json.load(g), args.threshold)
+        print(json.dumps(report, indent=2))
+        sys.exit(1 if regressions else 0)
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    results = {
+        "meta": {
+            **git_revision(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "threshold")},
+        },
+        "scenarios": {name: run_scenario(name, args) for name in names},
+    }
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request time with and without the prompt-embedding cache
+Run: python benchmarks/text_encoder_cache.py [--prompts 4] [--seeds 4] [--steps 4] [--model DIR]
+
+Replays a workload of --prompts prompts, each with --seeds seeds and one
+shared negative prompt (the common pattern in the Space's traffic), on the
+CPU: once encoding text on every call, once through huggingface-space/
+prompt_cache.py. The default model is the tiny pipeline with an SD 1.5-sized
+CLIP text encoder (benchmarks/tiny_model.py --full-text-encoder), so text
+encoding costs what it does on the real model. Also checks that both runs
+produce identical images.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "huggingface-space"))
+sys.path.insert(0, HERE)
+
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+from diffusers import StableDiffusionPipeline  # noqa: E402
+
+from prompt_cache import PromptEmbeddingCache  # noqa: E402
+from tiny_model import build  # noqa: E402
+
+PROMPTS = ["a lighthouse at dusk", "portrait of an astronaut, oil painting", "a red fox in the snow",
+           "isometric city at night", "bowl of ramen, studio photo", "mountain lake, watercolor"]
+NEGATIVE = "blurry, bad quality, distorted"
+
+
+def run(pipe, workload, steps, side, cache=None):
+    latencies, images = [], []
+    for prompt, seed in workload:
+        generator = torch.Generator("cpu").manual_seed(seed)
+        start = time.perf_counter()
+        if cache is None:
+            text = {"prompt": prompt, "negative_prompt": NEGATIVE}
+        else:
+            text = cache.encode(pipe, prompt, NEGATIVE)
+        with torch.inference_mode():
+            result = pipe(**text, num_inference_steps=steps, width=side, height=side, generator=generator,
+                          output_type="np")
+        latencies.append(time.perf_counter() - start)
+        images.append(result.images[0])
+    return latencies, images
+
+
+def encode_time(pipe, runs=10):
+    start = time.perf_counter()
+    for _ in range(runs):
+        with torch.inference_mode():
+            pipe.encode_prompt(NEGATIVE, pipe.device, 1, False)
+    return (time.perf_counter() - start) / runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=4)
+    parser.add_argument("--seeds", type=int, default=4, help="requests per prompt")
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--side", type=int, default=128)
+    parser.add_argument("--model", default=None, help="pipeline directory or Hub id")
+    args = parser.parse_args()
+
+    pipe = StableDiffusionPipeline.from_pretrained(args.model or build(full_text_encoder=True), safety_checker=None)
+    pipe.set_progress_bar_config(disable=True)
+    workload = [(PROMPTS[i % len(PROMPTS)], seed) for seed in range(args.seeds) for i in range(args.prompts)]
+    run(pipe, workload[:1], args.steps, args.side)  # warm-up
+
+    baseline, baseline_images = run(pipe, workload, args.steps, args.side)
+    cache = PromptEmbeddingCache()
+    cached, cached_images = run(pipe, workload, args.steps, args.side, cache)
+
+    print(json.dumps({
+        "requests": len(workload),
+        "text_encode_ms": round(encode_time(pipe) * 1000, 1),
+        "uncached_mean_s": round(statistics.mean(baseline), 4),
+        "cached_mean_s": round(statistics.mean(cached), 4),
+        "saved_per_request_ms": round((statistics.mean(baseline) - statistics.mean(cached)) * 1000, 1),
+        "identical_images": all(np.array_equal(a, b) for a, b in zip(baseline_images, cached_images)),
+        "cache": cache.stats(),
+    }, indent=2))
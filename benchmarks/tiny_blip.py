@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Build a tiny, randomly initialised BLIP captioning model on disk
+Run: python benchmarks/tiny_blip.py [--out DIR] [--full-vision] [--full-text-decoder]
+
+Stands in for Salesforce/blip-image-captioning-large (point BLIP_MODEL at
+the directory) so captioning benchmarks run offline on a CPU. It loads
+through the same BlipProcessor / BlipForConditionalGeneration classes and
+takes the same code paths: 384px inputs, a ViT image encoder and a BERT
+text decoder with cross-attention. --full-vision makes the image encoder as
+big as BLIP-large's ViT-L/16 (24 layers, 1024 wide) and --full-text-decoder
+the decoder as big as its BERT-base one (12 layers, 768 wide), for
+benchmarks that time those parts.
+Captions it produces are gibberish, though as sensitive to numeric error as
+real ones: only timings, memory and agreement between runs are meaningful.
+Its random weights rarely emit an end token, so every caption runs to its
+token cap and a batch never waits on one long answer, as real captions of
+mixed length make it.
+"""
+import argparse
+import os
+import tempfile
+
+DEFAULT_DIR = os.path.join(tempfile.gettempdir(), "tiny-blip")
+
+WORDS = "a an the of in on with and is photo picture image red blue green dog cat man woman car tree sky house".split()
+
+
+def default_dir(full_vision=False, full_text_decoder=False):
+    return DEFAULT_DIR + ("-vit" if full_vision else "") + ("-bert" if full_text_decoder else "")
+
+
+def write_vocab(path):
+    """A WordPiece vocabulary: BERT's special tokens, BLIP's [DEC], a few words and single letters"""
+    letters = [chr(c) for c in range(ord("a"), ord("z") + 1)]
+    tokens = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "[DEC]"] + WORDS + letters + ["##" + c for c in letters]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(tokens) + "\n")
+    return {token: i for i, token in enumerate(tokens)}
+
+
+def build(out_dir=None, force=False, full_vision=False, full_text_decoder=False):
+    """Create the model and processor under out_dir (once) and return the directory"""
+    out_dir = out_dir or default_dir(full_vision, full_text_decoder)
+    if not force and os.path.exists(os.path.join(out_dir, "config.json")):
+        return out_dir
+
+    import torch
+    from transformers import (BertTokenizerFast, BlipConfig, BlipForConditionalGeneration, BlipImageProcessor,
+                              BlipProcessor)
+
+    torch.manual_seed(0)
+    os.makedirs(out_dir, exist_ok=True)
+    vocab = write_vocab(os.path.join(out_dir, "vocab.txt"))
+
+    vision_width, vision_layers, vision_heads, patch = (1024, 24, 16, 16) if full_vision else (32, 2, 2, 32)
+    text_width, text_layers, text_heads = (768, 12, 12) if full_text_decoder else (32, 2, 2)
+    config = BlipConfig(
+        vision_config={
+            "hidden_size": vision_width, "intermediate_size": vision_width * 4, "num_hidden_layers": vision_layers,
+            "num_attention_heads": vision_heads, "image_size": 384, "patch_size": patch,
+        },
+        text_config={
+            "vocab_size": len(vocab), "hidden_size": text_width, "intermediate_size": text_width * 4,
+            "num_hidden_layers": text_layers, "num_attention_heads": text_heads, "encoder_hidden_size": vision_width,
+            "max_position_embeddings": 512, "bos_token_id": vocab["[DEC]"], "pad_token_id": vocab["[PAD]"],
+            "sep_token_id": vocab["[SEP]"], "eos_token_id": vocab["[SEP]"],
+        },
+        projection_dim=min(vision_width, text_width),
+    )
+    BlipForConditionalGeneration(config).save_pretrained(out_dir)
+
+    tokenizer = BertTokenizerFast(os.path.join(out_dir, "vocab.txt"), bos_token="[DEC]")
+    BlipProcessor(BlipImageProcessor(size={"height": 384, "width": 384}), tokenizer).save_pretrained(out_dir)
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", default=None, help=f"default: {DEFAULT_DIR}[-vit][-bert]")
+    parser.add_argument("--full-vision", action="store_true", help="BLIP-large-sized ViT image encoder")
+    parser.add_argument("--full-text-decoder", action="store_true", help="BLIP-large-sized BERT text decoder")
+    args = parser.parse_args()
+    print(build(args.out, force=True, full_vision=args.full_vision, full_text_decoder=args.full_text_decoder))
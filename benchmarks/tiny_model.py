@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Build a tiny, randomly initialised Stable Diffusion pipeline on disk
+Run: python benchmarks/tiny_model.py [--out DIR] [--scale 1] [--full-text-encoder] [--full-vae]
+
+The diffusers benchmarks use it as a stand-in for a real checkpoint so
+they run offline on a CPU in seconds. It has the same components and
+code paths as SD 1.5 (CLIP text encoder, UNet with cross-attention, VAE
+with a factor-8 latent space), just far fewer channels; --scale widens it.
+--full-text-encoder gives it a text encoder the size of SD 1.5's CLIP
+ViT-L/14 (12 layers, 768 wide) and --full-vae an SD 1.5-sized VAE, for
+benchmarks that time text or image encoding.
+Images it produces are noise: only timings and memory are meaningful.
+"""
+import argparse
+import json
+import os
+import tempfile
+
+DEFAULT_DIR = os.path.join(tempfile.gettempdir(), "tiny-sd")
+
+
+def default_dir(full_text_encoder=False, full_vae=False):
+    return DEFAULT_DIR + ("-clip" if full_text_encoder else "") + ("-vae" if full_vae else "")
+
+
+def bytes_to_unicode():
+    """The byte -> printable character table CLIP's BPE tokenizer uses"""
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, [chr(c) for c in cs]))
+
+
+def write_tokenizer(path):
+    """A character-level CLIP tokenizer (no merges) small enough to write by hand"""
+    os.makedirs(path, exist_ok=True)
+    chars = list(bytes_to_unicode().values())
+    vocab = {}
+    for token in chars + [c + "</w>" for c in chars] + ["<|startoftext|>", "<|endoftext|>"]:
+        vocab[token] = len(vocab)
+    with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(path, "merges.txt"), "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+    return len(vocab)
+
+
+def build(out_dir=None, scale=1, force=False, full_text_encoder=False, full_vae=False):
+    """Create the pipeline under out_dir (once) and return the directory"""
+    out_dir = out_dir or default_dir(full_text_encoder, full_vae)
+    if not force and os.path.exists(os.path.join(out_dir, "model_index.json")):
+        return out_dir
+
+    import torch
+    from diffusers import AutoencoderKL, PNDMScheduler, StableDiffusionPipeline, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+
+    torch.manual_seed(0)
+    width = 32 * scale
+    tokenizer_dir = os.path.join(out_dir, "tokenizer")
+    vocab_size = write_tokenizer(tokenizer_dir)
+    tokenizer = CLIPTokenizer(os.path.join(tokenizer_dir, "vocab.json"), os.path.join(tokenizer_dir, "merges.txt"),
+                              model_max_length=77)
+
+    text_width, text_layers, text_heads = (768, 12, 12) if full_text_encoder else (width, 4, 4)
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        vocab_size=vocab_size, hidden_size=text_width, intermediate_size=text_width * 4,
+        num_hidden_layers=text_layers, num_attention_heads=text_heads, max_position_embeddings=77,
+        bos_token_id=vocab_size - 2, eos_token_id=vocab_size - 1, pad_token_id=vocab_size - 1,
+    ))
+    unet = UNet2DConditionModel(
+        sample_size=8,
+        in_channels=4,
+        out_channels=4,
+        block_out_channels=(width, width * 2),
+        layers_per_block=1,
+        down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"),
+        cross_attention_dim=text_width,
+        attention_head_dim=4,
+        norm_num_groups=8,
+    )
+    # Four blocks: the same factor-8 latent downsampling as SD 1.5
+    vae = AutoencoderKL(
+        in_channels=3,
+        out_channels=3,
+        latent_channels=4,
+        block_out_channels=(128, 256, 512, 512) if full_vae else (8, 8, 16, 16),
+        down_block_types=("DownEncoderBlock2D",) * 4,
+        up_block_types=("UpDecoderBlock2D",) * 4,
+        layers_per_block=2 if full_vae else 1,
+        norm_num_groups=32 if full_vae else 8,
+        sample_size=512 if full_vae else 64,
+    )
+    scheduler = PNDMScheduler(beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear",
+                              skip_prk_steps=True, steps_offset=1)
+
+    pipe = StableDiffusionPipeline(
+        vae=vae, text_encoder=text_encoder, tokenizer=tokenizer, unet=unet, scheduler=scheduler,
+        safety_checker=None, feature_extractor=None, requires_safety_checker=False,
+    )
+    pipe.save_pretrained(out_dir)
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", default=None, help=f"default: {DEFAULT_DIR}[-clip][-vae]")
+    parser.add_argument("--scale", type=int, default=1, help="channel width multiplier")
+    parser.add_argument("--full-text-encoder", action="store_true", help="SD 1.5-sized CLIP text encoder")
+    parser.add_argument("--full-vae", action="store_true", help="SD 1.5-sized VAE")
+    args = parser.parse_args()
+    print(build(args.out, args.scale, force=True, full_text_encoder=args.full_text_encoder, full_vae=args.full_vae))
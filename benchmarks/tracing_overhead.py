@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cost of request tracing (AI-Image-Web/tracing.py) on api.py's hot path
+Run: python benchmarks/tracing_overhead.py [--batches 40] [--batch-size 50] [--image-side 64]
+
+api.py (uvicorn, in this process, TRACE_SAMPLE_RATIO=1) proxies /generate
+to the stub WebUI from flask_concurrency.py with no delay, exporting spans
+to a JSON lines file. The sampler is switched between "every trace" and
+"no trace" for interleaved batches, which is what TRACE_SAMPLE_RATIO trades
+between. Also times the span work of one /generate on its own: tracing off
+(the default), an unsampled request and a sampled one, including export.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "AI-Image-Web")
+sys.path.insert(0, HERE)
+sys.path.insert(0, APP_DIR)
+
+from flask_concurrency import StubWebUI, free_port, percentile  # noqa: E402
+
+# Span names of one proxied /generate, with their depth
+SPANS = ("upload_read", "admit", "backend", "webui_request", "POST /sdapi/v1/txt2img",
+         "response_decode", "base64_decode", "file_write")
+
+
+def run(port, count):
+    session = requests.Session()
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        session.post(f"http://127.0.0.1:{port}/generate", data={"prompt": "benchmark"}).raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def span_work_us(tracing, enabled, sample):
+    """One request's spans (server span + SPANS), timed in isolation"""
+    tracing.TRACING_ENABLED = enabled
+    tracing._SAMPLE_BOUND = (1 << 64) if sample else 0
+    headers = {}
+
+    def one_request():
+        with tracing.start_span("POST", tracing.SERVER, {"http.request.method": "POST", "url.path": "/generate"}) as span:
+            for name in SPANS:
+                with tracing.start_span(name):
+                    tracing.inject(headers)
+            span.update_name("POST /generate")
+        tracing._exporter.flush()
+
+    return min(timeit.repeat(one_request, number=2000, repeat=3)) / 2000 * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batches", type=int, default=40, help="per mode, interleaved")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--image-side", type=int, default=64)
+    args = parser.parse_args()
+
+    stub = StubWebUI(0, args.image_side)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    workdir = tempfile.mkdtemp()
+    os.environ.update(
+        STABLE_URL=f"http://127.0.0.1:{stub.server_address[1]}",
+        TRACE_SAMPLE_RATIO="1", TRACE_EXPORTER="file", TRACE_FILE=os.path.join(workdir, "traces.jsonl"),
+        # One client; keep the per-user quota out of the measurement
+        RATE_LIMIT_BURST="1e9", RATE_LIMIT_PER_MINUTE="1e9", GPU_QUOTA_BURST="1e12", GPU_QUOTA_PER_HOUR="1e12",
+    )
+    os.chdir(workdir)  # api.py writes output/ here
+    import uvicorn
+
+    import api
+    import tracing
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    run(port, 100)  # warm-up
+
+    latencies = {True: [], False: []}
+    for i in range(args.batches * 2):
+        sampled = i % 2 == 0
+        tracing._SAMPLE_BOUND = (1 << 64) if sampled else 0
+        latencies[sampled].extend(run(port, args.batch_size))
+    server.should_exit = True
+    stub.shutdown()
+    tracing._exporter.flush()
+    with open(tracing.TRACE_FILE) as f:
+        exported = sum(len(s["spans"]) for line in f for r in json.loads(line)["resourceSpans"] for s in r["scopeSpans"])
+
+    off, on = statistics.mean(latencies[False]), statistics.mean(latencies[True])
+    tracing._exporter.path = os.devnull
+    print(json.dumps({
+        "requests_per_mode": len(latencies[True]),
+        "spans_exported": exported,
+        "unsampled_mean_ms": round(off * 1000, 3),
+        "sampled_mean_ms": round(on * 1000, 3),
+        "unsampled_p50_ms": round(percentile(latencies[False], 50) * 1000, 3),
+        "sampled_p50_ms": round(percentile(latencies[True], 50) * 1000, 3),
+        "end_to_end_difference_pct": round((on - off) / off * 100, 2),
+        "span_work_us_tracing_off": round(span_work_us(tracing, False, False), 2),
+        "span_work_us_unsampled": round(span_work_us(tracing, True, False), 2),
+        "span_work_us_sampled": round(span_work_us(tracing, True, True), 2),
+    }, indent=2))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark: split frontend/API origins vs one unified ASGI app
+Run: python benchmarks/unified_origin.py [--iterations 200] [--rtt-ms 40]
+
+Split mode loads the page from serve.py and calls the API on another port,
+so every authenticated call is preceded by a CORS preflight (OPTIONS).
+Unified mode (SERVE_FRONTEND=source) loads the page and calls the API on
+one origin. Measured localhost latencies are printed as JSON together with
+the round trips saved and what they cost at --rtt-ms of network latency.
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+os.environ.setdefault("SERVE_FRONTEND", "source")
+API_PORT, STATIC_PORT = 18400, 18401
+# Split mode's pages come from the static server: the API must allow its origin
+os.environ.setdefault("CORS_ORIGINS", f"http://127.0.0.1:{STATIC_PORT}")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AI-Image-Web"))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AI-Image-Web"))
+
+import uvicorn
+
+import api
+import serve
+
+# Keep per-request access logs out of the report
+serve.StaticHandler.log_message = lambda self, *args: None
+
+PAGE = ["/index.html", "/index-styles.css", "/config.js", "/control.js"]
+API_CALL = ("GET", "/verify", {"Authorization": "Bearer benchmark-token"})
+
+
+def start_api(port):
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def start_static(port):
+    httpd = serve.make_server(port, host="127.0.0.1")
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def timed(conn, method, path, headers):
+    start = time.perf_counter()
+    conn.request(method, path, headers=headers)
+    conn.getresponse().read()
+    return time.perf_counter() - start
+
+
+def page_load(static_port, api_port, split):
+    """One cold page load plus one authenticated API call; returns (seconds, round trips)"""
+    start = time.perf_counter()
+    page_conn = http.client.HTTPConnection("127.0.0.1", static_port if split else api_port)
+    round_trips = 1  # connection setup
+    for path in PAGE:
+        timed(page_conn, "GET", path, {"Accept-Encoding": "gzip"})
+        round_trips += 1
+
+    method, path, headers = API_CALL
+    if split:
+        # Cross-origin: a new connection to the API host, then preflight + request
+        api_conn = http.client.HTTPConnection("127.0.0.1", api_port)
+        origin = {"Origin": f"http://127.0.0.1:{static_port}"}
+        timed(api_conn, "OPTIONS", path, {
+            **origin,
+            "Access-Control-Request-Method": method,
+            "Access-Control-Request-Headers": "authorization",
+        })
+        timed(api_conn, method, path, {**headers, **origin})
+        api_conn.close()
+        round_trips += 3
+    else:
+        timed(page_conn, method, path, headers)
+        round_trips += 1
+    page_conn.close()
+    return time.perf_counter() - start, round_trips
+
+
+def api_call(static_port, api_port, split, conn):
+    """One authenticated API call on a warm connection (preflight not cached)"""
+    method, path, headers = API_CALL
+    start = time.perf_counter()
+    if split:
+        origin = {"Origin": f"http://127.0.0.1:{static_port}"}
+        timed(conn, "OPTIONS", path, {
+            **origin,
+            "Access-Control-Request-Method": method,
+            "Access-Control-Request-Headers": "authorization",
+        })
+        timed(conn, method, path, {**headers, **origin})
+    else:
+        timed(conn, method, path, headers)
+    return time.perf_counter() - start
+
+
+def summarize(samples):
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=40.0, help="network round trip used for the projection")
+    args = parser.parse_args()
+
+    api_port, static_port = API_PORT, STATIC_PORT
+    server = start_api(api_port)
+    httpd = start_static(static_port)
+
+    report = {}
+    for mode, split in (("split", True), ("unified", False)):
+        loads, trips = [], 0
+        for _ in range(args.iterations):
+            seconds, trips = page_load(static_port, api_port, split)
+            loads.append(seconds)
+        conn = http.client.HTTPConnection("127.0.0.1", api_port)
+        calls = [api_call(static_port, api_port, split, conn) for _ in range(args.iterations)]
+        conn.close()
+        report[mode] = {
+            "page_load": {**summarize(loads), "round_trips": trips},
+            "api_call": {**summarize(calls), "round_trips": 2 if split else 1},
+        }
+
+    saved_load = report["split"]["page_load"]["round_trips"] - report["unified"]["page_load"]["round_trips"]
+    saved_call = report["split"]["api_call"]["round_trips"] - report["unified"]["api_call"]["round_trips"]
+    report["projected_savings"] = {
+        "rtt_ms": args.rtt_ms,
+        "page_load_ms": saved_load * args.rtt_ms,
+        "per_api_call_ms": saved_call * args.rtt_ms,
+    }
+    print(json.dumps(report, indent=2))
+
+    server.should_exit = True
+    httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,63 +3,85 @@ AI Image Generator - Hugging Face Spaces Version
 Uses Gradio interface for easy deployment
 """
 import gradio as gr
-import torch
-from diffusers import StableDiffusionPipeline, StableDiffusionImg2ImgPipeline
-from PIL import Image
 import os
 
+from latent_cache import file_key, image_key, latent_cache
+from preprocess import init_size, load_init_image
+from prompt_cache import prompt_cache
+from schedulers import DEFAULT_SAMPLER, available_samplers, configure, prepare
+
 # Model configuration
 MODEL_ID = "runwayml/stable-diffusion-v1-5"  # Free model, no license needed
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-# Load models (lazy loading)
+# Load models (lazy loading). torch and diffusers too: importing them takes
+# seconds, and the UI can be up before the first generation needs them.
 txt2img_pipe = None
 img2img_pipe = None
 
+def get_device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
 def load_txt2img():
     global txt2img_pipe
     if txt2img_pipe is None:
+        import torch
+        from diffusers import StableDiffusionPipeline
+
         print("Loading text-to-image model...")
+        device = get_device()
         txt2img_pipe = StableDiffusionPipeline.from_pretrained(
             MODEL_ID,
-            torch_dtype=torch.float16 if DEVICE == "cuda" else torch.float32,
+            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
             safety_checker=None
         )
-        txt2img_pipe = txt2img_pipe.to(DEVICE)
-        if DEVICE == "cuda":
+        txt2img_pipe = txt2img_pipe.to(device)
+        if device == "cuda":
             txt2img_pipe.enable_attention_slicing()
+        prepare(txt2img_pipe)
     return txt2img_pipe
 
 def load_img2img():
     global img2img_pipe
     if img2img_pipe is None:
+        import torch
+        from diffusers import StableDiffusionImg2ImgPipeline
+
         print("Loading image-to-image model...")
+        device = get_device()
         img2img_pipe = StableDiffusionImg2ImgPipeline.from_pretrained(
             MODEL_ID,
-            torch_dtype=torch.float16 if DEVICE == "cuda" else torch.float32,
+            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
             safety_checker=None
         )
-        img2img_pipe = img2img_pipe.to(DEVICE)
-        if DEVICE == "cuda":
+        img2img_pipe = img2img_pipe.to(device)
+        if device == "cuda":
             img2img_pipe.enable_attention_slicing()
+        prepare(img2img_pipe)
     return img2img_pipe
 
+def seeded_generator(pipe, seed):
+    """A generator on the pipeline's device seeded with seed (None for -1, a random seed)"""
+    if seed == -1:
+        return None
+    import torch
+    return torch.Generator(pipe.device).manual_seed(seed)
+
 
-def generate_txt2img(prompt, negative_prompt, steps, guidance_scale, width, height, seed):
+def generate_txt2img(prompt, negative_prompt, steps, guidance_scale, width, height, seed,
+                     sampler=DEFAULT_SAMPLER, fast=False):
     """Generate image from text prompt"""
     if not prompt:
         return None, "Please enter a prompt"
     
     try:
         pipe = load_txt2img()
+        steps, guidance_scale = configure(pipe, sampler, steps, guidance_scale, fast)
         
-        generator = None
-        if seed != -1:
-            generator = torch.Generator(DEVICE).manual_seed(seed)
+        generator = seeded_generator(pipe, seed)
         
         result = pipe(
-            prompt=prompt,
-            negative_prompt=negative_prompt,
+            **prompt_cache.encode(pipe, prompt, negative_prompt),
             num_inference_steps=int(steps),
             guidance_scale=guidance_scale,
             width=int(width),
@@ -74,7 +96,8 @@ def generate_txt2img(prompt, negative_prompt, steps, guidance_scale, width, heig
         return None, f"❌ Error: {str(e)}"
 
 
-def generate_img2img(init_image, prompt, negative_prompt, steps, guidance_scale, strength, seed):
+def generate_img2img(init_image, prompt, negative_prompt, steps, guidance_scale, strength, seed,
+                     sampler=DEFAULT_SAMPLER, fast=False, width=512, height=512):
     """Transform image with text prompt"""
     if init_image is None:
         return None, "Please upload an image"
@@ -83,19 +106,19 @@ def generate_img2img(init_image, prompt, negative_prompt, steps, guidance_scale,
     
     try:
         pipe = load_img2img()
+        steps, guidance_scale = configure(pipe, sampler, steps, guidance_scale, fast)
         
-        # Resize image
-        init_image = init_image.convert("RGB")
-        init_image = init_image.resize((512, 512))
+        generator = seeded_generator(pipe, seed)
         
-        generator = None
-        if seed != -1:
-            generator = torch.Generator(DEVICE).manual_seed(seed)
+        # The upload keeps its aspect ratio inside the Max Width x Max Height box and is
+        # decoded, resized and VAE-encoded once, then reused while iterating on it
+        size = init_size(init_image, int(width), int(height))
+        key = file_key(init_image) if isinstance(init_image, str) else image_key(init_image)
+        init_latents = latent_cache.encode(pipe, lambda: load_init_image(init_image, size), size, generator, key)
         
         result = pipe(
-            prompt=prompt,
-            negative_prompt=negative_prompt,
-            image=init_image,
+            **prompt_cache.encode(pipe, prompt, negative_prompt),
+            image=init_latents,
             num_inference_steps=int(steps),
             guidance_scale=guidance_scale,
             strength=strength,
@@ -137,6 +160,10 @@ with gr.Blocks(title="AI Image Generator", theme=gr.themes.Soft()) as demo:
                         txt2img_steps = gr.Slider(10, 50, value=25, step=1, label="Steps")
                         txt2img_cfg = gr.Slider(1, 20, value=7.5, step=0.5, label="CFG Scale")
                     
+                    with gr.Row():
+                        txt2img_sampler = gr.Dropdown(available_samplers(), value=DEFAULT_SAMPLER, label="Sampler")
+                        txt2img_fast = gr.Checkbox(value=False, label="⚡ Fast (few-step preset)")
+                    
                     with gr.Row():
                         txt2img_width = gr.Dropdown([256, 512, 768], value=512, label="Width")
                         txt2img_height = gr.Dropdown([256, 512, 768], value=512, label="Height")
@@ -150,7 +177,8 @@ with gr.Blocks(title="AI Image Generator", theme=gr.themes.Soft()) as demo:
             
             txt2img_btn.click(
                 generate_txt2img,
-                inputs=[txt2img_prompt, txt2img_negative, txt2img_steps, txt2img_cfg, txt2img_width, txt2img_height, txt2img_seed],
+                inputs=[txt2img_prompt, txt2img_negative, txt2img_steps, txt2img_cfg, txt2img_width, txt2img_height, txt2img_seed,
+                        txt2img_sampler, txt2img_fast],
                 outputs=[txt2img_output, txt2img_status]
             )
         
@@ -158,7 +186,7 @@ with gr.Blocks(title="AI Image Generator", theme=gr.themes.Soft()) as demo:
         with gr.TabItem("🔄 Image to Image"):
             with gr.Row():
                 with gr.Column(scale=1):
-                    img2img_input = gr.Image(label="Upload Image", type="pil")
+                    img2img_input = gr.Image(label="Upload Image", type="filepath")
                     img2img_prompt = gr.Textbox(
                         label="Prompt",
                         placeholder="Transform into a watercolor painting",
@@ -174,6 +202,14 @@ with gr.Blocks(title="AI Image Generator", theme=gr.themes.Soft()) as demo:
                         img2img_steps = gr.Slider(10, 50, value=25, step=1, label="Steps")
                         img2img_cfg = gr.Slider(1, 20, value=7.5, step=0.5, label="CFG Scale")
                     
+                    with gr.Row():
+                        img2img_sampler = gr.Dropdown(available_samplers(), value=DEFAULT_SAMPLER, label="Sampler")
+                        img2img_fast = gr.Checkbox(value=False, label="⚡ Fast (few-step preset)")
+                    
+                    with gr.Row():
+                        img2img_width = gr.Dropdown([256, 512, 768], value=512, label="Max Width")
+                        img2img_height = gr.Dropdown([256, 512, 768], value=512, label="Max Height")
+                    
                     img2img_strength = gr.Slider(0.1, 1.0, value=0.75, step=0.05, label="Strength")
                     img2img_seed = gr.Number(value=-1, label="Seed (-1 for random)")
                     img2img_btn = gr.Button("🔄 Transform", variant="primary", size="lg")
@@ -184,7 +220,8 @@ with gr.Blocks(title="AI Image Generator", theme=gr.themes.Soft()) as demo:
             
             img2img_btn.click(
                 generate_img2img,
-                inputs=[img2img_input, img2img_prompt, img2img_negative, img2img_steps, img2img_cfg, img2img_strength, img2img_seed],
+                inputs=[img2img_input, img2img_prompt, img2img_negative, img2img_steps, img2img_cfg, img2img_strength, img2img_seed,
+                        img2img_sampler, img2img_fast, img2img_width, img2img_height],
                 outputs=[img2img_output, img2img_status]
             )
     
@@ -195,6 +232,8 @@ with gr.Blocks(title="AI Image Generator", theme=gr.themes.Soft()) as demo:
     - Add style keywords like "digital art", "oil painting", "photorealistic"
     - Use negative prompts to avoid unwanted features
     - Lower steps = faster but lower quality | Higher steps = slower but better quality
+    - Image to Image fits your photo inside Max Width x Max Height, keeping its aspect ratio, and never upscales it
+    - ⚡ Fast runs a few-step sampler (UniPC, or LCM with an LCM-LoRA) and ignores the Steps slider
     
     ### ⚠️ Note
     Running on CPU may be slow. For faster generation, duplicate this space with GPU!
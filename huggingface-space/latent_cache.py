@@ -0,0 +1,91 @@
+"""
+LRU cache of VAE-encoded init images for img2img
+Iterating on one upload (new prompt, strength or seed) used to resize and
+run the VAE encoder on the same image every time. The encoder's latent
+distribution is cached per image and output size instead; every request
+still draws its own sample from it with its own generator, exactly as the
+pipeline would, so results match an uncached run.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+INIT_LATENT_CACHE_SIZE = int(os.environ.get("INIT_LATENT_CACHE_SIZE", 16))
+
+
+def file_key(path):
+    """Content hash of an uploaded file (no decoding needed)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_key(image):
+    """Content hash of a PIL image"""
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(f"{image.mode}{image.size}".encode())
+    return digest.hexdigest()
+
+
+class InitLatentCache:
+    def __init__(self, max_entries=INIT_LATENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def latent_dist(self, pipe, image, size, key=None):
+        """The VAE's latent distribution for image resized to size (width, height)
+
+        image may be a function returning the image, called only on a miss
+        (key is required then).
+        """
+        # Pipelines loaded separately have separate VAEs
+        key = (id(pipe.vae), key or image_key(image), tuple(size))
+        with self.lock:
+            dist = self.entries.get(key)
+            if dist is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return dist
+            self.misses += 1
+
+        if callable(image):
+            image = image()
+        image = image.convert("RGB")
+        if image.size != tuple(size):
+            image = image.resize(size)
+        import torch
+
+        pixels = pipe.image_processor.preprocess(image)
+        with torch.inference_mode():
+            dist = pipe.vae.encode(pixels.to(pipe.device, pipe.vae.dtype)).latent_dist
+        if self.max_entries > 0:
+            with self.lock:
+                self.entries[key] = dist
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return dist
+
+    def encode(self, pipe, image, size, generator=None, key=None):
+        """Init latents to pass as the img2img pipeline's image argument"""
+        dist = self.latent_dist(pipe, image, size, key)
+        # Same draw (and generator use) as the pipeline's own encode step
+        return dist.sample(generator) * pipe.vae.config.scaling_factor
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+latent_cache = InitLatentCache()
@@ -0,0 +1,64 @@
+"""
+Init image preprocessing for img2img
+The output size fits a max width x max height box: aspect ratio kept, sides
+rounded down to multiples of 8, never upscaled (small uploads stay small and
+cheap). An upload that would end up with a side under 64 px, because it is
+that small or too long and thin for the box, is rejected, not stretched.
+Getting there is cheap too: JPEGs are decoded at reduced scale with
+draft(), big integer shrinks use reduce(), and a LANCZOS resize only covers
+what is left. An upload that already has the right size is used as is.
+"""
+import math
+
+from PIL import Image, ImageOps
+
+MIN_SIDE = 64
+# EXIF orientations that swap width and height
+_TRANSPOSED = (5, 6, 7, 8)
+_ORIENTATION = 0x0112
+
+
+def fit_size(width, height, max_width, max_height, multiple=8):
+    """
+    Largest (width, height) inside max_width x max_height with the same aspect ratio, in multiples of 8
+    Raises ValueError when a side would be under MIN_SIDE.
+    """
+    scale = min(1.0, max_width / width, max_height / height)
+    size = tuple(int(side * scale) // multiple * multiple for side in (width, height))
+    if min(size) < MIN_SIDE:
+        raise ValueError(f"A {width}x{height} image can't fit {max_width}x{max_height} with both sides "
+                         f"at least {MIN_SIDE} px; crop it closer to square or upload a larger one")
+    return size
+
+
+def open_image(source):
+    """A path (lazily opened: only the header is read) or an already opened PIL image"""
+    return source if isinstance(source, Image.Image) else Image.open(source)
+
+
+def init_size(source, max_width, max_height):
+    """Output size for an upload, read from its header without decoding it; raises ValueError"""
+    image = open_image(source)
+    width, height = image.size
+    if image.getexif().get(_ORIENTATION, 1) in _TRANSPOSED:
+        width, height = height, width
+    return fit_size(width, height, max_width, max_height)
+
+
+def load_init_image(source, size):
+    """Decode source as an RGB image of exactly size (from init_size)"""
+    image = open_image(source)
+    orientation = image.getexif().get(_ORIENTATION, 1)
+    if image.format == "JPEG":
+        # Decode at 1/2, 1/4 or 1/8 scale, staying at least as big as needed
+        image.draft("RGB", size[::-1] if orientation in _TRANSPOSED else size)
+    if orientation != 1:
+        image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if image.size == size:
+        return image
+    factor = min(image.width // size[0], image.height // size[1])
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image.resize(size, Image.LANCZOS) if image.size != size else image
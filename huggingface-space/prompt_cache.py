@@ -0,0 +1,77 @@
+"""
+LRU cache of CLIP text embeddings
+Most requests reuse a handful of negative prompts and repeat positive
+prompts with new seeds; caching the text encoder output skips it for those.
+Entries are keyed by token ids (so prompts that tokenize the same share
+one), bounded by memory, and handed to the pipeline as prompt_embeds /
+negative_prompt_embeds.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+PROMPT_CACHE_MB = float(os.environ.get("PROMPT_CACHE_MB", 64))
+
+
+class PromptEmbeddingCache:
+    def __init__(self, max_bytes=PROMPT_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def embed(self, pipe, text):
+        """Text embeddings for one prompt, from the cache when possible"""
+        ids = pipe.tokenizer(text, padding="max_length", max_length=pipe.tokenizer.model_max_length,
+                             truncation=True).input_ids
+        # Pipelines loaded separately have separate text encoders
+        key = (id(pipe.text_encoder), tuple(ids))
+        with self.lock:
+            embeds = self.entries.get(key)
+            if embeds is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return embeds
+            self.misses += 1
+
+        import torch
+
+        with torch.inference_mode():
+            embeds, _ = pipe.encode_prompt(text, pipe.device, 1, False)
+        size = embeds.element_size() * embeds.nelement()
+        with self.lock:
+            if key not in self.entries and size <= self.max_bytes:
+                self.entries[key] = embeds
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.bytes -= evicted.element_size() * evicted.nelement()
+        return embeds
+
+    def encode(self, pipe, prompt, negative_prompt=""):
+        """Keyword arguments replacing prompt/negative_prompt in a pipeline call"""
+        return {
+            "prompt_embeds": self.embed(pipe, prompt),
+            "negative_prompt_embeds": self.embed(pipe, negative_prompt or ""),
+        }
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "mb": round(self.bytes / 1024 / 1024, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+prompt_cache = PromptEmbeddingCache()
@@ -0,0 +1,80 @@
+"""
+Sampler registry for the diffusers pipelines
+Maps the WebUI sampler names the web frontend sends (sampler_name) to
+diffusers schedulers. Schedulers are built once per pipeline from its own
+scheduler config and swapped per request; no weights are reloaded.
+"""
+import os
+
+# sampler name -> (scheduler class, config overrides)
+SAMPLERS = {
+    "Euler a": ("EulerAncestralDiscreteScheduler", {}),
+    "Euler": ("EulerDiscreteScheduler", {}),
+    "DDIM": ("DDIMScheduler", {}),
+    "PLMS": ("PNDMScheduler", {"skip_prk_steps": True}),
+    "DPM++ 2M": ("DPMSolverMultistepScheduler", {"algorithm_type": "dpmsolver++"}),
+    "DPM++ 2M Karras": ("DPMSolverMultistepScheduler", {"algorithm_type": "dpmsolver++", "use_karras_sigmas": True}),
+    # The multistep SDE variant needs no torchsde, unlike DPMSolverSDEScheduler
+    "DPM++ SDE": ("DPMSolverMultistepScheduler", {"algorithm_type": "sde-dpmsolver++"}),
+    "UniPC": ("UniPCMultistepScheduler", {}),
+    "LCM": ("LCMScheduler", {}),
+}
+DEFAULT_SAMPLER = "DPM++ 2M Karras"
+
+# Optional LCM-LoRA (e.g. latent-consistency/lcm-lora-sdv1-5, needs peft):
+# makes the "LCM" sampler and a 4-step fast preset available
+LCM_LORA = os.environ.get("LCM_LORA", "")
+
+# Fast preset: a sampler that converges in few steps, and the steps to run it with.
+# UniPC is close to DPM++ 2M Karras at 25 steps by ~10; LCM needs an LCM-trained
+# UNet (the LoRA) and low guidance, but gets there in 4.
+FAST_PRESET = {"sampler": "UniPC", "steps": 10}
+FAST_PRESET_LCM = {"sampler": "LCM", "steps": 4, "guidance_scale": 1.5}
+
+_schedulers = {}
+
+
+def prepare(pipe):
+    """Load the LCM-LoRA into a freshly loaded pipeline (disabled until LCM is picked)"""
+    if LCM_LORA:
+        pipe.load_lora_weights(LCM_LORA, adapter_name="lcm")
+        pipe.disable_lora()
+        pipe.has_lcm_lora = True
+    return pipe
+
+
+def available_samplers(pipe=None):
+    """Sampler names the UI can offer (LCM only with the LoRA loaded)"""
+    lcm = getattr(pipe, "has_lcm_lora", False) if pipe is not None else bool(LCM_LORA)
+    return [name for name in SAMPLERS if name != "LCM" or lcm]
+
+
+def use_sampler(pipe, name):
+    """Swap pipe.scheduler for the named sampler; instances are cached per pipeline"""
+    if name not in SAMPLERS:
+        raise ValueError(f"Unknown sampler {name!r}; choose from {', '.join(SAMPLERS)}")
+    if name == "LCM" and not getattr(pipe, "has_lcm_lora", False):
+        raise ValueError("The LCM sampler needs LCM_LORA")
+    cache = _schedulers.setdefault(id(pipe), {None: pipe.scheduler})
+    if name not in cache:
+        import diffusers
+
+        cls_name, overrides = SAMPLERS[name]
+        cache[name] = getattr(diffusers, cls_name).from_config(cache[None].config, **overrides)
+    pipe.scheduler = cache[name]
+    if getattr(pipe, "has_lcm_lora", False):
+        if name == "LCM":
+            pipe.enable_lora()
+        else:
+            pipe.disable_lora()
+
+
+def configure(pipe, sampler, steps, guidance_scale, fast=False):
+    """Apply the sampler (or the fast preset) to pipe; returns the (steps, guidance_scale) to run"""
+    if fast:
+        preset = FAST_PRESET_LCM if getattr(pipe, "has_lcm_lora", False) else FAST_PRESET
+        sampler = preset["sampler"]
+        steps = preset["steps"]
+        guidance_scale = preset.get("guidance_scale", guidance_scale)
+    use_sampler(pipe, sampler or DEFAULT_SAMPLER)
+    return int(steps), guidance_scale